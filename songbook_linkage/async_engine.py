@@ -0,0 +1,266 @@
+"""
+Songbook Linkage System - Asyncio Matching Pipeline
+Overlaps database round trips with scoring: while one song is scored in an executor,
+the next song is already being fetched and earlier results are still being written
+(with a bound on how many writes are in flight). Uses asyncpg and the same scoring
+as MatchingEngine, so results equal MatchingEngine.match_many.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import List, Dict, Optional, Tuple
+
+try:
+    import asyncpg
+except ImportError:  # optional dependency, only needed for the asyncio pipeline
+    asyncpg = None
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import DEFAULT_CONNECTION
+from matching_engine import MatchingEngine
+
+
+UPSERT_MATCH_SQL = """
+    INSERT INTO matching_status (
+        canonical_mele_id, songbook_entry_id, match_confidence,
+        match_method, match_status, algorithm_version, scoring_details
+    ) VALUES ($1, $2, $3, $4, $5, $6, $7)
+    ON CONFLICT (canonical_mele_id, songbook_entry_id)
+    DO UPDATE SET
+        match_confidence = EXCLUDED.match_confidence,
+        match_method = EXCLUDED.match_method,
+        match_status = EXCLUDED.match_status,
+        algorithm_version = EXCLUDED.algorithm_version,
+        scoring_details = EXCLUDED.scoring_details,
+        matched_at = NOW()
+"""
+
+AUTO_LINK_SQL = """
+    UPDATE songbook_entries
+    SET canonical_mele_id = $2
+    WHERE id = $1
+"""
+
+
+def require_asyncpg():
+    """Raise a helpful error when asyncpg is not installed"""
+    if asyncpg is None:
+        raise ImportError("The asyncio matching pipeline requires asyncpg: pip install asyncpg")
+
+
+def connect_options() -> Dict:
+    """
+    asyncpg connection arguments from the same environment as database.get_dsn():
+    HUAPALA_DATABASE_URL / DATABASE_URL, otherwise the PG* variables
+    """
+    dsn = os.getenv('HUAPALA_DATABASE_URL') or os.getenv('DATABASE_URL')
+    if dsn:
+        return {'dsn': dsn}
+    
+    return {
+        'host': os.getenv('PGHOST', DEFAULT_CONNECTION['host']),
+        'port': int(os.getenv('PGPORT', DEFAULT_CONNECTION['port'])),
+        'database': os.getenv('PGDATABASE', DEFAULT_CONNECTION['dbname']),
+        'user': os.getenv('PGUSER', DEFAULT_CONNECTION['user']),
+        'password': os.getenv('PGPASSWORD', '')
+    }
+
+
+class AsyncMatchingEngine:
+    """
+    Pipelined match_many: fetch song N+1, score song N in an executor, write songs < N.
+    Scoring runs in the loop's default thread pool unless an executor is given; it is
+    CPU-bound, so the gain comes from keeping the network busy while it runs.
+    """
+    
+    def __init__(self, engine: Optional[MatchingEngine] = None, max_pending_writes: int = 4,
+                 pool_size: int = 6, executor=None, server_settings: Optional[Dict[str, str]] = None):
+        require_asyncpg()
+        self.engine = engine or MatchingEngine()
+        # Saves allowed in flight before scoring waits for one to finish
+        self.max_pending_writes = max(1, max_pending_writes)
+        self.pool_size = max(pool_size, 2)
+        self.executor = executor
+        # Session settings for every pooled connection (e.g. search_path)
+        self.server_settings = server_settings
+        self.pool = None
+    
+    async def connect(self):
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(min_size=1, max_size=self.pool_size,
+                                                  server_settings=self.server_settings, **connect_options())
+    
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+    
+    async def __aenter__(self):
+        await self.connect()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    async def fetch_canonical_song(self, canonical_mele_id: str) -> Optional[Dict]:
+        """One canonical song, shaped like MatchingEngine.fetch_canonical_songs rows"""
+        engine = self.engine
+        row = await self.pool.fetchrow(f"""
+            SELECT {', '.join(engine._canonical_columns())}
+            FROM canonical_mele
+            WHERE canonical_mele_id = $1
+        """, canonical_mele_id)
+        if row is None:
+            return None
+        engine.profiler.count('rows_fetched')
+        return engine._canonical_song_from_row(tuple(row))
+    
+    async def fetch_unlinked_entries(self) -> List[Dict]:
+        """All songbook entries without a canonical link, as in MatchingEngine.fetch_unlinked_entries"""
+        engine = self.engine
+        rows = await self.pool.fetch(f"""
+            SELECT {', '.join(engine._entry_columns())}
+            FROM songbook_entries
+            WHERE canonical_mele_id IS NULL
+            ORDER BY id
+        """)
+        engine.profiler.count('rows_fetched', len(rows))
+        return [engine._songbook_entry_from_row(tuple(row)) for row in rows]
+    
+    async def write_matches(self, status_rows: List[Tuple], auto_links: List[Tuple[int, str]]) -> bool:
+        """Upsert matching_status rows and apply auto-links in one transaction"""
+        try:
+            async with self.pool.acquire() as conn:
+                started = time.perf_counter()
+                async with conn.transaction():
+                    if status_rows:
+                        await conn.executemany(UPSERT_MATCH_SQL, status_rows)
+                    if auto_links:
+                        await conn.executemany(AUTO_LINK_SQL, auto_links)
+                self.engine.profiler.add_time('save', time.perf_counter() - started)
+                self.engine.profiler.count('commits')
+                self.engine.profiler.count('matches_saved', len(status_rows))
+            return True
+        except Exception as e:
+            print(f"Error saving matches: {e}")
+            return False
+    
+    async def _save_song(self, canonical_mele_id: str, matches: List[Dict],
+                         auto_link_high_confidence: bool) -> Dict:
+        engine = self.engine
+        all_results, status_rows, auto_links = engine.prepare_match_writes(
+            [(canonical_mele_id, matches)], auto_link_high_confidence
+        )
+        if status_rows and await self.write_matches(status_rows, auto_links):
+            engine.count_saved_matches(all_results, auto_link_high_confidence)
+        return all_results[0]
+    
+    async def match_many(self, canonical_ids: List[str], auto_link_high_confidence: bool = True) -> List[Dict]:
+        """
+        Match and save each song in order, returning one process_song_matches-style result per id.
+        As in MatchingEngine.match_many, entries auto-linked for an earlier song are not offered
+        to later ones, so results do not depend on when each write lands.
+        """
+        await self.connect()
+        if not canonical_ids:
+            return []
+        
+        loop = asyncio.get_running_loop()
+        engine = self.engine
+        write_slots = asyncio.Semaphore(self.max_pending_writes)
+        writes = []
+        linking_entry_ids = set()
+        
+        entries_task = asyncio.ensure_future(self.fetch_unlinked_entries())
+        next_song = asyncio.ensure_future(self.fetch_canonical_song(canonical_ids[0]))
+        
+        async def save(canonical_mele_id, matches):
+            try:
+                return await self._save_song(canonical_mele_id, matches, auto_link_high_confidence)
+            finally:
+                write_slots.release()
+        
+        try:
+            songbook_entries = await entries_task
+            
+            for position, canonical_mele_id in enumerate(canonical_ids):
+                canonical_song = await next_song
+                if position + 1 < len(canonical_ids):
+                    # Start the next song's fetch before scoring this one
+                    next_song = asyncio.ensure_future(self.fetch_canonical_song(canonical_ids[position + 1]))
+                
+                matches = []
+                if canonical_song is not None:
+                    if linking_entry_ids:
+                        songbook_entries = [entry for entry in songbook_entries
+                                            if entry['id'] not in linking_entry_ids]
+                    matches = await loop.run_in_executor(
+                        self.executor, engine.score_song_against_entries, canonical_song, songbook_entries
+                    )
+                    linking_entry_ids.update(
+                        match['songbook_entry_id'] for match in matches
+                        if engine._status_for_match(match, auto_link_high_confidence) == 'auto_linked'
+                    )
+                
+                await write_slots.acquire()
+                writes.append(asyncio.ensure_future(save(canonical_mele_id, matches)))
+            
+            results = await asyncio.gather(*writes)
+        finally:
+            pending = [task for task in writes + [entries_task, next_song] if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        engine.profiler.dump()
+        return list(results)
+    
+    async def match_all(self, auto_link_high_confidence: bool = True) -> List[Dict]:
+        """Pipelined matching over every canonical song, ordered by canonical_mele_id"""
+        await self.connect()
+        rows = await self.pool.fetch("SELECT canonical_mele_id FROM canonical_mele ORDER BY canonical_mele_id")
+        return await self.match_many([row['canonical_mele_id'] for row in rows], auto_link_high_confidence)
+
+
+async def run(args) -> List[Dict]:
+    engine = MatchingEngine(algorithm_version=args.algorithm_version)
+    async with AsyncMatchingEngine(engine, max_pending_writes=args.max_pending_writes) as matcher:
+        if args.ids:
+            return await matcher.match_many(args.ids, args.auto_link)
+        return await matcher.match_all(args.auto_link)
+
+
+def main():
+    """Run the asyncio matching pipeline over all (or the given) canonical songs"""
+    from database import require_credentials
+    
+    parser = argparse.ArgumentParser(description="Asyncio songbook matching pipeline")
+    parser.add_argument('ids', nargs='*', help="canonical_mele_ids to match (default: all)")
+    parser.add_argument('--algorithm-version', default="v1.0")
+    parser.add_argument('--max-pending-writes', type=int, default=4, help="saves allowed in flight")
+    parser.add_argument('--auto-link', action='store_true', help="auto-link high confidence matches")
+    args = parser.parse_args()
+    
+    print("🎵 Songbook Linkage System - Asyncio Matching Pipeline")
+    print("=" * 60)
+    
+    require_credentials()
+    
+    started = time.perf_counter()
+    results = asyncio.run(run(args))
+    
+    print(f"Matched {len(results)} songs in {time.perf_counter() - started:.2f}s")
+    print(f"   Potential matches: {sum(result['total_matches'] for result in results)}")
+    print(f"   Auto-linked: {sum(result['auto_linked'] for result in results)}")
+    print(f"   Queued for review: {sum(result['queued_for_review'] for result in results)}")
+    print("\n✅ Asyncio matching completed!")
+
+
+if __name__ == "__main__":
+    main()
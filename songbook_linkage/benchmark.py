@@ -0,0 +1,229 @@
+"""
+Songbook Linkage System - Benchmark Suite
+Times normalization, pair scoring and bulk matching on a seeded synthetic corpus
+(see synthetic_corpus.py) so results are reproducible without a database, and saves
+each run as JSON tagged with the git commit for comparison across commits
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import subprocess
+from datetime import datetime
+from typing import List, Dict, Optional, Callable, Tuple
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from text_normalization import normalizer, normalize_title, normalize_composer
+from matching_engine import MatchingEngine
+from synthetic_corpus import generate_linkage_data
+
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results")
+
+# Canonical songs matched in the bulk benchmark (the production catalogue size)
+DEFAULT_SONG_COUNT = 14
+
+
+def percentile(sorted_values: List[int], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return float(sorted_values[rank])
+
+
+def time_calls(function: Callable, arguments: List[Tuple]) -> List[int]:
+    """Call function once per argument tuple, returning each call's duration in nanoseconds"""
+    durations = []
+    clock = time.perf_counter_ns
+    for args in arguments:
+        started = clock()
+        function(*args)
+        durations.append(clock() - started)
+    return durations
+
+
+def peak_memory(function: Callable, arguments: List[Tuple]) -> int:
+    """Peak bytes allocated by Python while running the calls (separate pass: tracing is slow)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for args in arguments:
+            function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmark(name: str, function: Callable, arguments: List[Tuple], pairs_per_call: int = 1,
+                  setup: Optional[Callable] = None, measure_memory: bool = True,
+                  memory_calls: Optional[int] = None) -> Dict:
+    """
+    Time one benchmark and summarize throughput, latency percentiles and peak memory
+    memory_calls limits the traced pass to the first calls when each call is independent
+    """
+    if setup:
+        setup()
+    gc.collect()
+    durations = time_calls(function, arguments)
+    total_seconds = sum(durations) / 1e9
+    durations.sort()
+    
+    result = {
+        'name': name,
+        'calls': len(arguments),
+        'pairs': len(arguments) * pairs_per_call,
+        'total_seconds': round(total_seconds, 6),
+        'pairs_per_second': round(len(arguments) * pairs_per_call / total_seconds, 1) if total_seconds else None,
+        'p50_us': round(percentile(durations, 0.50) / 1000, 3),
+        'p99_us': round(percentile(durations, 0.99) / 1000, 3),
+        'peak_memory_bytes': None
+    }
+    
+    if measure_memory:
+        if setup:
+            setup()
+        result['peak_memory_bytes'] = peak_memory(function, arguments[:memory_calls])
+    
+    return result
+
+
+def clear_normalization_caches():
+    """Start from cold caches so each pass measures real normalization work"""
+    for cache in normalizer.caches.values():
+        cache.clear()
+
+
+def benchmark_size(entry_count: int, song_count: int, seed: int, algorithm_version: str,
+                   measure_memory: bool = True) -> List[Dict]:
+    """Run every benchmark against one generated corpus size"""
+    canonical_songs, songbook_entries = generate_linkage_data(entry_count, song_count, seed)
+    titles = [(entry['printed_song_title'],) for entry in songbook_entries]
+    composers = [(entry['composer'],) for entry in songbook_entries if entry['composer']]
+    
+    engine = MatchingEngine(algorithm_version=algorithm_version)
+    # One pair per entry, cycling through the canonical songs
+    pairs = [(canonical_songs[position % len(canonical_songs)], entry)
+             for position, entry in enumerate(songbook_entries)]
+    
+    results = [
+        run_benchmark('normalize_title', normalize_title, titles,
+                      setup=clear_normalization_caches, measure_memory=measure_memory),
+        run_benchmark('normalize_composer', normalize_composer, composers,
+                      setup=clear_normalization_caches, measure_memory=measure_memory),
+        run_benchmark('calculate_confidence_score', engine.calculate_confidence_score, pairs,
+                      setup=clear_normalization_caches, measure_memory=measure_memory),
+        # Bulk matching as match_many scores it: every canonical song against every entry
+        run_benchmark('bulk_matching', engine.score_song_against_entries,
+                      [(song, songbook_entries) for song in canonical_songs],
+                      pairs_per_call=len(songbook_entries), setup=clear_normalization_caches,
+                      measure_memory=measure_memory, memory_calls=1)
+    ]
+    
+    for result in results:
+        result['entries'] = entry_count
+        result['songs'] = len(canonical_songs)
+    return results
+
+
+def git_revision() -> Dict:
+    """Current commit and whether the working tree has uncommitted changes"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=directory,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=directory,
+                                capture_output=True, text=True, check=True).stdout
+        return {'commit': commit, 'dirty': bool(status.strip())}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def save_results(run: Dict, output_dir: str) -> str:
+    """Write a run to <output_dir>/<timestamp>_<commit>.json and return the path"""
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    commit = run['git']['commit'] or 'nogit'
+    path = os.path.join(output_dir, f"{stamp}_{commit}{'-dirty' if run['git']['dirty'] else ''}.json")
+    with open(path, 'w') as handle:
+        json.dump(run, handle, indent=2)
+    return path
+
+
+def compare_runs(baseline: Dict, current: Dict) -> List[Tuple]:
+    """(entries, benchmark, baseline pairs/sec, current pairs/sec, speedup) for benchmarks in both runs"""
+    baseline_results = {(result['entries'], result['name']): result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        previous = baseline_results.get((result['entries'], result['name']))
+        if previous and previous['pairs_per_second'] and result['pairs_per_second']:
+            rows.append((result['entries'], result['name'], previous['pairs_per_second'],
+                         result['pairs_per_second'], result['pairs_per_second'] / previous['pairs_per_second']))
+    return rows
+
+
+def format_bytes(count: Optional[int]) -> str:
+    if count is None:
+        return "-"
+    return f"{count / (1024 * 1024):.1f} MiB"
+
+
+def main():
+    """Run the benchmark suite and save the results"""
+    parser = argparse.ArgumentParser(description="Benchmark normalization and matching on synthetic data")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma-separated songbook entry counts")
+    parser.add_argument('--songs', type=int, default=DEFAULT_SONG_COUNT, help="Canonical songs per corpus")
+    parser.add_argument('--seed', type=int, default=1893)
+    parser.add_argument('--algorithm-version', default='v1.0')
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc peak-memory pass")
+    parser.add_argument('--output-dir', default=DEFAULT_RESULTS_DIR)
+    parser.add_argument('--compare', help="Earlier results file to compare throughput against")
+    args = parser.parse_args()
+    
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    
+    print("🎵 Songbook Linkage System - Benchmark Suite")
+    print("=" * 60)
+    
+    run = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'algorithm_version': args.algorithm_version,
+        'results': []
+    }
+    
+    for size in sizes:
+        print(f"\n📊 {size:,} entries x {args.songs} songs (seed {args.seed})")
+        for result in benchmark_size(size, args.songs, args.seed, args.algorithm_version, not args.no_memory):
+            run['results'].append(result)
+            print(f"   {result['name']:<28} {result['pairs_per_second']:>12,.0f} pairs/s   "
+                  f"p50 {result['p50_us']:>9.1f}µs   p99 {result['p99_us']:>9.1f}µs   "
+                  f"peak {format_bytes(result['peak_memory_bytes'])}")
+    
+    path = save_results(run, args.output_dir)
+    print(f"\n💾 Results saved to {path}")
+    
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        print(f"\n📈 Compared with {baseline['git']['commit']} ({baseline['created_at']}):")
+        for entries, name, before, after, speedup in compare_runs(baseline, run):
+            print(f"   {entries:>7,} {name:<28} {before:>12,.0f} → {after:>12,.0f} pairs/s  ({speedup:.2f}x)")
+    
+    print("\n✅ Benchmark completed!")
+
+
+if __name__ == "__main__":
+    main()
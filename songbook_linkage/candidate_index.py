@@ -0,0 +1,209 @@
+"""
+Songbook Linkage System - N-gram Candidate Index
+In-memory character n-gram inverted index used to shortlist songbook entries
+before full confidence scoring
+"""
+
+import os
+import sys
+import heapq
+from collections import defaultdict
+from typing import List, Dict, Optional, Iterable
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from text_normalization import normalize_title, normalize_composer, stored_or_normalized
+
+
+def character_ngrams(text: str, n: int = 3) -> set:
+    """Character n-grams of a normalized string, padded so short words still produce grams"""
+    if not text:
+        return set()
+    
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class NGramIndex:
+    """Inverted index from title/composer n-grams to songbook entries"""
+    
+    def __init__(self, songbook_entries: Iterable[Dict] = (), n: int = 3):
+        self.n = n
+        self.entries = []
+        self.positions_by_id = {}
+        self.title_postings = defaultdict(list)
+        self.composer_postings = defaultdict(list)
+        self.title_sizes = []
+        self.composer_sizes = []
+        
+        for songbook_entry in songbook_entries:
+            self.add(songbook_entry)
+    
+    def add(self, songbook_entry: Dict):
+        """Index one songbook entry by its normalized printed title and composer"""
+        position = len(self.entries)
+        self.entries.append(songbook_entry)
+        self.positions_by_id[songbook_entry['id']] = position
+        
+        title_grams = character_ngrams(
+            stored_or_normalized(songbook_entry, 'normalized_printed_title', 'printed_song_title', normalize_title),
+            self.n
+        )
+        composer_grams = character_ngrams(
+            stored_or_normalized(songbook_entry, 'normalized_composer', 'composer', normalize_composer),
+            self.n
+        )
+        
+        for gram in title_grams:
+            self.title_postings[gram].append(position)
+        for gram in composer_grams:
+            self.composer_postings[gram].append(position)
+        
+        self.title_sizes.append(len(title_grams))
+        self.composer_sizes.append(len(composer_grams))
+    
+    def _overlap_scores(self, query_grams: set, postings: Dict, sizes: List[int]) -> Dict[int, float]:
+        """Dice coefficient (0-100) between the query grams and every entry sharing at least one gram"""
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for position in postings.get(gram, ()):
+                shared[position] += 1
+        
+        query_size = len(query_grams)
+        return {
+            position: 200.0 * count / (query_size + sizes[position])
+            for position, count in shared.items()
+        }
+    
+    def estimate_scores(self, canonical_song: Dict) -> Dict[int, float]:
+        """
+        Cheap confidence estimate per indexed entry position, weighted like
+        calculate_confidence_score (title 50 points, composer 30 points)
+        """
+        title_scores = {}
+        for normalized_field, title_field in (('normalized_title_hawaiian', 'canonical_title_hawaiian'),
+                                              ('normalized_title_english', 'canonical_title_english')):
+            grams = character_ngrams(
+                stored_or_normalized(canonical_song, normalized_field, title_field, normalize_title), self.n
+            )
+            for position, score in self._overlap_scores(grams, self.title_postings, self.title_sizes).items():
+                if score > title_scores.get(position, 0.0):
+                    title_scores[position] = score
+        
+        composer_grams = character_ngrams(
+            stored_or_normalized(canonical_song, 'normalized_composer', 'primary_composer', normalize_composer),
+            self.n
+        )
+        composer_scores = self._overlap_scores(composer_grams, self.composer_postings, self.composer_sizes)
+        
+        estimates = {position: score * 0.5 for position, score in title_scores.items()}
+        for position, score in composer_scores.items():
+            estimates[position] = estimates.get(position, 0.0) + score * 0.3
+        
+        return estimates
+    
+    def top_candidates(self, canonical_song: Dict, k: int,
+                       songbook_entries: Optional[List[Dict]] = None) -> List[Dict]:
+        """
+        Return the K most plausible entries for a canonical song, in their original order.
+        When songbook_entries is given, only entries from that list are considered.
+        Entries sharing no n-gram rank last, so K >= len(entries) keeps everything.
+        """
+        estimates = self.estimate_scores(canonical_song)
+        
+        if songbook_entries is None:
+            positions = range(len(self.entries))
+        else:
+            positions = [self.positions_by_id[songbook_entry['id']] for songbook_entry in songbook_entries]
+        
+        best_positions = heapq.nlargest(k, positions, key=lambda position: (estimates.get(position, 0.0), -position))
+        return [self.entries[position] for position in sorted(best_positions)]
+
+
+def measure_recall(engine, canonical_songs: List[Dict], songbook_entries: List[Dict],
+                   k_values: Iterable[int] = (10, 25, 50, 100, 250)) -> List[Dict]:
+    """
+    Compare shortlists against the brute-force path for several K values.
+    Recall is the share of brute-force matches (confidence >= 20) that survive the shortlist.
+    """
+    index = NGramIndex(songbook_entries)
+    brute_force = {}
+    candidate_limit, engine.candidate_limit = engine.candidate_limit, None
+    try:
+        for canonical_song in canonical_songs:
+            matches = engine.score_song_against_entries(canonical_song, songbook_entries)
+            brute_force[canonical_song['canonical_mele_id']] = matches
+    finally:
+        engine.candidate_limit = candidate_limit
+    
+    report = []
+    for k in k_values:
+        found = expected = 0
+        found_reviewable = expected_reviewable = 0
+        songs_fully_recalled = 0
+        pairs_scored = 0
+        
+        for canonical_song in canonical_songs:
+            shortlist_ids = {songbook_entry['id'] for songbook_entry in index.top_candidates(canonical_song, k)}
+            pairs_scored += len(shortlist_ids)
+            matches = brute_force[canonical_song['canonical_mele_id']]
+            hits = [match for match in matches if match['songbook_entry_id'] in shortlist_ids]
+            reviewable = [match for match in matches if match['tier'] != 'low']
+            
+            found += len(hits)
+            expected += len(matches)
+            found_reviewable += sum(1 for match in hits if match['tier'] != 'low')
+            expected_reviewable += len(reviewable)
+            if len(hits) == len(matches):
+                songs_fully_recalled += 1
+        
+        report.append({
+            'k': k,
+            'recall': found / expected if expected else 1.0,
+            'medium_high_recall': found_reviewable / expected_reviewable if expected_reviewable else 1.0,
+            'songs_fully_recalled': songs_fully_recalled,
+            'songs': len(canonical_songs),
+            'brute_force_matches': expected,
+            'pairs_scored': pairs_scored,
+            'pairs_brute_force': len(songbook_entries) * len(canonical_songs)
+        })
+    
+    return report
+
+
+def main():
+    """Print candidate recall statistics against the live database"""
+    from database import require_credentials
+    from matching_engine import MatchingEngine
+    
+    print("🎵 Songbook Linkage System - Candidate Index Recall")
+    print("=" * 60)
+    
+    require_credentials()
+    
+    engine = MatchingEngine()
+    conn = engine.get_database_connection()
+    cursor = conn.cursor()
+    
+    try:
+        canonical_songs = engine.fetch_canonical_songs(cursor)
+        songbook_entries = engine.fetch_unlinked_entries(cursor)
+    finally:
+        cursor.close()
+        engine.release_database_connection(conn)
+    
+    print(f"Measuring recall for {len(canonical_songs)} songs against {len(songbook_entries)} entries...\n")
+    
+    for row in measure_recall(engine, canonical_songs, songbook_entries):
+        print(f"K={row['k']:>4}: recall {row['recall']:.1%}, "
+              f"medium/high recall {row['medium_high_recall']:.1%}, "
+              f"{row['songs_fully_recalled']}/{row['songs']} songs fully recalled, "
+              f"{row['pairs_scored']} of {row['pairs_brute_force']} pairs scored")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Songbook Linkage System - Composer Identity Index
+Maps every observed composer spelling (canonical_mele, songbook_entries and the
+read-only people table) to a stable composer key, so composer scoring is a hash
+lookup for known names and fuzzy matching is left to unresolved spellings
+"""
+
+import os
+import sys
+from collections import defaultdict, Counter
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple, Callable
+import json
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from text_normalization import normalize_title
+
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'composer_index.json')
+INDEX_FORMAT_VERSION = 2
+
+# Leading titles dropped before reading a name ("Queen Liliʻuokalani", "King Kalākaua")
+HONORIFICS = {'queen', 'king', 'prince', 'princess', 'chief', 'rev', 'reverend', 'dr', 'mr', 'mrs', 'miss', 'madame'}
+
+# Abbreviated or familiar first names and the given name they stand for
+FIRST_NAME_FORMS = {
+    'chas': 'charles', 'charlie': 'charles',
+    'wm': 'william', 'will': 'william', 'bill': 'william',
+    'jno': 'john', 'johnny': 'john',
+    'ed': 'edward', 'eddie': 'edward'
+}
+
+# Every composer spelling and person name the index is built from, as one md5
+SOURCE_FINGERPRINT_SQL = """
+    SELECT md5(coalesce(string_agg(spelling, E'\\n' ORDER BY spelling), ''))
+    FROM (
+        SELECT primary_composer AS spelling FROM canonical_mele WHERE primary_composer IS NOT NULL
+        UNION
+        SELECT composer FROM songbook_entries WHERE composer IS NOT NULL
+        {people}
+    ) AS spellings
+"""
+PEOPLE_FINGERPRINT_SQL = "UNION SELECT 'person:' || person_id || ':' || coalesce(name, '') FROM people"
+
+
+def name_signature(match_key: str) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    (surname, first name) for a normalized name, with honorifics dropped and familiar
+    first names expanded; the first name may be a bare initial, and is None for single names
+    """
+    words = match_key.split()
+    while len(words) > 1 and words[0] in HONORIFICS:
+        words = words[1:]
+    if not words:
+        return None
+    if len(words) == 1:
+        return words[0], None
+    return words[-1], FIRST_NAME_FORMS.get(words[0], words[0])
+
+
+def first_names_compatible(first1: str, first2: str) -> bool:
+    """True when two first names can belong to one person: equal, or a bare initial of the other"""
+    if len(first1) == 1 or len(first2) == 1:
+        return first1[0] == first2[0]
+    return first1 == first2
+
+
+class ComposerIndex:
+    """Composer spelling → composer key lookup, with a cache of fuzzy scores between known composers"""
+    
+    def __init__(self, spellings: Optional[Dict[str, str]] = None, names: Optional[Dict[str, str]] = None,
+                 source_fingerprint: Optional[str] = None, built_at: Optional[str] = None):
+        # Normalized spelling (normalize_title) → composer key
+        self.spellings = spellings or {}
+        # Composer key → display name (the person's name, or the most common spelling)
+        self.names = names or {}
+        self.source_fingerprint = source_fingerprint
+        self.built_at = built_at
+        # (spelling, spelling) → similarity for spellings of different known composers
+        self._pair_cache = {}
+    
+    @classmethod
+    def from_sources(cls, people: List[Tuple[str, str]], spellings: List[Tuple[str, int]],
+                     source_fingerprint: Optional[str] = None) -> "ComposerIndex":
+        """
+        Build from (person_id, name) rows and (spelling, occurrences) pairs.
+        A spelling resolves to a person when its normalized form equals the person's name or,
+        failing that, when exactly one person shares its surname and a compatible first name
+        (the same name, or a bare initial of it). Spellings with no person are grouped by surname
+        and first name: a bare initial joins the group only while a single full first name is seen
+        with it, so "John Almeida" and "Joseph Almeida" stay apart. Ambiguous spellings stay
+        unresolved and are fuzzy-matched at scoring time.
+        """
+        resolved = {}
+        names = {}
+        person_firsts = {}
+        people_by_initial = defaultdict(set)
+        people_by_surname = defaultdict(set)
+        
+        for person_id, name in people:
+            match_key = normalize_title(name or '')
+            signature = name_signature(match_key)
+            if signature is None:
+                continue
+            surname, first = signature
+            key = f"person:{person_id}"
+            names[key] = name
+            resolved[match_key] = key
+            person_firsts[key] = first
+            people_by_surname[surname].add(key)
+            if first is not None:
+                people_by_initial[(surname, first[0])].add(key)
+        
+        counts = Counter()
+        for spelling, occurrences in spellings:
+            if spelling:
+                counts[normalize_title(spelling)] += occurrences
+        signatures = {match_key: name_signature(match_key) for match_key in counts}
+        
+        # First names (and initials) seen with each surname, and full first names per initial
+        firsts_by_surname = defaultdict(set)
+        full_names = defaultdict(set)
+        for signature in signatures.values():
+            if signature is not None and signature[1] is not None:
+                surname, first = signature
+                firsts_by_surname[surname].add(first)
+                if len(first) > 1:
+                    full_names[(surname, first[0])].add(first)
+        
+        group_spellings = defaultdict(Counter)
+        for match_key, signature in signatures.items():
+            if match_key in resolved or signature is None:
+                continue
+            surname, first = signature
+            
+            if first is None:
+                candidates = people_by_surname[surname]
+                if len(candidates) == 1:
+                    person_first = person_firsts[next(iter(candidates))]
+                    if person_first is not None and any(not first_names_compatible(person_first, other)
+                                                        for other in firsts_by_surname[surname]):
+                        continue  # Other composers share the surname
+            else:
+                candidates = {key for key in people_by_initial[(surname, first[0])]
+                              if person_firsts[key] is None or first_names_compatible(first, person_firsts[key])}
+            if len(candidates) == 1:
+                resolved[match_key] = next(iter(candidates))
+                continue
+            if candidates:
+                continue  # Several people fit: leave it to fuzzy matching
+            
+            if first is None:
+                initials = {other[0] for other in firsts_by_surname[surname]}
+                if people_by_surname[surname] or len(initials) > 1:
+                    continue
+                if initials:
+                    first = next(iter(initials))
+            if first is not None:
+                initial_names = full_names[(surname, first[0])]
+                if len(initial_names) > 1:
+                    if len(first) == 1:
+                        continue  # A bare initial shared by different first names
+                    key = f"name:{surname}:{first}"
+                else:
+                    key = f"name:{surname}:{first[0]}"
+            else:
+                key = f"name:{surname}:"
+            
+            resolved[match_key] = key
+            group_spellings[key][match_key] += counts[match_key]
+        
+        for key, spelling_counts in group_spellings.items():
+            names.setdefault(key, spelling_counts.most_common(1)[0][0])
+        
+        return cls(resolved, names, source_fingerprint, datetime.now().isoformat(timespec='seconds'))
+    
+    @classmethod
+    def build(cls, cursor) -> "ComposerIndex":
+        """Build from the database (people is optional; it may not exist in every environment)"""
+        has_people = people_table_exists(cursor)
+        
+        people = []
+        if has_people:
+            cursor.execute("SELECT person_id::text, name FROM people ORDER BY person_id")
+            people = cursor.fetchall()
+        
+        cursor.execute("""
+            SELECT spelling, SUM(occurrences)::int FROM (
+                SELECT primary_composer AS spelling, COUNT(*) AS occurrences
+                FROM canonical_mele WHERE primary_composer IS NOT NULL GROUP BY primary_composer
+                UNION ALL
+                SELECT composer, COUNT(*) FROM songbook_entries WHERE composer IS NOT NULL GROUP BY composer
+            ) AS spellings
+            GROUP BY spelling
+        """)
+        spellings = cursor.fetchall()
+        
+        return cls.from_sources(people, spellings, source_fingerprint(cursor, has_people))
+    
+    def resolve(self, name: Optional[str]) -> Optional[str]:
+        """Composer key for a spelling, or None when it is unknown or ambiguous"""
+        if not name:
+            return None
+        return self.spellings.get(normalize_title(name))
+    
+    def known_similarity(self, name1: str, name2: str) -> Optional[float]:
+        """
+        Similarity without any string comparison: 100 for two spellings of the same composer,
+        the cached score for spellings of different known composers, otherwise None
+        """
+        key1 = self.resolve(name1)
+        key2 = self.resolve(name2)
+        if key1 is None or key2 is None:
+            return None
+        if key1 == key2:
+            return 100.0
+        return self._pair_cache.get((normalize_title(name1), normalize_title(name2)))
+    
+    def similarity(self, name1: str, name2: str, fuzzy: Callable[[], float]) -> float:
+        """
+        known_similarity, falling back to fuzzy(); the fuzzy score is cached when both
+        spellings are known, so each pair of known composers is only compared once
+        """
+        score = self.known_similarity(name1, name2)
+        if score is not None:
+            return score
+        
+        score = fuzzy()
+        if self.resolve(name1) is not None and self.resolve(name2) is not None:
+            self._pair_cache[(normalize_title(name1), normalize_title(name2))] = score
+        return score
+    
+    def is_stale(self, cursor) -> bool:
+        """True when composer spellings or people changed since the index was built"""
+        return source_fingerprint(cursor, people_table_exists(cursor)) != self.source_fingerprint
+    
+    def save(self, path: str = DEFAULT_INDEX_PATH):
+        """Write the index to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump({
+                'format_version': INDEX_FORMAT_VERSION,
+                'built_at': self.built_at,
+                'source_fingerprint': self.source_fingerprint,
+                'names': self.names,
+                'spellings': self.spellings
+            }, f, indent=2, ensure_ascii=False, sort_keys=True)
+    
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH) -> Optional["ComposerIndex"]:
+        """Load a saved index, or None if the file is missing or in an older format"""
+        if not os.path.exists(path):
+            return None
+        
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get('format_version') != INDEX_FORMAT_VERSION:
+            return None
+        return cls(data['spellings'], data['names'], data.get('source_fingerprint'), data.get('built_at'))
+    
+    @classmethod
+    def load_or_build(cls, path: str = DEFAULT_INDEX_PATH) -> "ComposerIndex":
+        """Saved index if it still matches the database, otherwise rebuild and save it"""
+        from database import connection
+        
+        with connection() as conn:
+            cursor = conn.cursor()
+            try:
+                index = cls.load(path)
+                if index is None or index.is_stale(cursor):
+                    index = cls.build(cursor)
+                    index.save(path)
+            finally:
+                cursor.close()
+        return index
+
+
+def people_table_exists(cursor) -> bool:
+    cursor.execute("SELECT to_regclass('people') IS NOT NULL")
+    return cursor.fetchone()[0]
+
+
+def source_fingerprint(cursor, has_people: bool) -> str:
+    cursor.execute(SOURCE_FINGERPRINT_SQL.format(people=PEOPLE_FINGERPRINT_SQL if has_people else ''))
+    return cursor.fetchone()[0]
+
+
+def main():
+    """Build (or refresh) the composer index: composer_index.py [build|show] [spelling ...]"""
+    import argparse
+    from database import require_credentials
+    
+    parser = argparse.ArgumentParser(description="Composer identity index")
+    parser.add_argument('command', choices=['build', 'show'], nargs='?', default='build')
+    parser.add_argument('spellings', nargs='*', help="composer spellings to resolve (show)")
+    parser.add_argument('--path', default=DEFAULT_INDEX_PATH)
+    args = parser.parse_args()
+    
+    print("🎵 Songbook Linkage System - Composer Index")
+    print("=" * 60)
+    
+    require_credentials()
+    
+    if args.command == 'build':
+        from database import connection
+        with connection() as conn:
+            cursor = conn.cursor()
+            index = ComposerIndex.build(cursor)
+            cursor.close()
+        index.save(args.path)
+    else:
+        index = ComposerIndex.load_or_build(args.path)
+    
+    print(f"✓ {len(index.spellings)} spellings → {len(set(index.spellings.values()))} composers")
+    
+    if args.command == 'show':
+        keys = args.spellings or sorted(index.names)
+        for item in keys:
+            key = item if item in index.names else index.resolve(item)
+            members = sorted(spelling for spelling, composer in index.spellings.items() if composer == key)
+            label = index.names.get(key, 'unresolved') if key else 'unresolved'
+            print(f"   {item} → {key or '-'} ({label})" + (f": {', '.join(members)}" if members else ""))
+    
+    print(f"\n✅ Composer index saved to {args.path}" if args.command == 'build' else "\n✅ Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Songbook Linkage System - Shared Database Connections
+Thread-safe connection pool used by every linkage script, configured from the environment
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Tuple
+
+import psycopg2
+from psycopg2.extensions import make_dsn, TRANSACTION_STATUS_IDLE
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+
+# Used when neither a DSN nor the matching libpq variable is set
+DEFAULT_CONNECTION = {
+    'host': 'ep-young-silence-ad9wue88-pooler.c-2.us-east-1.aws.neon.tech',
+    'port': '5432',
+    'dbname': 'neondb',
+    'user': 'neondb_owner'
+}
+
+_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+_last_used = {}
+# id(conn) → (pool, slot semaphore, pid) for connections currently checked out
+_checked_out = {}
+
+
+def get_dsn() -> str:
+    """
+    Connection string from HUAPALA_DATABASE_URL or DATABASE_URL, otherwise built from
+    the standard PGHOST / PGPORT / PGDATABASE / PGUSER / PGPASSWORD variables
+    """
+    dsn = os.getenv('HUAPALA_DATABASE_URL') or os.getenv('DATABASE_URL')
+    if dsn:
+        return dsn
+    
+    return make_dsn(
+        host=os.getenv('PGHOST', DEFAULT_CONNECTION['host']),
+        port=os.getenv('PGPORT', DEFAULT_CONNECTION['port']),
+        dbname=os.getenv('PGDATABASE', DEFAULT_CONNECTION['dbname']),
+        user=os.getenv('PGUSER', DEFAULT_CONNECTION['user']),
+        password=os.getenv('PGPASSWORD', '')
+    )
+
+
+def set_default_connection(**settings):
+    """
+    Replace the fallback host / port / dbname / user for this process, for scripts that
+    must not default to the shared Neon host (call before the first connection)
+    """
+    DEFAULT_CONNECTION.update(settings)
+
+
+def require_credentials():
+    """Fail early when no database password or DSN is configured"""
+    if not (os.getenv('PGPASSWORD') or os.getenv('HUAPALA_DATABASE_URL') or os.getenv('DATABASE_URL')):
+        raise ValueError("PGPASSWORD (or HUAPALA_DATABASE_URL) environment variable is required")
+
+
+def _pool_settings():
+    """Pool bounds and health-check interval from the environment"""
+    min_size = int(os.getenv('HUAPALA_DB_POOL_MIN', '1'))
+    max_size = max(int(os.getenv('HUAPALA_DB_POOL_MAX', '5')), min_size, 1)
+    timeout = float(os.getenv('HUAPALA_DB_POOL_TIMEOUT', '30'))
+    health_check_after = float(os.getenv('HUAPALA_DB_HEALTH_CHECK_SECONDS', '30'))
+    return min_size, max_size, timeout, health_check_after
+
+
+def _current_pool() -> Tuple[ThreadedConnectionPool, threading.BoundedSemaphore]:
+    """Shared pool and its slot semaphore, creating them on first use in this process"""
+    global _pool, _pool_pid, _pool_slots
+    
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            min_size, max_size, _, _ = _pool_settings()
+            _pool = ThreadedConnectionPool(min_size, max_size, get_dsn())
+            _pool_pid = os.getpid()
+            _pool_slots = threading.BoundedSemaphore(max_size)
+            _last_used.clear()
+        return _pool, _pool_slots
+
+
+def get_pool() -> ThreadedConnectionPool:
+    """Shared pool for this process (a forked child builds its own instead of reusing the parent's sockets)"""
+    return _current_pool()[0]
+
+
+def _is_healthy(conn) -> bool:
+    """Cheap liveness check, pinging the server only if the connection sat idle for a while"""
+    if conn.closed:
+        return False
+    
+    # Connections the pool just opened have never been returned and need no ping
+    last_used = _last_used.get(id(conn))
+    _, _, _, health_check_after = _pool_settings()
+    if last_used is None or time.monotonic() - last_used < health_check_after:
+        return True
+    
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def get_connection():
+    """
+    Check a connection out of the shared pool, waiting for a free slot and
+    replacing connections that fail the health check
+    """
+    pool, slots = _current_pool()
+    _, max_size, timeout, _ = _pool_settings()
+    
+    if not slots.acquire(timeout=timeout):
+        raise PoolError(f"No database connection available after {timeout:.0f}s")
+    
+    try:
+        # Every idle pooled connection may be stale; a newly opened one is never pinged
+        for _ in range(max_size + 1):
+            conn = pool.getconn()
+            if _is_healthy(conn):
+                _checked_out[id(conn)] = (pool, slots, os.getpid())
+                return conn
+            pool.putconn(conn, close=True)
+            _last_used.pop(id(conn), None)
+        raise PoolError(f"No healthy database connection after {max_size + 1} attempts")
+    except Exception:
+        slots.release()
+        raise
+
+
+def release_connection(conn, close: bool = False):
+    """
+    Return a connection to the pool that issued it, rolling back anything uncommitted and resetting
+    autocommit. If that pool has since been closed the connection is closed instead; a connection
+    inherited across a fork is left alone, since its socket belongs to the parent.
+    """
+    pool, slots, pid = _checked_out.pop(id(conn), (None, None, None))
+    if pid is not None and pid != os.getpid():
+        return
+    
+    with _pool_lock:
+        live = pool is not None and pool is _pool
+    if not live:
+        _last_used.pop(id(conn), None)
+        if not conn.closed:
+            conn.close()
+        if slots is not None:
+            slots.release()
+        return
+    
+    try:
+        if not conn.closed and not close:
+            if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+    except psycopg2.Error:
+        close = True
+    
+    close = close or bool(conn.closed)
+    if close:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    
+    pool.putconn(conn, close=close)
+    slots.release()
+
+
+@contextmanager
+def connection():
+    """Context manager around get_connection / release_connection"""
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
+
+
+def close_pool():
+    """Close every pooled connection (e.g. at the end of a long-running job)"""
+    global _pool
+    
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+        _last_used.clear()
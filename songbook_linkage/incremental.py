@@ -0,0 +1,310 @@
+"""
+Songbook Linkage System - Incremental Matching
+Re-scores only the pairs touched by canonical songs or songbook entries that changed
+(or appeared) since the last incremental run, leaving other matching_status rows alone
+"""
+
+import os
+import sys
+import time
+import argparse
+from typing import List, Dict, Optional, Tuple
+from psycopg2.extras import execute_values
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from matching_engine import MatchingEngine, CANONICAL_NORMALIZED_FIELDS, ENTRY_NORMALIZED_FIELDS
+from candidate_index import NGramIndex
+from vector_scoring import BatchSimilarityScorer
+
+
+# Columns whose values feed the confidence score; a change to any of them makes the row dirty
+CANONICAL_SOURCE_COLUMNS = ['canonical_title_hawaiian', 'canonical_title_english', 'primary_composer']
+ENTRY_SOURCE_COLUMNS = ['printed_song_title', 'composer', 'pub_year']
+
+
+def source_hash_sql(alias: str, columns: List[str]) -> str:
+    """SQL expression hashing a row's scoring inputs"""
+    parts = " || chr(31) || ".join(f"coalesce({alias}.{column}::text, '')" for column in columns)
+    return f"md5({parts})"
+
+
+class IncrementalMatcher:
+    """Tracks per-song and per-entry scoring inputs so unchanged pairs are never re-scored"""
+    
+    def __init__(self, engine: Optional[MatchingEngine] = None):
+        self.engine = engine or MatchingEngine()
+        if self.engine.exact_key_tier:
+            # Only new or changed pairs are scored, so entries cannot be dropped for every song
+            raise ValueError("IncrementalMatcher does not support exact_key_tier; use MatchingEngine.match_many")
+    
+    def _source_columns(self) -> Tuple[List[str], List[str]]:
+        """Hashed columns; the stored normalized columns count too when the engine scores on them"""
+        canonical_columns = list(CANONICAL_SOURCE_COLUMNS)
+        entry_columns = list(ENTRY_SOURCE_COLUMNS)
+        if self.engine.use_stored_normalization:
+            canonical_columns += [normalized_key for normalized_key, _, _ in CANONICAL_NORMALIZED_FIELDS]
+            entry_columns += [normalized_key for normalized_key, _, _ in ENTRY_NORMALIZED_FIELDS]
+        return canonical_columns, entry_columns
+    
+    def forget_linked_entries(self, cursor):
+        """
+        Drop progress rows for entries that are linked now, so an entry that is later
+        unlinked again is treated as new
+        """
+        cursor.execute("""
+            DELETE FROM songbook_entry_matching_progress AS p
+            USING songbook_entries AS s
+            WHERE s.id = p.songbook_entry_id
+            AND s.canonical_mele_id IS NOT NULL
+        """)
+    
+    def find_dirty(self, cursor, full: bool = False) -> Tuple[Dict[str, str], Dict[int, str], int, int]:
+        """
+        Canonical songs and unlinked songbook entries that are new, changed, or last matched
+        with another algorithm_version, each mapped to its current source hash.
+        Returns (dirty_songs, dirty_entries, song_count, unlinked_entry_count).
+        """
+        canonical_columns, entry_columns = self._source_columns()
+        canonical_hash = source_hash_sql('c', canonical_columns)
+        entry_hash = source_hash_sql('s', entry_columns)
+        params = {'version': self.engine.algorithm_version}
+        
+        canonical_filter = entry_filter = ""
+        if not full:
+            canonical_filter = f"""
+                WHERE p.canonical_mele_id IS NULL
+                OR p.algorithm_version <> %(version)s
+                OR p.source_hash <> {canonical_hash}
+            """
+            entry_filter = f"""
+                AND (p.songbook_entry_id IS NULL
+                     OR p.algorithm_version <> %(version)s
+                     OR p.source_hash <> {entry_hash})
+            """
+        
+        cursor.execute(f"""
+            SELECT c.canonical_mele_id, {canonical_hash}
+            FROM canonical_mele c
+            LEFT JOIN matching_progress p ON p.canonical_mele_id = c.canonical_mele_id
+            {canonical_filter}
+        """, params)
+        dirty_songs = dict(cursor.fetchall())
+        
+        cursor.execute(f"""
+            SELECT s.id, {entry_hash}
+            FROM songbook_entries s
+            LEFT JOIN songbook_entry_matching_progress p ON p.songbook_entry_id = s.id
+            WHERE s.canonical_mele_id IS NULL
+            {entry_filter}
+        """, params)
+        dirty_entries = dict(cursor.fetchall())
+        
+        cursor.execute("SELECT COUNT(*) FROM canonical_mele")
+        song_count = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM songbook_entries WHERE canonical_mele_id IS NULL")
+        entry_count = cursor.fetchone()[0]
+        
+        return dirty_songs, dirty_entries, song_count, entry_count
+    
+    def score_dirty_pairs(self, canonical_songs: List[Dict], songbook_entries: List[Dict],
+                          dirty_songs: Dict[str, str], dirty_entries: Dict[int, str],
+                          auto_link_high_confidence: bool = True) -> Tuple[List[Tuple[str, List[Dict]]], Dict[str, set]]:
+        """
+        Score dirty songs against every unlinked entry and clean songs against dirty entries only,
+        in canonical_mele_id order with the same auto-link exclusion as match_loaded.
+        Returns (song_matches, scored entry ids per song).
+        """
+        engine = self.engine
+        candidate_index = NGramIndex(songbook_entries) if engine.candidate_limit is not None else None
+        batch_scorer = None
+        if engine.scoring_method == 'ngram_cosine':
+            batch_scorer = BatchSimilarityScorer(songbook_entries, engine.calibration)
+        
+        linking_entry_ids = set()
+        remaining = songbook_entries
+        song_matches = []
+        scored_pairs = {}
+        
+        for canonical_song in canonical_songs:
+            canonical_mele_id = canonical_song['canonical_mele_id']
+            song_is_dirty = canonical_mele_id in dirty_songs
+            if not song_is_dirty and not dirty_entries:
+                continue
+            
+            if linking_entry_ids:
+                remaining = [entry for entry in remaining if entry['id'] not in linking_entry_ids]
+            
+            # Shortlist over all remaining entries first, so a clean song only picks up
+            # dirty entries that would have made its full-run shortlist
+            considered = remaining
+            if candidate_index is not None:
+                considered = candidate_index.top_candidates(canonical_song, engine.candidate_limit, remaining)
+            if not song_is_dirty:
+                considered = [entry for entry in considered if entry['id'] in dirty_entries]
+            
+            if not considered and not song_is_dirty:
+                continue
+            
+            matches = engine.score_song_against_entries(canonical_song, considered, candidate_index, batch_scorer)
+            linking_entry_ids.update(
+                match['songbook_entry_id'] for match in matches
+                if engine._status_for_match(match, auto_link_high_confidence) == 'auto_linked'
+            )
+            scored_pairs[canonical_mele_id] = {entry['id'] for entry in considered}
+            song_matches.append((canonical_mele_id, matches))
+        
+        return song_matches, scored_pairs
+    
+    def _record_progress(self, cursor, song_matches: List[Tuple[str, List[Dict]]], scored_pairs: Dict[str, set],
+                         dirty_songs: Dict[str, str], dirty_entries: Dict[int, str]) -> int:
+        """
+        Within the save transaction: delete needs_review rows for re-scored pairs that no longer
+        reach the minimum score, then record the hashes that were matched. Returns rows deleted.
+        """
+        matched_pairs = {
+            (canonical_mele_id, match['songbook_entry_id'])
+            for canonical_mele_id, matches in song_matches
+            for match in matches
+        }
+        
+        cursor.execute("""
+            SELECT canonical_mele_id, songbook_entry_id
+            FROM matching_status
+            WHERE match_status = 'needs_review'
+            AND (canonical_mele_id = ANY(%s) OR songbook_entry_id = ANY(%s))
+        """, (list(scored_pairs), list(dirty_entries)))
+        
+        stale_pairs = [
+            (canonical_mele_id, songbook_entry_id)
+            for canonical_mele_id, songbook_entry_id in cursor.fetchall()
+            if songbook_entry_id in scored_pairs.get(canonical_mele_id, ())
+            and (canonical_mele_id, songbook_entry_id) not in matched_pairs
+        ]
+        
+        execute_values(cursor, """
+            DELETE FROM matching_status AS m
+            USING (VALUES %s) AS v(canonical_mele_id, songbook_entry_id)
+            WHERE m.canonical_mele_id = v.canonical_mele_id
+            AND m.songbook_entry_id = v.songbook_entry_id
+            AND m.match_status = 'needs_review'
+        """, stale_pairs, page_size=1000)
+        
+        version = self.engine.algorithm_version
+        execute_values(cursor, """
+            INSERT INTO matching_progress (canonical_mele_id, algorithm_version, source_hash)
+            VALUES %s
+            ON CONFLICT (canonical_mele_id)
+            DO UPDATE SET
+                algorithm_version = EXCLUDED.algorithm_version,
+                source_hash = EXCLUDED.source_hash,
+                last_matched_at = NOW()
+        """, [(canonical_mele_id, version, source_hash) for canonical_mele_id, source_hash in dirty_songs.items()],
+            page_size=1000)
+        
+        execute_values(cursor, """
+            INSERT INTO songbook_entry_matching_progress (songbook_entry_id, algorithm_version, source_hash)
+            VALUES %s
+            ON CONFLICT (songbook_entry_id)
+            DO UPDATE SET
+                algorithm_version = EXCLUDED.algorithm_version,
+                source_hash = EXCLUDED.source_hash,
+                last_matched_at = NOW()
+        """, [(songbook_entry_id, version, source_hash) for songbook_entry_id, source_hash in dirty_entries.items()],
+            page_size=1000)
+        
+        return len(stale_pairs)
+    
+    def run(self, auto_link_high_confidence: bool = True, full: bool = False) -> Dict:
+        """
+        Incremental matching pass. full=True re-scores everything (and records progress),
+        e.g. for the first run or after changing confidence thresholds.
+        """
+        engine = self.engine
+        started = time.perf_counter()
+        conn = engine.get_database_connection()
+        cursor = conn.cursor()
+        
+        try:
+            self.forget_linked_entries(cursor)
+            conn.commit()
+            
+            dirty_songs, dirty_entries, song_count, entry_count = self.find_dirty(cursor, full)
+            
+            canonical_songs = songbook_entries = []
+            if dirty_songs or dirty_entries:
+                # Clean songs only need loading when some entry changed
+                canonical_songs = engine.fetch_canonical_songs(cursor, None if dirty_entries else list(dirty_songs))
+                songbook_entries = engine.fetch_unlinked_entries(cursor)
+        finally:
+            cursor.close()
+            engine.release_database_connection(conn)
+        
+        song_matches, scored_pairs = self.score_dirty_pairs(
+            canonical_songs, songbook_entries, dirty_songs, dirty_entries, auto_link_high_confidence
+        )
+        
+        summary = {
+            'songs': song_count,
+            'dirty_songs': len(dirty_songs),
+            'entries': entry_count,
+            'dirty_entries': len(dirty_entries),
+            'pairs_total': song_count * entry_count,
+            'pairs_scored': sum(len(entry_ids) for entry_ids in scored_pairs.values()),
+            'stale_removed': 0,
+            'results': []
+        }
+        summary['pairs_skipped'] = summary['pairs_total'] - summary['pairs_scored']
+        
+        if dirty_songs or dirty_entries:
+            stale_removed = []
+            
+            def record_progress(write_cursor):
+                stale_removed.append(
+                    self._record_progress(write_cursor, song_matches, scored_pairs, dirty_songs, dirty_entries)
+                )
+            
+            summary['results'] = engine.save_matches(song_matches, auto_link_high_confidence, record_progress)
+            summary['stale_removed'] = stale_removed[0] if stale_removed else 0
+        
+        summary['matches'] = sum(result['total_matches'] for result in summary['results'])
+        summary['auto_linked'] = sum(result['auto_linked'] for result in summary['results'])
+        summary['queued_for_review'] = sum(result['queued_for_review'] for result in summary['results'])
+        summary['seconds'] = time.perf_counter() - started
+        
+        return summary
+
+
+def main():
+    """Run an incremental (or forced full) matching pass and report the work skipped"""
+    from database import require_credentials
+    
+    parser = argparse.ArgumentParser(description="Incremental songbook matching")
+    parser.add_argument('--full', action='store_true', help="re-score every pair and reset progress")
+    parser.add_argument('--algorithm-version', default="v1.0")
+    parser.add_argument('--auto-link', action='store_true', help="auto-link high confidence matches")
+    args = parser.parse_args()
+    
+    print("🎵 Songbook Linkage System - Incremental Matching")
+    print("=" * 60)
+    
+    require_credentials()
+    
+    matcher = IncrementalMatcher(MatchingEngine(algorithm_version=args.algorithm_version))
+    summary = matcher.run(args.auto_link, args.full)
+    
+    skipped_share = summary['pairs_skipped'] / summary['pairs_total'] if summary['pairs_total'] else 1.0
+    print(f"Dirty songs: {summary['dirty_songs']} of {summary['songs']}")
+    print(f"Dirty or new entries: {summary['dirty_entries']} of {summary['entries']} unlinked")
+    print(f"Pairs scored: {summary['pairs_scored']} of {summary['pairs_total']} "
+          f"({summary['pairs_skipped']} skipped, {skipped_share:.1%})")
+    print(f"   Matches saved: {summary['matches']}")
+    print(f"   Auto-linked: {summary['auto_linked']}")
+    print(f"   Queued for review: {summary['queued_for_review']}")
+    print(f"   Stale review rows removed: {summary['stale_removed']}")
+    print(f"\n✅ Incremental matching completed in {summary['seconds']:.1f}s!")
+
+
+if __name__ == "__main__":
+    main()
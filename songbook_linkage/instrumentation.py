@@ -0,0 +1,128 @@
+"""
+Songbook Linkage System - Instrumentation
+Timing spans and counters for matching runs (connections, fetches, normalization,
+SequenceMatcher, saves and commits). The engine uses NULL_PROFILER unless a Profiler
+is passed in, so disabled instrumentation costs one no-op call per span.
+"""
+
+import json
+from time import perf_counter
+from typing import Dict, Optional
+
+
+class _Span:
+    """Context manager adding its elapsed time to one profiler span"""
+    
+    __slots__ = ('profiler', 'name', 'started')
+    
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+    
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.profiler.add_time(self.name, perf_counter() - self.started)
+        return False
+
+
+class _NullSpan:
+    """Shared do-nothing span returned while profiling is disabled"""
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+
+
+class Profiler:
+    """
+    Collects named timing spans (count, total and max seconds) and counters.
+    Spans may nest (e.g. 'normalize' inside 'score'), so span totals do not add up to wall time.
+    """
+    
+    enabled = True
+    
+    def __init__(self, output_path: Optional[str] = None):
+        # When set, dump() also writes the JSON summary to this file
+        self.output_path = output_path
+        self.reset()
+    
+    def reset(self):
+        self.started_at = perf_counter()
+        self.spans = {}
+        self.counters = {}
+    
+    def span(self, name: str) -> _Span:
+        """Time a block: with profiler.span('fetch'): ..."""
+        return _Span(self, name)
+    
+    def add_time(self, name: str, seconds: float):
+        stats = self.spans.get(name)
+        if stats is None:
+            self.spans[name] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+    
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def summary(self) -> Dict:
+        """Totals so far, with span times in milliseconds"""
+        return {
+            'wall_ms': round((perf_counter() - self.started_at) * 1000, 3),
+            'spans': {
+                name: {
+                    'count': count,
+                    'total_ms': round(total * 1000, 3),
+                    'mean_ms': round(total * 1000 / count, 3),
+                    'max_ms': round(longest * 1000, 3)
+                }
+                for name, (count, total, longest) in sorted(self.spans.items())
+            },
+            'counters': dict(sorted(self.counters.items()))
+        }
+    
+    def to_json(self) -> str:
+        return json.dumps(self.summary(), indent=2)
+    
+    def dump(self) -> Dict:
+        """Summary at the end of a run, written to output_path when one is configured"""
+        summary = self.summary()
+        if self.output_path:
+            with open(self.output_path, 'w') as handle:
+                json.dump(summary, handle, indent=2)
+        return summary
+
+
+class NullProfiler:
+    """Profiler stand-in that records nothing"""
+    
+    enabled = False
+    _span = _NullSpan()
+    
+    def span(self, name: str) -> _NullSpan:
+        return self._span
+    
+    def add_time(self, name: str, seconds: float):
+        pass
+    
+    def count(self, name: str, amount: int = 1):
+        pass
+    
+    def summary(self) -> Dict:
+        return {}
+    
+    def dump(self) -> Dict:
+        return {}
+
+
+NULL_PROFILER = NullProfiler()
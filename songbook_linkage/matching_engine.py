@@ -5,22 +5,190 @@ Implements three-tier confidence matching for Hawaiian songs
 
 import os
 import sys
+import json
+import heapq
+import argparse
+import itertools
 import psycopg2
+from psycopg2.extras import execute_values
 from datetime import datetime
-from typing import List, Dict, Tuple, Optional
+from collections.abc import Mapping
+from typing import List, Dict, Set, Tuple, Optional, Callable, Iterator
 from difflib import SequenceMatcher
 
 # Add current directory to path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from text_normalization import normalize_title, normalize_composer
+from database import get_connection, release_connection, require_credentials
+from text_normalization import normalize_title, normalize_composer, stored_or_normalized, title_match_keys
+from candidate_index import NGramIndex
+from vector_scoring import BatchSimilarityScorer, CosineCalibration
+from snapshot import Snapshot
+from composer_index import ComposerIndex
+from instrumentation import Profiler, NULL_PROFILER
+from scoring_details import build_scoring_details, serialize_scoring_details
+
+
+# Similarity algorithm used for each algorithm_version (unlisted versions use SequenceMatcher)
+SCORING_METHODS = {
+    'v1.0': 'sequence_matcher',
+    'v1.1-cosine': 'ngram_cosine'
+}
+
+# Minimum confidence for a pair to be kept as a potential match
+MINIMUM_CONFIDENCE = 20
+
+# Upper-bound stages tried before full SequenceMatcher ratios, cheapest first
+PRUNING_STAGES = ('length', 'composer_ratio', 'title_ratio', 'quick_ratio')
+
+# Stored normalized columns and the raw column / normalizer each one is derived from
+CANONICAL_NORMALIZED_FIELDS = [
+    ('normalized_title_hawaiian', 'canonical_title_hawaiian', normalize_title),
+    ('normalized_title_english', 'canonical_title_english', normalize_title),
+    ('normalized_composer', 'primary_composer', normalize_composer)
+]
+ENTRY_NORMALIZED_FIELDS = [
+    ('normalized_printed_title', 'printed_song_title', normalize_title),
+    ('normalized_composer', 'composer', normalize_composer)
+]
+
+# Exact-key tier: an unlinked entry whose sorted title tokens equal a canonical title's is
+# scored with that title as a 100% match and skips fuzzy scoring. Skeleton + leading word
+# ignores vowels, which tell Hawaiian words apart, so it only retrieves candidates that are
+# scored for real. Each rule is (columns, exact); columns are in title_match_keys order and
+# canonical columns add a _hawaiian / _english suffix.
+MATCH_KEY_COLUMNS = ('match_tokens', 'match_skeleton', 'match_leading')
+EXACT_KEY_RULES = [(('match_tokens',), True), (('match_skeleton', 'match_leading'), False)]
+EXACT_KEY_TITLES = [(0, 'hawaiian'), (1, 'english')]
+
+# One equi-join per title and rule, so each branch can be a hash join on the stored keys
+EXACT_KEY_MATCH_SQL = "\n    UNION ALL\n".join(
+    f"""
+    SELECT c.canonical_mele_id, e.id, {field}, {exact}
+    FROM canonical_mele c
+    JOIN songbook_entries e ON {' AND '.join(f'e.{column} = c.{column}_{title}' for column in columns)}
+    WHERE e.canonical_mele_id IS NULL AND c.canonical_mele_id = ANY(%(ids)s)"""
+    for field, title in EXACT_KEY_TITLES for columns, exact in EXACT_KEY_RULES
+)
+
+
+def rule_keys(match_keys: Tuple) -> List[Tuple[int, Tuple, bool]]:
+    """(rule, key values, exact) for each EXACT_KEY_RULES rule a title's match keys fully define"""
+    keyed = []
+    for rule, (columns, exact) in enumerate(EXACT_KEY_RULES):
+        values = tuple(match_keys[MATCH_KEY_COLUMNS.index(column)] for column in columns)
+        if None not in values:
+            keyed.append((rule, values, exact))
+    return keyed
+
+
+def group_exact_key_rows(rows) -> Dict[str, Dict[int, Set[int]]]:
+    """
+    canonical_mele_id → songbook entry id → title fields (0 Hawaiian, 1 English) matched exactly;
+    an empty set marks a candidate-only pair, which is scored without any forced title score
+    """
+    exact_matches = {}
+    for canonical_mele_id, entry_id, field, exact in rows:
+        fields = exact_matches.setdefault(canonical_mele_id, {}).setdefault(entry_id, set())
+        if exact:
+            fields.add(field)
+    return exact_matches
+
+
+class MatchResult(Mapping):
+    """
+    Compact match record. Reads like the old match dict (match['confidence'], .get, .items())
+    but stores only the raw similarities; scoring_details is built on first access.
+    """
+    
+    __slots__ = ('canonical_mele_id', 'songbook_entry', 'confidence', 'match_method', 'tier',
+                 'similarities', 'date_score', '_scoring_details')
+    
+    KEYS = ('canonical_mele_id', 'songbook_entry_id', 'songbook_entry', 'confidence',
+            'match_method', 'scoring_details', 'tier')
+    
+    def __init__(self, canonical_mele_id: str, songbook_entry: Dict, confidence: float, match_method: str,
+                 tier: str, similarities: Optional[Tuple[float, float, float]] = None, date_score: float = 0.0,
+                 scoring_details: Optional[Dict] = None):
+        self.canonical_mele_id = canonical_mele_id
+        self.songbook_entry = songbook_entry
+        self.confidence = confidence
+        self.match_method = match_method
+        self.tier = tier
+        # (Hawaiian title, English title, composer) similarities, 0-100
+        self.similarities = similarities
+        self.date_score = date_score
+        self._scoring_details = scoring_details
+    
+    @property
+    def songbook_entry_id(self) -> int:
+        return self.songbook_entry['id']
+    
+    @property
+    def scoring_details(self) -> Dict:
+        if self._scoring_details is None:
+            self._scoring_details = build_scoring_details(
+                *self.similarities, self.date_score, self.confidence, self.match_method
+            )
+        return self._scoring_details
+    
+    def __getitem__(self, key: str):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __iter__(self):
+        return iter(self.KEYS)
+    
+    def __len__(self) -> int:
+        return len(self.KEYS)
+    
+    def __repr__(self) -> str:
+        return (f"MatchResult({self.canonical_mele_id!r}, songbook_entry_id={self.songbook_entry_id!r}, "
+                f"confidence={self.confidence:.1f}, match_method={self.match_method!r}, tier={self.tier!r})")
+    
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+    
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
 
 
 class MatchingEngine:
     """Core engine for finding and scoring song matches between canonical and songbook entries"""
     
-    def __init__(self, algorithm_version="v1.0"):
+    def __init__(self, algorithm_version="v1.0", candidate_limit: Optional[int] = None,
+                 calibration: Optional[CosineCalibration] = None, use_stored_normalization: bool = False,
+                 bound_pruning: bool = True, snapshot: Optional[Snapshot] = None,
+                 profiler: Optional[Profiler] = None, composer_index: Optional[ComposerIndex] = None,
+                 exact_key_tier: bool = False, trigram_candidates: Optional[int] = None):
         self.algorithm_version = algorithm_version
+        # Read the normalized_* columns filled by populate_normalized_data instead of re-normalizing
+        self.use_stored_normalization = use_stored_normalization
+        self.scoring_method = SCORING_METHODS.get(algorithm_version, 'sequence_matcher')
+        # Maps n-gram cosine scores onto the SequenceMatcher 0-100 scale (v1.1-cosine only)
+        self.calibration = calibration
+        if self.scoring_method == 'ngram_cosine' and self.calibration is None:
+            self.calibration = CosineCalibration.load()
+        # When set, only the top-K entries from the n-gram candidate index are fully scored
+        self.candidate_limit = candidate_limit
+        # Skip full SequenceMatcher ratios for pairs whose upper bound is below the threshold
+        self.bound_pruning = bound_pruning
+        # Read songs and entries from a memory-mapped snapshot (snapshot.py) instead of the database
+        self.snapshot = snapshot
+        # Timing spans and counters (instrumentation.py); a no-op unless a Profiler is given
+        self.profiler = profiler or NULL_PROFILER
+        # Resolves composer spellings to composer identities (composer_index.py); SequenceMatcher
+        # scoring only: same-identity pairs score 100 and unresolved spellings stay fuzzy
+        self.composer_index = composer_index
+        # Bulk runs resolve entries sharing a title match key with a song before fuzzy scoring
+        self.exact_key_tier = exact_key_tier
+        # When set, find_matches_for_song asks Postgres (pg_trgm) for this many most similar
+        # unlinked entries and scores only those, instead of fetching every unlinked entry
+        self.trigram_candidates = trigram_candidates
+        # Pairs seen by bound pruning and how many were rejected at each stage
+        self.pruning_stats = dict.fromkeys(PRUNING_STAGES + ('pairs', 'scored'), 0)
         self.confidence_thresholds = {
             'high': 95,      # Auto-link without review
             'medium': 70,    # Queue for human review  
@@ -28,14 +196,15 @@ class MatchingEngine:
         }
     
     def get_database_connection(self):
-        """Get database connection using existing credentials"""
-        return psycopg2.connect(
-            host='ep-young-silence-ad9wue88-pooler.c-2.us-east-1.aws.neon.tech',
-            port=5432,
-            database='neondb',
-            user='neondb_owner',
-            password=os.getenv('PGPASSWORD', '')
-        )
+        """Check a connection out of the shared pool (see database.py)"""
+        with self.profiler.span('connect'):
+            conn = get_connection()
+        self.profiler.count('connections_opened')
+        return conn
+    
+    def release_database_connection(self, conn):
+        """Return a connection to the shared pool"""
+        release_connection(conn)
     
     def calculate_title_similarity(self, title1: str, title2: str) -> float:
         """Calculate similarity between two normalized titles using sequence matching"""
@@ -43,72 +212,265 @@ class MatchingEngine:
             return 0.0
         
         # Normalize both titles
-        norm1 = normalize_title(title1)
-        norm2 = normalize_title(title2)
+        with self.profiler.span('normalize'):
+            norm1 = normalize_title(title1)
+            norm2 = normalize_title(title2)
         
-        if norm1 == norm2:
-            return 100.0  # Exact match
-        
-        # Use sequence matcher for fuzzy matching
-        similarity = SequenceMatcher(None, norm1, norm2).ratio()
-        return similarity * 100
+        return self.calculate_normalized_similarity(norm1, norm2)
     
     def calculate_composer_similarity(self, composer1: str, composer2: str) -> float:
         """Calculate similarity between composer names"""
         if not composer1 or not composer2:
             return 0.0
         
+        if self.composer_index is not None:
+            return self.composer_index.similarity(
+                composer1, composer2, lambda: self._fuzzy_composer_similarity(composer1, composer2)
+            )
+        return self._fuzzy_composer_similarity(composer1, composer2)
+    
+    def _fuzzy_composer_similarity(self, composer1: str, composer2: str) -> float:
         # Normalize both composers
-        norm1 = normalize_composer(composer1)
-        norm2 = normalize_composer(composer2)
+        with self.profiler.span('normalize'):
+            norm1 = normalize_composer(composer1)
+            norm2 = normalize_composer(composer2)
         
+        return self.calculate_normalized_similarity(norm1, norm2)
+    
+    def calculate_normalized_similarity(self, norm1: str, norm2: str) -> float:
+        """Calculate similarity between two already-normalized strings"""
         if norm1 == norm2:
             return 100.0  # Exact match
         
         # Use sequence matcher for fuzzy matching
-        similarity = SequenceMatcher(None, norm1, norm2).ratio()
+        with self.profiler.span('sequence_matcher'):
+            similarity = SequenceMatcher(None, norm1, norm2).ratio()
         return similarity * 100
     
-    def calculate_confidence_score(self, canonical_song: Dict, songbook_entry: Dict) -> Tuple[float, str, Dict]:
+    def calculate_confidence_score(self, canonical_song: Dict, songbook_entry: Dict,
+                                   min_score: Optional[float] = None) -> Optional[Tuple[float, str, Dict]]:
         """
         Calculate confidence score for a potential match
         Returns: (confidence_score, match_method, scoring_details)
+        With min_score, SequenceMatcher scoring first checks cheap upper bounds and
+        returns None for pairs that cannot reach it (see pruning_stats)
         """
-        scoring_details = {}
-        total_score = 0.0
-        match_method = "fuzzy"
+        similarities = self.calculate_similarities(canonical_song, songbook_entry, min_score)
+        if similarities is None:
+            return None
+        return self.combine_similarities(*similarities, songbook_entry)
+    
+    def calculate_similarities(self, canonical_song: Dict, songbook_entry: Dict,
+                               min_score: Optional[float] = None) -> Optional[Tuple[float, float, float]]:
+        """Hawaiian title, English title and composer similarities (None when pruned below min_score)"""
+        if self.scoring_method == 'ngram_cosine':
+            # Score the single pair through the batch scorer so results match bulk runs
+            scorer = BatchSimilarityScorer([songbook_entry], self.calibration)
+            similarities = scorer.similarities(canonical_song)
+            return (float(similarities['title_hawaiian_similarity'][0]),
+                    float(similarities['title_english_similarity'][0]),
+                    float(similarities['composer_similarity'][0]))
+        
+        if min_score is not None:
+            return self._pruned_similarities(canonical_song, songbook_entry, min_score)
         
         # Title matching (50 points max)
         title_hawaiian = canonical_song.get('canonical_title_hawaiian', '')
         title_english = canonical_song.get('canonical_title_english', '')
         songbook_title = songbook_entry.get('printed_song_title', '')
         
-        # Try both Hawaiian and English titles
-        hawaiian_similarity = self.calculate_title_similarity(title_hawaiian, songbook_title)
-        english_similarity = self.calculate_title_similarity(title_english, songbook_title)
+        # Composer matching (30 points max)
+        canonical_composer = canonical_song.get('primary_composer', '')
+        songbook_composer = songbook_entry.get('composer', '')
         
-        # Use the better title match
-        title_score = max(hawaiian_similarity, english_similarity) * 0.5  # Scale to 50 points
-        total_score += title_score
+        if self.use_stored_normalization:
+            hawaiian_similarity, english_similarity, composer_similarity = self._stored_similarities(
+                canonical_song, songbook_entry
+            )
+        else:
+            # Try both Hawaiian and English titles
+            hawaiian_similarity = self.calculate_title_similarity(title_hawaiian, songbook_title)
+            english_similarity = self.calculate_title_similarity(title_english, songbook_title)
+            
+            composer_similarity = self.calculate_composer_similarity(canonical_composer, songbook_composer)
+        
+        return hawaiian_similarity, english_similarity, composer_similarity
+    
+    def _stored_similarities(self, canonical_song: Dict, songbook_entry: Dict,
+                             exact_fields: Set[int] = frozenset()) -> Tuple[float, float, float]:
+        """
+        Title and composer similarities scored directly on stored normalized strings
+        (fields in exact_fields are known exact matches: 100, not scored)
+        """
+        songbook_title = stored_or_normalized(songbook_entry, 'normalized_printed_title',
+                                                 'printed_song_title', normalize_title)
+        similarities = []
+        
+        for field, (normalized_key, raw_key, normalize) in enumerate(CANONICAL_NORMALIZED_FIELDS):
+            if field in exact_fields:
+                similarities.append(100.0)
+                continue
+            if raw_key == 'primary_composer':
+                raw_other, other = 'composer', stored_or_normalized(
+                    songbook_entry, 'normalized_composer', 'composer', normalize_composer
+                )
+            else:
+                raw_other, other = 'printed_song_title', songbook_title
+            
+            # Empty raw values never match, as in calculate_title_similarity
+            if not canonical_song.get(raw_key) or not songbook_entry.get(raw_other):
+                similarities.append(0.0)
+            else:
+                normalized = stored_or_normalized(canonical_song, normalized_key, raw_key, normalize)
+                if raw_key == 'primary_composer':
+                    similarities.append(self._composer_pair_similarity(
+                        canonical_song, songbook_entry, (normalized, other)
+                    ))
+                else:
+                    similarities.append(self.calculate_normalized_similarity(normalized, other))
+        
+        return similarities[0], similarities[1], similarities[2]
+    
+    def _composer_pair_similarity(self, canonical_song: Dict, songbook_entry: Dict,
+                                  pair: Tuple[str, str]) -> float:
+        """Composer similarity from already-normalized strings, through the composer index when set"""
+        if self.composer_index is None:
+            return self.calculate_normalized_similarity(*pair)
+        return self.composer_index.similarity(
+            canonical_song['primary_composer'], songbook_entry['composer'],
+            lambda: self.calculate_normalized_similarity(*pair)
+        )
+    
+    def _normalized_pairs(self, canonical_song: Dict, songbook_entry: Dict) -> List[Optional[Tuple[str, str]]]:
+        """
+        Normalized (canonical, songbook) strings for the Hawaiian title, English title and composer,
+        or None where a raw value is empty and the similarity is 0
+        """
+        pairs = []
+        for (normalized_key, raw_key, normalize), (other_normalized_key, other_raw_key, _) in zip(
+                CANONICAL_NORMALIZED_FIELDS,
+                [ENTRY_NORMALIZED_FIELDS[0], ENTRY_NORMALIZED_FIELDS[0], ENTRY_NORMALIZED_FIELDS[1]]):
+            if not canonical_song.get(raw_key) or not songbook_entry.get(other_raw_key):
+                pairs.append(None)
+            elif self.use_stored_normalization:
+                pairs.append((stored_or_normalized(canonical_song, normalized_key, raw_key, normalize),
+                              stored_or_normalized(songbook_entry, other_normalized_key, other_raw_key, normalize)))
+            else:
+                pairs.append((normalize(canonical_song[raw_key]), normalize(songbook_entry[other_raw_key])))
+        return pairs
+    
+    def _pruned_similarities(self, canonical_song: Dict, songbook_entry: Dict,
+                             min_score: float) -> Optional[Tuple[float, float, float]]:
+        """
+        Hawaiian title, English title and composer similarities, or None once an upper bound
+        on the confidence falls below min_score. Bounds start from the length ratio (what
+        real_quick_ratio computes) and are replaced with exact ratios one field at a time,
+        composer first since every kept pair needs it; the lower-bounded title falls back to
+        quick_ratio while pruning is still possible. Bounds never undershoot ratio(), so
+        kept pairs score exactly as without pruning.
+        """
+        stats = self.pruning_stats
+        stats['pairs'] += 1
+        date_score = self.publication_date_score(songbook_entry)
+        with self.profiler.span('normalize'):
+            pairs = self._normalized_pairs(canonical_song, songbook_entry)
+        bounds = []
+        # Fields whose bound still has to be replaced by a full ratio
+        pending = []
+        
+        # Same composer identity (or an already compared pair): the exact score is known up front
+        known_composer = None
+        if self.composer_index is not None and pairs[2] is not None:
+            known_composer = self.composer_index.known_similarity(
+                canonical_song['primary_composer'], songbook_entry['composer']
+            )
+        
+        for field, pair in enumerate(pairs):
+            if pair is None:
+                bounds.append(0.0)
+                pending.append(False)
+            elif field == 2 and known_composer is not None:
+                bounds.append(known_composer)
+                pending.append(False)
+            elif pair[0] == pair[1]:
+                bounds.append(100.0)  # Exact match
+                pending.append(False)
+            else:
+                length_a, length_b = len(pair[0]), len(pair[1])
+                bounds.append(2.0 * min(length_a, length_b) / (length_a + length_b) * 100)
+                pending.append(True)
+        
+        # Same arithmetic as combine_similarities, so a bound below min_score is a score below it
+        def upper_bound(hawaiian, english, composer):
+            return max(hawaiian, english) * 0.5 + composer * 0.3 + date_score
+        
+        if upper_bound(*bounds) < min_score:
+            stats['length'] += 1
+            return None
+        
+        similarities = list(bounds)
+        if pending[2]:
+            similarities[2] = self._composer_pair_similarity(canonical_song, songbook_entry, pairs[2])
+            if upper_bound(*similarities) < min_score:
+                stats['composer_ratio'] += 1
+                return None
+        
+        # Exact ratio for the title with the higher bound; the other can only raise the maximum
+        first, second = (0, 1) if bounds[0] >= bounds[1] else (1, 0)
+        if pending[first]:
+            similarities[first] = self.calculate_normalized_similarity(*pairs[first])
+            if upper_bound(*similarities) < min_score:
+                stats['title_ratio'] += 1
+                return None
+        
+        if pending[second]:
+            with self.profiler.span('sequence_matcher'):
+                matcher = SequenceMatcher(None, *pairs[second])
+                similarities[second] = 0.0
+                if upper_bound(*similarities) < min_score:
+                    # Only the second title can still lift the pair over min_score
+                    similarities[second] = matcher.quick_ratio() * 100
+                    if upper_bound(*similarities) < min_score:
+                        stats['quick_ratio'] += 1
+                        return None
+                similarities[second] = matcher.ratio() * 100
+        
+        stats['scored'] += 1
+        return similarities[0], similarities[1], similarities[2]
+    
+    def publication_date_score(self, songbook_entry: Dict) -> float:
+        """Points for having publication data"""
+        pub_year = songbook_entry.get('pub_year')
+        if pub_year and str(pub_year).isdigit():
+            return 5.0  # Modest boost for having publication data
+        return 0.0
+    
+    def combine_similarities(self, hawaiian_similarity: float, english_similarity: float,
+                             composer_similarity: float, songbook_entry: Dict) -> Tuple[float, str, Dict]:
+        """
+        Weight title/composer similarities (0-100) and publication data into a confidence score
+        Returns: (confidence_score, match_method, scoring_details)
+        """
+        total_score, match_method, date_score = self.combine_scores(
+            hawaiian_similarity, english_similarity, composer_similarity, songbook_entry
+        )
+        scoring_details = build_scoring_details(hawaiian_similarity, english_similarity, composer_similarity,
+                                                date_score, total_score, match_method)
+        return total_score, match_method, scoring_details
+    
+    def combine_scores(self, hawaiian_similarity: float, english_similarity: float,
+                       composer_similarity: float, songbook_entry: Dict) -> Tuple[float, str, float]:
+        """combine_similarities without the details dict: (confidence_score, match_method, date_score)"""
+        match_method = "fuzzy"
         
-        scoring_details['title_hawaiian_similarity'] = hawaiian_similarity
-        scoring_details['title_english_similarity'] = english_similarity
-        scoring_details['title_score'] = title_score
+        # Use the better title match
+        total_score = max(hawaiian_similarity, english_similarity) * 0.5  # Scale to 50 points
         
         # Exact title match gets special treatment
         if hawaiian_similarity >= 95 or english_similarity >= 95:
             match_method = "exact"
         
-        # Composer matching (30 points max)
-        canonical_composer = canonical_song.get('primary_composer', '')
-        songbook_composer = songbook_entry.get('composer', '')
-        
-        composer_similarity = self.calculate_composer_similarity(canonical_composer, songbook_composer)
-        composer_score = composer_similarity * 0.3  # Scale to 30 points
-        total_score += composer_score
-        
-        scoring_details['composer_similarity'] = composer_similarity
-        scoring_details['composer_score'] = composer_score
+        total_score += composer_similarity * 0.3  # Scale to 30 points
         
         # Composer confirmation boosts confidence
         if composer_similarity >= 80:
@@ -116,88 +478,477 @@ class MatchingEngine:
         
         # Publication date relevance (10 points max)
         # For now, give modest boost if publication year exists
-        pub_year = songbook_entry.get('pub_year')
-        if pub_year and str(pub_year).isdigit():
-            date_score = 5.0  # Modest boost for having publication data
+        date_score = self.publication_date_score(songbook_entry)
+        if date_score:
             total_score += date_score
-            scoring_details['date_score'] = date_score
         
         # Multiple songbook appearances (5 points each - future enhancement)
         # This would require checking for other entries with same canonical_mele_id
         
-        scoring_details['total_score'] = total_score
-        scoring_details['match_method'] = match_method
+        return total_score, match_method, date_score
+    
+    def _canonical_columns(self) -> List[str]:
+        """canonical_mele columns loaded for matching"""
+        columns = ['canonical_mele_id', 'canonical_title_hawaiian', 'canonical_title_english', 'primary_composer']
+        if self.use_stored_normalization:
+            columns += [normalized_key for normalized_key, _, _ in CANONICAL_NORMALIZED_FIELDS]
+        return columns
+    
+    def _entry_columns(self) -> List[str]:
+        """songbook_entries columns loaded for matching"""
+        columns = ['id', 'printed_song_title', 'composer', 'pub_year', 'songbook_name']
+        if self.use_stored_normalization:
+            columns += [normalized_key for normalized_key, _, _ in ENTRY_NORMALIZED_FIELDS]
+        return columns
+    
+    def _fill_missing_normalized(self, record: Dict, fields: List[Tuple]) -> Dict:
+        """Normalize only the fields whose stored normalized column is NULL"""
+        for normalized_key, raw_key, normalize in fields:
+            if record.get(normalized_key) is None:
+                record[normalized_key] = normalize(record.get(raw_key) or '')
+        return record
+    
+    def _canonical_song_from_row(self, row) -> Dict:
+        """Build a canonical song dict from a canonical_mele row"""
+        canonical_song = dict(zip(self._canonical_columns(), row))
+        if self.use_stored_normalization:
+            self._fill_missing_normalized(canonical_song, CANONICAL_NORMALIZED_FIELDS)
+        return canonical_song
+    
+    def _songbook_entry_from_row(self, row) -> Dict:
+        """Build a songbook entry dict from a songbook_entries row"""
+        songbook_entry = dict(zip(self._entry_columns(), row))
+        if self.use_stored_normalization:
+            self._fill_missing_normalized(songbook_entry, ENTRY_NORMALIZED_FIELDS)
+        return songbook_entry
+    
+    def fetch_canonical_songs(self, cursor, canonical_ids: Optional[List[str]] = None) -> List[Dict]:
+        """Load canonical songs (all of them, or only the given ids) in a single query"""
+        columns = ', '.join(self._canonical_columns())
+        if canonical_ids is None:
+            cursor.execute(f"""
+                SELECT {columns}
+                FROM canonical_mele 
+                ORDER BY canonical_mele_id
+            """)
+        else:
+            cursor.execute(f"""
+                SELECT {columns}
+                FROM canonical_mele 
+                WHERE canonical_mele_id = ANY(%s)
+                ORDER BY canonical_mele_id
+            """, (list(canonical_ids),))
         
-        return total_score, match_method, scoring_details
+        return [self._canonical_song_from_row(row) for row in self._fetch_rows(cursor)]
     
-    def find_matches_for_song(self, canonical_mele_id: str) -> List[Dict]:
-        """Find all potential matches for a specific canonical song"""
+    def fetch_unlinked_entries(self, cursor) -> List[Dict]:
+        """Load all songbook entries that don't already have a canonical link"""
+        columns = ', '.join(self._entry_columns())
+        cursor.execute(f"""
+            SELECT {columns}
+            FROM songbook_entries 
+            WHERE canonical_mele_id IS NULL
+            ORDER BY id
+        """)
+        
+        return [self._songbook_entry_from_row(row) for row in self._fetch_rows(cursor)]
+    
+    def fetch_trigram_candidates(self, cursor, canonical_song: Dict, limit: int) -> List[Dict]:
+        """
+        The `limit` unlinked entries most similar to a canonical song by pg_trgm similarity() on the
+        stored normalized columns (weighted like calculate_confidence_score), in id order. Only rows
+        passing the `%` threshold on a title or the composer are considered, so the GIN trigram
+        indexes from setup_database.py --trigram do the filtering.
+        """
+        columns = ', '.join(f"e.{column}" for column in self._entry_columns())
+        params = {
+            'hawaiian': stored_or_normalized(canonical_song, 'normalized_title_hawaiian',
+                                             'canonical_title_hawaiian', normalize_title),
+            'english': stored_or_normalized(canonical_song, 'normalized_title_english',
+                                            'canonical_title_english', normalize_title),
+            'composer': stored_or_normalized(canonical_song, 'normalized_composer',
+                                             'primary_composer', normalize_composer),
+            'limit': limit
+        }
+        try:
+            cursor.execute(f"""
+                SELECT {', '.join(self._entry_columns())}
+                FROM (
+                    SELECT {columns}
+                    FROM songbook_entries e
+                    WHERE e.canonical_mele_id IS NULL
+                    AND (e.normalized_printed_title %% %(hawaiian)s
+                         OR e.normalized_printed_title %% %(english)s
+                         OR e.normalized_composer %% %(composer)s)
+                    ORDER BY coalesce(GREATEST(similarity(e.normalized_printed_title, %(hawaiian)s),
+                                               similarity(e.normalized_printed_title, %(english)s)), 0) * 0.5
+                             + coalesce(similarity(e.normalized_composer, %(composer)s), 0) * 0.3 DESC,
+                             e.id
+                    LIMIT %(limit)s
+                ) AS candidates
+                ORDER BY id
+            """, params)
+        except psycopg2.errors.UndefinedFunction as e:
+            raise RuntimeError("Trigram candidates need the pg_trgm extension: "
+                               "run setup_database.py --trigram") from e
+        
+        return [self._songbook_entry_from_row(row) for row in self._fetch_rows(cursor)]
+    
+    def _fetch_rows(self, cursor, size: Optional[int] = None) -> List[Tuple]:
+        """fetchall (or fetchmany(size)) timed under the 'fetch' span and counted as rows_fetched"""
+        with self.profiler.span('fetch'):
+            rows = cursor.fetchall() if size is None else cursor.fetchmany(size)
+        self.profiler.count('rows_fetched', len(rows))
+        return rows
+    
+    def snapshot_canonical_songs(self, canonical_ids: Optional[List[str]] = None) -> List[Dict]:
+        """fetch_canonical_songs equivalent reading from the snapshot"""
+        wanted = set(canonical_ids) if canonical_ids is not None else None
+        return [
+            self._canonical_song_from_row(row)
+            for row in self.snapshot.table('canonical_mele').iter_rows(self._canonical_columns())
+            if wanted is None or row[0] in wanted
+        ]
+    
+    def iter_snapshot_unlinked_entries(self) -> Iterator[Dict]:
+        """fetch_unlinked_entries equivalent streaming from the snapshot"""
+        columns = self._entry_columns()
+        for row in self.snapshot.table('songbook_entries').iter_rows(columns + ['canonical_mele_id']):
+            if row[-1] is None:
+                yield self._songbook_entry_from_row(row[:-1])
+    
+    def load_matching_data(self, canonical_ids: Optional[List[str]] = None) -> Tuple[List[Dict], List[Dict]]:
+        """Canonical songs (all, or the given ids) and unlinked entries, from the snapshot or the database"""
+        if self.snapshot is not None:
+            with self.profiler.span('fetch'):
+                canonical_songs = self.snapshot_canonical_songs(canonical_ids)
+                songbook_entries = list(self.iter_snapshot_unlinked_entries())
+            self.profiler.count('rows_fetched', len(canonical_songs) + len(songbook_entries))
+            return canonical_songs, songbook_entries
+        
         conn = self.get_database_connection()
         cursor = conn.cursor()
         
         try:
-            # Get canonical song data
-            cursor.execute("""
-                SELECT canonical_mele_id, canonical_title_hawaiian, canonical_title_english, primary_composer
-                FROM canonical_mele 
-                WHERE canonical_mele_id = %s
-            """, (canonical_mele_id,))
+            canonical_songs = self.fetch_canonical_songs(cursor, canonical_ids)
+            songbook_entries = self.fetch_unlinked_entries(cursor)
+        finally:
+            cursor.close()
+            self.release_database_connection(conn)
+        
+        return canonical_songs, songbook_entries
+    
+    def fetch_exact_key_matches(self, cursor, canonical_ids: List[str]) -> Dict[str, Dict[int, Set[int]]]:
+        """Exact-key matches of the given songs, from one join on the stored match-key columns"""
+        with self.profiler.span('exact_keys'):
+            cursor.execute(EXACT_KEY_MATCH_SQL, {'ids': list(canonical_ids)})
+            rows = self._fetch_rows(cursor)
+        return group_exact_key_rows(rows)
+    
+    def find_exact_key_matches(self, canonical_songs: List[Dict],
+                               songbook_entries: List[Dict]) -> Dict[str, Dict[int, Set[int]]]:
+        """fetch_exact_key_matches equivalent on loaded rows, hashing keys computed from the raw titles"""
+        with self.profiler.span('exact_keys'):
+            entries_by_key = {}
+            for entry in songbook_entries:
+                for rule, values, _ in rule_keys(title_match_keys(entry.get('printed_song_title'))):
+                    entries_by_key.setdefault((rule, values), []).append(entry['id'])
+            
+            rows = []
+            for canonical_song in canonical_songs:
+                for field, raw_key in enumerate(['canonical_title_hawaiian', 'canonical_title_english']):
+                    for rule, values, exact in rule_keys(title_match_keys(canonical_song.get(raw_key))):
+                        rows.extend((canonical_song['canonical_mele_id'], entry_id, field, exact)
+                                    for entry_id in entries_by_key.get((rule, values), []))
+        return group_exact_key_rows(rows)
+    
+    def load_exact_key_matches(self, canonical_ids: List[str], canonical_songs: List[Dict],
+                               songbook_entries: List[Dict]) -> Optional[Dict[str, Dict[int, Set[int]]]]:
+        """Exact-key matches for a bulk run (None unless exact_key_tier), from the snapshot or the database"""
+        if not self.exact_key_tier:
+            return None
+        if self.snapshot is not None:
+            return self.find_exact_key_matches(canonical_songs, songbook_entries)
+        
+        conn = self.get_database_connection()
+        cursor = conn.cursor()
+        
+        try:
+            return self.fetch_exact_key_matches(cursor, canonical_ids)
+        finally:
+            cursor.close()
+            self.release_database_connection(conn)
+    
+    def check_normalization_consistency(self) -> List[Dict]:
+        """
+        Flag rows whose stored normalized columns are missing or no longer match
+        what the current normalizer produces for the raw text
+        """
+        conn = self.get_database_connection()
+        cursor = conn.cursor()
+        stale = []
+        
+        checks = [
+            ('canonical_mele', 'canonical_mele_id', CANONICAL_NORMALIZED_FIELDS),
+            ('songbook_entries', 'id', ENTRY_NORMALIZED_FIELDS)
+        ]
+        
+        try:
+            for table, id_column, fields in checks:
+                columns = [id_column]
+                for normalized_key, raw_key, _ in fields:
+                    columns += [raw_key, normalized_key]
+                
+                cursor.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {id_column}")
+                
+                for row in cursor.fetchall():
+                    record = dict(zip(columns, row))
+                    for normalized_key, raw_key, normalize in fields:
+                        expected = normalize(record[raw_key]) if record[raw_key] else ""
+                        if record[normalized_key] != expected:
+                            stale.append({
+                                'table': table,
+                                'id': record[id_column],
+                                'column': normalized_key,
+                                'stored': record[normalized_key],
+                                'expected': expected
+                            })
             
-            canonical_data = cursor.fetchone()
-            if not canonical_data:
+            return stale
+        
+        finally:
+            cursor.close()
+            self.release_database_connection(conn)
+    
+    def score_song_against_entries(self, canonical_song: Dict, songbook_entries: List[Dict],
+                                   candidate_index: Optional[NGramIndex] = None,
+                                   batch_scorer: Optional[BatchSimilarityScorer] = None) -> List[MatchResult]:
+        """Score one canonical song against in-memory songbook entries, best matches first"""
+        with self.profiler.span('score'):
+            matches = self._score_song_against_entries(canonical_song, songbook_entries,
+                                                       candidate_index, batch_scorer)
+        self.profiler.count('matches_found', len(matches))
+        return matches
+    
+    def _score_song_against_entries(self, canonical_song: Dict, songbook_entries: List[Dict],
+                                    candidate_index: Optional[NGramIndex],
+                                    batch_scorer: Optional[BatchSimilarityScorer]) -> List[MatchResult]:
+        """score_song_against_entries without the 'score' span"""
+        canonical_mele_id = canonical_song['canonical_mele_id']
+        matches = []
+        
+        if self.candidate_limit is not None:
+            if candidate_index is None:
+                candidate_index = NGramIndex(songbook_entries)
+            songbook_entries = candidate_index.top_candidates(canonical_song, self.candidate_limit, songbook_entries)
+        
+        self.profiler.count('pairs_scored', len(songbook_entries))
+        for songbook_entry, similarities in zip(
+                songbook_entries, self._score_entries(canonical_song, songbook_entries, batch_scorer)):
+            if similarities is None:
+                continue  # Pruned: cannot reach the minimum threshold
+            
+            # Only include matches above minimum threshold (20% similarity)
+            match = self.match_from_similarities(canonical_mele_id, songbook_entry, similarities)
+            if match is not None:
+                matches.append(match)
+        
+        # Sort by confidence (highest first)
+        matches.sort(key=lambda match: match.confidence, reverse=True)
+        
+        return matches
+    
+    def match_from_similarities(self, canonical_mele_id: str, songbook_entry: Dict,
+                                similarities: Tuple[float, float, float]) -> Optional[MatchResult]:
+        """MatchResult for a scored pair, or None below MINIMUM_CONFIDENCE"""
+        confidence, method, date_score = self.combine_scores(*similarities, songbook_entry)
+        if confidence < MINIMUM_CONFIDENCE:
+            return None
+        return MatchResult(canonical_mele_id, songbook_entry, confidence, method,
+                           self.get_confidence_tier(confidence), similarities, date_score)
+    
+    def exact_key_match(self, canonical_song: Dict, songbook_entry: Dict,
+                        title_fields: Set[int]) -> Optional[MatchResult]:
+        """
+        Match for an exact-key pair: the exactly matched titles count as 100% without being
+        scored, the rest is scored as usual (everything, for a candidate-only pair);
+        None below MINIMUM_CONFIDENCE
+        """
+        if not title_fields or self.scoring_method == 'ngram_cosine':
+            # The n-gram scorer computes all three fields in one pass, so there is nothing to skip
+            similarities = list(self.calculate_similarities(canonical_song, songbook_entry))
+            for field in title_fields:
+                similarities[field] = 100.0
+        elif self.use_stored_normalization:
+            similarities = self._stored_similarities(canonical_song, songbook_entry, title_fields)
+        else:
+            songbook_title = songbook_entry.get('printed_song_title', '')
+            similarities = [
+                100.0 if field in title_fields else self.calculate_title_similarity(canonical_song.get(raw_key, ''),
+                                                                                     songbook_title)
+                for field, raw_key in enumerate(('canonical_title_hawaiian', 'canonical_title_english'))
+            ]
+            similarities.append(self.calculate_composer_similarity(canonical_song.get('primary_composer', ''),
+                                                                   songbook_entry.get('composer', '')))
+        return self.match_from_similarities(canonical_song['canonical_mele_id'], songbook_entry, tuple(similarities))
+    
+    def build_match_record(self, canonical_mele_id: str, songbook_entry: Dict, confidence: float,
+                           method: str, details: Dict) -> MatchResult:
+        """Match record in the shape returned by find_matches_for_song, from already-built details"""
+        return MatchResult(canonical_mele_id, songbook_entry, confidence, method,
+                           self.get_confidence_tier(confidence), scoring_details=details)
+    
+    def _score_entries(self, canonical_song: Dict, songbook_entries: List[Dict],
+                       batch_scorer: Optional[BatchSimilarityScorer] = None):
+        """
+        Yield (Hawaiian, English, composer) similarities for each entry, batch-scoring when the
+        algorithm allows (None for entries bound pruning proved to be below the minimum threshold)
+        """
+        if self.scoring_method != 'ngram_cosine':
+            min_score = MINIMUM_CONFIDENCE if self.bound_pruning else None
+            for songbook_entry in songbook_entries:
+                yield self.calculate_similarities(canonical_song, songbook_entry, min_score)
+            return
+        
+        if batch_scorer is None:
+            batch_scorer = BatchSimilarityScorer(songbook_entries, self.calibration)
+        similarities = batch_scorer.similarities(canonical_song, songbook_entries)
+        
+        yield from zip(
+            similarities['title_hawaiian_similarity'].tolist(),
+            similarities['title_english_similarity'].tolist(),
+            similarities['composer_similarity'].tolist()
+        )
+    
+    def find_matches_for_song(self, canonical_mele_id: str) -> List[MatchResult]:
+        """Find all potential matches for a specific canonical song"""
+        if self.snapshot is not None:
+            canonical_songs, songbook_entries = self.load_matching_data([canonical_mele_id])
+            if not canonical_songs:
+                return []
+            return self.score_song_against_entries(canonical_songs[0], songbook_entries)
+        
+        conn = self.get_database_connection()
+        cursor = conn.cursor()
+        
+        try:
+            canonical_songs = self.fetch_canonical_songs(cursor, [canonical_mele_id])
+            if not canonical_songs:
                 return []
             
-            canonical_song = {
-                'canonical_mele_id': canonical_data[0],
-                'canonical_title_hawaiian': canonical_data[1],
-                'canonical_title_english': canonical_data[2],
-                'primary_composer': canonical_data[3]
-            }
+            if self.trigram_candidates is not None:
+                songbook_entries = self.fetch_trigram_candidates(cursor, canonical_songs[0], self.trigram_candidates)
+            else:
+                songbook_entries = self.fetch_unlinked_entries(cursor)
             
-            # Get all songbook entries that don't already have a canonical link
-            cursor.execute("""
-                SELECT id, printed_song_title, composer, pub_year, songbook_name
+            return self.score_song_against_entries(canonical_songs[0], songbook_entries)
+        
+        finally:
+            cursor.close()
+            self.release_database_connection(conn)
+    
+    def iter_matches(self, canonical_mele_id: str, top_k: Optional[int] = None,
+                     batch_size: int = 1000) -> Iterator[MatchResult]:
+        """
+        Stream matches for one canonical song from a server-side cursor over the unlinked entries
+        (or straight from the snapshot when one is attached).
+        Without top_k, matches are yielded as they are scored (songbook entry id order).
+        With top_k, only the best K are kept in a heap and yielded at the end, best first,
+        in the same order as find_matches_for_song()[:top_k]; once the heap is full its
+        weakest score also raises the bound-pruning threshold.
+        """
+        if self.snapshot is not None:
+            canonical_songs = self.snapshot_canonical_songs([canonical_mele_id])
+            if not canonical_songs:
+                return
+            if self.candidate_limit is not None:
+                matches = self.score_song_against_entries(canonical_songs[0], list(self.iter_snapshot_unlinked_entries()))
+                yield from (matches if top_k is None else matches[:top_k])
+                return
+            
+            entries = self.iter_snapshot_unlinked_entries()
+            batches = iter(lambda: list(itertools.islice(entries, batch_size)), [])
+            yield from self._stream_matches(canonical_songs[0], batches, top_k)
+            return
+        
+        conn = self.get_database_connection()
+        cursor = conn.cursor()
+        entry_cursor = None
+        
+        try:
+            canonical_songs = self.fetch_canonical_songs(cursor, [canonical_mele_id])
+            if not canonical_songs:
+                return
+            canonical_song = canonical_songs[0]
+            
+            if self.candidate_limit is not None:
+                # The candidate shortlist ranks the whole table, so it cannot be streamed
+                matches = self.score_song_against_entries(canonical_song, self.fetch_unlinked_entries(cursor))
+                yield from (matches if top_k is None else matches[:top_k])
+                return
+            
+            entry_cursor = conn.cursor(name='iter_matches_entries')
+            entry_cursor.itersize = batch_size
+            entry_cursor.execute(f"""
+                SELECT {', '.join(self._entry_columns())}
                 FROM songbook_entries 
                 WHERE canonical_mele_id IS NULL
                 ORDER BY id
             """)
             
-            songbook_entries = cursor.fetchall()
-            matches = []
-            
-            for entry_data in songbook_entries:
-                songbook_entry = {
-                    'id': entry_data[0],
-                    'printed_song_title': entry_data[1],
-                    'composer': entry_data[2],
-                    'pub_year': entry_data[3],
-                    'songbook_name': entry_data[4]
-                }
-                
-                # Calculate confidence score
-                confidence, method, details = self.calculate_confidence_score(canonical_song, songbook_entry)
-                
-                # Only include matches above minimum threshold (20% similarity)
-                if confidence >= 20:
-                    match_record = {
-                        'canonical_mele_id': canonical_mele_id,
-                        'songbook_entry_id': songbook_entry['id'],
-                        'songbook_entry': songbook_entry,
-                        'confidence': confidence,
-                        'match_method': method,
-                        'scoring_details': details,
-                        'tier': self.get_confidence_tier(confidence)
-                    }
-                    matches.append(match_record)
-            
-            # Sort by confidence (highest first)
-            matches.sort(key=lambda x: x['confidence'], reverse=True)
-            
-            return matches
-            
+            batches = (
+                [self._songbook_entry_from_row(row) for row in rows]
+                for rows in iter(lambda: self._fetch_rows(entry_cursor, batch_size), [])
+            )
+            yield from self._stream_matches(canonical_song, batches, top_k)
+        
         finally:
+            if entry_cursor is not None:
+                entry_cursor.close()
             cursor.close()
-            conn.close()
+            self.release_database_connection(conn)
+    
+    def _stream_matches(self, canonical_song: Dict, entry_batches: Iterator[List[Dict]],
+                        top_k: Optional[int] = None) -> Iterator[MatchResult]:
+        """Score batches of songbook entries as they arrive (see iter_matches)"""
+        canonical_mele_id = canonical_song['canonical_mele_id']
+        # Min-heap of (confidence, -position, match); ties keep the earlier entry, as a stable sort does
+        best = []
+        position = 0
+        
+        def min_score():
+            if not self.bound_pruning:
+                return None
+            if top_k is not None and len(best) >= top_k:
+                return max(MINIMUM_CONFIDENCE, best[0][0])
+            return MINIMUM_CONFIDENCE
+        
+        for songbook_entries in entry_batches:
+            self.profiler.count('pairs_scored', len(songbook_entries))
+            if self.scoring_method == 'ngram_cosine':
+                scores = self._score_entries(canonical_song, songbook_entries)
+            else:
+                # Evaluated lazily, so each pair sees the threshold left by the previous one
+                scores = (self.calculate_similarities(canonical_song, songbook_entry, min_score())
+                          for songbook_entry in songbook_entries)
+            
+            for songbook_entry, similarities in zip(songbook_entries, scores):
+                position += 1
+                if similarities is None:
+                    continue
+                match = self.match_from_similarities(canonical_mele_id, songbook_entry, similarities)
+                if match is None:
+                    continue
+                
+                if top_k is None:
+                    yield match
+                elif len(best) < top_k:
+                    heapq.heappush(best, (match.confidence, -position, match))
+                elif (match.confidence, -position) > best[0][:2]:
+                    heapq.heapreplace(best, (match.confidence, -position, match))
+        
+        for _, _, match in sorted(best, key=lambda item: item[:2], reverse=True):
+            yield match
     
     def get_confidence_tier(self, confidence: float) -> str:
         """Determine confidence tier based on score"""
@@ -228,7 +979,7 @@ class MatchingEngine:
             cursor.execute("""
                 INSERT INTO matching_status (
                     canonical_mele_id, songbook_entry_id, match_confidence, 
-                    match_method, match_status, algorithm_version, notes
+                    match_method, match_status, algorithm_version, scoring_details
                 ) VALUES (%s, %s, %s, %s, %s, %s, %s)
                 ON CONFLICT (canonical_mele_id, songbook_entry_id) 
                 DO UPDATE SET 
@@ -236,7 +987,7 @@ class MatchingEngine:
                     match_method = EXCLUDED.match_method,
                     match_status = EXCLUDED.match_status,
                     algorithm_version = EXCLUDED.algorithm_version,
-                    notes = EXCLUDED.notes,
+                    scoring_details = EXCLUDED.scoring_details,
                     matched_at = NOW()
             """, (
                 match_record['canonical_mele_id'],
@@ -245,7 +996,7 @@ class MatchingEngine:
                 match_record['match_method'],
                 status,
                 self.algorithm_version,
-                f"Scoring details: {match_record['scoring_details']}"
+                serialize_scoring_details(match_record['scoring_details'])
             ))
             
             # For high-confidence matches, also update the songbook_entries table
@@ -256,68 +1007,285 @@ class MatchingEngine:
                     WHERE id = %s
                 """, (match_record['canonical_mele_id'], match_record['songbook_entry_id']))
             
-            conn.commit()
+            self._commit(conn)
+            self.profiler.count('matches_saved')
             return True
-            
+        
         except Exception as e:
             conn.rollback()
             print(f"Error saving match: {e}")
             return False
-            
+        
         finally:
             cursor.close()
-            conn.close()
+            self.release_database_connection(conn)
     
     def process_song_matches(self, canonical_mele_id: str, auto_link_high_confidence: bool = True) -> Dict:
-        """Process all matches for a single song"""
+        """Process all matches for a single song (with a profiler, results['profile'] holds its summary so far)"""
         matches = self.find_matches_for_song(canonical_mele_id)
+        results = self.save_matches([(canonical_mele_id, matches)], auto_link_high_confidence)[0]
+        if self.profiler.enabled:
+            results['profile'] = self.profiler.summary()
+        return results
+    
+    def _status_for_match(self, match_record: Dict, auto_link_high_confidence: bool) -> str:
+        """matching_status value for a match, based on its confidence tier"""
+        if match_record['tier'] == 'high' and auto_link_high_confidence:
+            return 'auto_linked'
+        return 'needs_review'  # Medium and low confidence (and unlinked high) need review
+    
+    def save_matches(self, song_matches: List[Tuple[str, List[Dict]]],
+                     auto_link_high_confidence: bool = True,
+                     extra_writes: Optional[Callable] = None) -> List[Dict]:
+        """
+        Save the matches for one or many songs in a single transaction: one multi-row
+        upsert into matching_status and one set-based UPDATE for auto-linked entries.
+        extra_writes(cursor), if given, runs inside the same transaction before commit.
+        Returns one result dict per song with the same per-tier counts as saving one by one.
+        """
+        all_results, status_rows, auto_links = self.prepare_match_writes(song_matches, auto_link_high_confidence)
         
-        results = {
-            'canonical_mele_id': canonical_mele_id,
-            'total_matches': len(matches),
-            'high_confidence': 0,
-            'medium_confidence': 0,
-            'low_confidence': 0,
-            'auto_linked': 0,
-            'queued_for_review': 0,
-            'matches': matches
-        }
+        saved = False
+        if status_rows or extra_writes:
+            with self.profiler.span('save'):
+                saved = self._write_matches(status_rows, auto_links, extra_writes)
         
-        for match in matches:
-            tier = match['tier']
+        if saved:
+            self.count_saved_matches(all_results, auto_link_high_confidence)
+        
+        return all_results
+    
+    def prepare_match_writes(self, song_matches: List[Tuple[str, List[Dict]]],
+                             auto_link_high_confidence: bool = True) -> Tuple[List[Dict], List[Tuple], List[Tuple[int, str]]]:
+        """
+        Per-song result dicts (tier counts filled in), deduplicated matching_status rows
+        and (songbook_entry_id, canonical_mele_id) auto-links for save_matches
+        """
+        all_results = []
+        status_rows = {}
+        auto_links = {}
+        
+        for canonical_mele_id, matches in song_matches:
+            results = {
+                'canonical_mele_id': canonical_mele_id,
+                'total_matches': len(matches),
+                'high_confidence': 0,
+                'medium_confidence': 0,
+                'low_confidence': 0,
+                'auto_linked': 0,
+                'queued_for_review': 0,
+                'matches': matches
+            }
             
-            if tier == 'high':
-                results['high_confidence'] += 1
-                if auto_link_high_confidence:
-                    if self.save_match(match, 'auto_linked'):
-                        results['auto_linked'] += 1
+            for match in matches:
+                results[f"{match['tier']}_confidence"] += 1
+                status = self._status_for_match(match, auto_link_high_confidence)
+                
+                # A later save of the same pair wins, as with consecutive save_match calls
+                key = (match['canonical_mele_id'], match['songbook_entry_id'])
+                status_rows.pop(key, None)
+                status_rows[key] = (
+                    match['canonical_mele_id'],
+                    match['songbook_entry_id'],
+                    match['confidence'],
+                    match['match_method'],
+                    status,
+                    self.algorithm_version,
+                    serialize_scoring_details(match['scoring_details'])
+                )
+                
+                if status == 'auto_linked':
+                    auto_links.pop(match['songbook_entry_id'], None)
+                    auto_links[match['songbook_entry_id']] = match['canonical_mele_id']
+            
+            all_results.append(results)
+        
+        return all_results, list(status_rows.values()), list(auto_links.items())
+    
+    def count_saved_matches(self, all_results: List[Dict], auto_link_high_confidence: bool = True):
+        """Fill in auto_linked / queued_for_review once the matches are committed"""
+        for results in all_results:
+            for match in results['matches']:
+                if self._status_for_match(match, auto_link_high_confidence) == 'auto_linked':
+                    results['auto_linked'] += 1
                 else:
-                    if self.save_match(match, 'needs_review'):
-                        results['queued_for_review'] += 1
-                        
-            elif tier == 'medium':
-                results['medium_confidence'] += 1
-                if self.save_match(match, 'needs_review'):
-                    results['queued_for_review'] += 1
-                    
-            else:  # low confidence
-                results['low_confidence'] += 1
-                if self.save_match(match, 'needs_review'):
                     results['queued_for_review'] += 1
+    
+    def _write_matches(self, status_rows: List[Tuple], auto_links: List[Tuple[int, str]],
+                       extra_writes: Optional[Callable] = None) -> bool:
+        """Upsert matching_status rows and apply auto-links in one transaction"""
+        try:
+            conn = self.get_database_connection()
+        except psycopg2.Error as e:
+            # e.g. an offline snapshot run with no reachable database
+            print(f"Error saving matches (no database connection): {e}")
+            return False
+        cursor = conn.cursor()
         
+        try:
+            if extra_writes:
+                extra_writes(cursor)
+            
+            execute_values(cursor, """
+                INSERT INTO matching_status (
+                    canonical_mele_id, songbook_entry_id, match_confidence, 
+                    match_method, match_status, algorithm_version, scoring_details
+                ) VALUES %s
+                ON CONFLICT (canonical_mele_id, songbook_entry_id) 
+                DO UPDATE SET 
+                    match_confidence = EXCLUDED.match_confidence,
+                    match_method = EXCLUDED.match_method,
+                    match_status = EXCLUDED.match_status,
+                    algorithm_version = EXCLUDED.algorithm_version,
+                    scoring_details = EXCLUDED.scoring_details,
+                    matched_at = NOW()
+            """, status_rows, page_size=1000)
+            
+            # High-confidence matches also link the songbook entry, in one set-based UPDATE
+            if auto_links:
+                execute_values(cursor, """
+                    UPDATE songbook_entries AS s
+                    SET canonical_mele_id = v.canonical_mele_id
+                    FROM (VALUES %s) AS v(songbook_entry_id, canonical_mele_id)
+                    WHERE s.id = v.songbook_entry_id
+                """, auto_links, page_size=1000)
+            
+            self._commit(conn)
+            self.profiler.count('matches_saved', len(status_rows))
+            return True
+        
+        except Exception as e:
+            conn.rollback()
+            print(f"Error saving matches: {e}")
+            return False
+        
+        finally:
+            cursor.close()
+            self.release_database_connection(conn)
+    
+    def _commit(self, conn):
+        """Commit, timed under the 'commit' span"""
+        with self.profiler.span('commit'):
+            conn.commit()
+        self.profiler.count('commits')
+    
+    def match_many(self, canonical_ids: List[str], auto_link_high_confidence: bool = True,
+                   save: bool = True) -> List[Dict]:
+        """
+        Bulk matching mode: load the canonical songs and the unlinked songbook entries once,
+        score every pair in memory and return one process_song_matches-style result per id.
+        Songs are processed in the given order; entries auto-linked by an earlier song are
+        dropped before scoring later ones, just as a sequence of process_song_matches calls would.
+        With save=False nothing is written (e.g. an offline snapshot run).
+        """
+        canonical_songs, songbook_entries = self.load_matching_data(canonical_ids)
+        exact_matches = self.load_exact_key_matches(canonical_ids, canonical_songs, songbook_entries)
+        return self.match_loaded(canonical_ids, canonical_songs, songbook_entries, auto_link_high_confidence,
+                                 exact_matches, save)
+    
+    def match_all(self, auto_link_high_confidence: bool = True, save: bool = True) -> List[Dict]:
+        """Bulk matching mode over every canonical song, ordered by canonical_mele_id"""
+        canonical_songs, songbook_entries = self.load_matching_data()
+        canonical_ids = [song['canonical_mele_id'] for song in canonical_songs]
+        exact_matches = self.load_exact_key_matches(canonical_ids, canonical_songs, songbook_entries)
+        return self.match_loaded(canonical_ids, canonical_songs, songbook_entries, auto_link_high_confidence,
+                                 exact_matches, save)
+    
+    def match_loaded(self, canonical_ids: List[str], canonical_songs: List[Dict],
+                     songbook_entries: List[Dict], auto_link_high_confidence: bool = True,
+                     exact_matches: Optional[Dict[str, Dict[int, Set[int]]]] = None,
+                     save: bool = True) -> List[Dict]:
+        """
+        Score already-loaded songs and entries, then save every match in one transaction (see match_many).
+        With save=False the results are returned unsaved (auto_linked / queued_for_review stay 0).
+        """
+        song_matches = self.score_loaded(canonical_ids, canonical_songs, songbook_entries, auto_link_high_confidence,
+                                         exact_matches)
+        if save:
+            results = self.save_matches(song_matches, auto_link_high_confidence)
+        else:
+            results, _, _ = self.prepare_match_writes(song_matches, auto_link_high_confidence)
+        self.profiler.dump()
         return results
+    
+    def score_loaded(self, canonical_ids: List[str], canonical_songs: List[Dict],
+                     songbook_entries: List[Dict], auto_link_high_confidence: bool = True,
+                     exact_matches: Optional[Dict[str, Dict[int, Set[int]]]] = None) -> List[Tuple[str, List[Dict]]]:
+        """
+        (canonical_mele_id, matches) per id, in order, without saving anything.
+        Entries with an exact title key in exact_matches (see load_exact_key_matches) are matched
+        to their songs directly and left out of fuzzy scoring for every song; candidate-only pairs
+        of those entries are still scored in full.
+        """
+        songs_by_id = {song['canonical_mele_id']: song for song in canonical_songs}
+        exact_entries = {}
+        if exact_matches:
+            exact_entry_ids = {entry_id for entries in exact_matches.values()
+                               for entry_id, title_fields in entries.items() if title_fields}
+            exact_entries = {entry['id']: entry for entry in songbook_entries if entry['id'] in exact_entry_ids}
+            songbook_entries = [entry for entry in songbook_entries if entry['id'] not in exact_entry_ids]
+            self.profiler.count('exact_key_entries', len(exact_entries))
+        candidate_index = NGramIndex(songbook_entries) if self.candidate_limit is not None else None
+        batch_scorer = None
+        if self.scoring_method == 'ngram_cosine':
+            batch_scorer = BatchSimilarityScorer(songbook_entries, self.calibration)
+        linking_entry_ids = set()
+        song_matches = []
+        
+        for canonical_mele_id in canonical_ids:
+            canonical_song = songs_by_id.get(canonical_mele_id)
+            matches = []
+            
+            if canonical_song is not None:
+                if linking_entry_ids:
+                    songbook_entries = [entry for entry in songbook_entries
+                                        if entry['id'] not in linking_entry_ids]
+                matches = self.score_song_against_entries(
+                    canonical_song, songbook_entries, candidate_index, batch_scorer
+                )
+                if exact_matches and canonical_mele_id in exact_matches:
+                    # Candidate-only pairs of entries still in the fuzzy workload were scored above
+                    keyed_matches = [
+                        self.exact_key_match(canonical_song, exact_entries[entry_id], title_fields)
+                        for entry_id, title_fields in sorted(exact_matches[canonical_mele_id].items())
+                        if entry_id in exact_entries and entry_id not in linking_entry_ids
+                    ]
+                    matches = [match for match in keyed_matches if match is not None] + matches
+                    matches.sort(key=lambda match: match.confidence, reverse=True)
+                linking_entry_ids.update(
+                    match['songbook_entry_id'] for match in matches
+                    if self._status_for_match(match, auto_link_high_confidence) == 'auto_linked'
+                )
+            
+            song_matches.append((canonical_mele_id, matches))
+        
+        return song_matches
 
 
 def main():
     """Main function for testing the matching engine"""
+    parser = argparse.ArgumentParser(description="Matching engine test run")
+    parser.add_argument('--profile', action='store_true',
+                        help="Print per-phase timings and counters as JSON at the end")
+    parser.add_argument('--profile-output', metavar='PATH',
+                        help="Also write the profile JSON to PATH (implies --profile)")
+    parser.add_argument('--composer-index', action='store_true',
+                        help="Score composers through the saved composer identity index (composer_index.py)")
+    parser.add_argument('--trigram-candidates', type=int, metavar='N',
+                        help="Score only the N most similar entries per song, found by pg_trgm in Postgres")
+    args = parser.parse_args()
+    args.profile = args.profile or bool(args.profile_output)
+    
     print("🎵 Songbook Linkage System - Matching Engine Test")
     print("=" * 60)
     
     # Set password if not in environment
-    if not os.getenv('PGPASSWORD'):
-        raise ValueError("PGPASSWORD environment variable is required")
+    require_credentials()
     
-    engine = MatchingEngine()
+    composer_index = ComposerIndex.load_or_build() if args.composer_index else None
+    engine = MatchingEngine(algorithm_version="v1.0-composer-index" if composer_index else "v1.0",
+                            profiler=Profiler(args.profile_output) if args.profile else None, composer_index=composer_index,
+                            trigram_candidates=args.trigram_candidates)
     
     # Get list of canonical songs to test
     conn = engine.get_database_connection()
@@ -350,6 +1318,9 @@ def main():
             print(f"      High confidence: {results['high_confidence']}")
             print(f"      Medium confidence: {results['medium_confidence']}")
             print(f"      Low confidence: {results['low_confidence']}")
+            if 'profile' in results:
+                print(f"   ⏱️  {results['profile']['wall_ms']:.1f} ms elapsed, "
+                      f"{results['profile']['counters'].get('pairs_scored', 0)} pairs scored so far")
             
             # Show top matches
             if results['matches']:
@@ -360,11 +1331,21 @@ def main():
             
             print("-" * 50)
         
-        print("\n✅ Matching engine test completed!")
+        stats = engine.pruning_stats
+        pruned = sum(stats[stage] for stage in PRUNING_STAGES)
+        print(f"✂️  Bound pruning: {pruned} of {stats['pairs']} pairs rejected before full scoring "
+              f"({', '.join(f'{stage} {stats[stage]}' for stage in PRUNING_STAGES)})")
+        
+        if args.profile:
+            print(f"⏱️  Profile:\n{json.dumps(engine.profiler.dump(), indent=2)}")
+            if args.profile_output:
+                print(f"   Written to {args.profile_output}")
         
+        print("\n✅ Matching engine test completed!")
+    
     finally:
         cursor.close()
-        conn.close()
+        engine.release_database_connection(conn)
 
 
 if __name__ == "__main__":
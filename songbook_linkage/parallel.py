@@ -0,0 +1,279 @@
+"""
+Songbook Linkage System - Parallel Matching
+Shards canonical songs across a process pool so scoring uses every core,
+then merges results in input order exactly as a serial run would
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Tuple
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from matching_engine import MatchingEngine
+from candidate_index import NGramIndex
+from vector_scoring import BatchSimilarityScorer
+from snapshot import Snapshot
+
+
+# Read-only (engine, canonical_songs, songbook_entries) snapshot. Set in the parent just
+# before the pool starts so forked workers inherit it copy-on-write instead of unpickling it.
+_fork_snapshot = None
+# Per-worker engine, snapshot and prebuilt candidate index / batch scorer
+_worker_state = None
+
+
+def _build_scoring_helpers(engine: MatchingEngine, songbook_entries: List[Dict]) -> Tuple:
+    """Candidate index and batch scorer for the engine's settings (None when not used)"""
+    candidate_index = NGramIndex(songbook_entries) if engine.candidate_limit is not None else None
+    batch_scorer = None
+    if engine.scoring_method == 'ngram_cosine':
+        batch_scorer = BatchSimilarityScorer(songbook_entries, engine.calibration)
+    return candidate_index, batch_scorer
+
+
+def _init_worker(snapshot: Optional[Tuple] = None):
+    """Pool initializer: take the snapshot (inherited or pickled once per worker) and build helpers once"""
+    global _worker_state
+    
+    engine, canonical_songs, songbook_entries = snapshot if snapshot is not None else _fork_snapshot
+    candidate_index, batch_scorer = _build_scoring_helpers(engine, songbook_entries)
+    _worker_state = (engine, canonical_songs, songbook_entries, candidate_index, batch_scorer)
+
+
+def _score_chunk(bounds: Tuple[int, int]) -> List[Tuple]:
+    """
+    Score canonical_songs[start:stop] against the full entry snapshot.
+    Returns (canonical_mele_id, [(entry_id, similarities), ...], shortlist_ids)
+    per song, where shortlist_ids is None unless a candidate limit is set.
+    """
+    engine, canonical_songs, songbook_entries, candidate_index, batch_scorer = _worker_state
+    start, stop = bounds
+    results = []
+    
+    for canonical_song in canonical_songs[start:stop]:
+        shortlist_ids = None
+        considered = songbook_entries
+        if candidate_index is not None:
+            considered = candidate_index.top_candidates(canonical_song, engine.candidate_limit)
+            shortlist_ids = [songbook_entry['id'] for songbook_entry in considered]
+        
+        matches = engine.score_song_against_entries(canonical_song, considered, candidate_index, batch_scorer)
+        results.append((
+            canonical_song['canonical_mele_id'],
+            [(match.songbook_entry_id, match.similarities) for match in matches],
+            shortlist_ids
+        ))
+    
+    return results
+
+
+class ParallelMatcher:
+    """Runs MatchingEngine bulk matching with canonical songs sharded across worker processes"""
+    
+    def __init__(self, engine: Optional[MatchingEngine] = None, workers: Optional[int] = None,
+                 chunk_size: Optional[int] = None):
+        self.engine = engine or MatchingEngine()
+        if self.engine.exact_key_tier:
+            # Workers score every song against every entry; the exact-key tier would change results
+            raise ValueError("ParallelMatcher does not support exact_key_tier; use MatchingEngine.match_many")
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # Songs per task; defaults to about four tasks per worker to even out slow songs
+        self.chunk_size = chunk_size
+    
+    def _chunks(self, song_count: int) -> List[Tuple[int, int]]:
+        """Contiguous (start, stop) ranges covering song_count songs"""
+        chunk_size = self.chunk_size or max(1, -(-song_count // (self.workers * 4)))
+        return [(start, min(start + chunk_size, song_count)) for start in range(0, song_count, chunk_size)]
+    
+    def _score_in_pool(self, canonical_songs: List[Dict], songbook_entries: List[Dict]) -> List[Tuple]:
+        """Score every song in worker processes, returning chunk results in song order"""
+        global _fork_snapshot
+        
+        snapshot = (self.engine, canonical_songs, songbook_entries)
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+            initargs = ()
+        else:
+            context = multiprocessing.get_context()
+            initargs = (snapshot,)
+        
+        _fork_snapshot = snapshot
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                     initializer=_init_worker, initargs=initargs) as executor:
+                scored = []
+                for chunk in executor.map(_score_chunk, self._chunks(len(canonical_songs))):
+                    scored.extend(chunk)
+                return scored
+        finally:
+            _fork_snapshot = None
+    
+    def score_loaded(self, canonical_ids: List[str], canonical_songs: List[Dict],
+                     songbook_entries: List[Dict], auto_link_high_confidence: bool = True) -> List[Tuple[str, List[Dict]]]:
+        """
+        Parallel equivalent of MatchingEngine.score_loaded: same order, same scores.
+        Workers score each song against the full snapshot; the merge then walks the ids in
+        order and drops entries auto-linked by an earlier song, re-scoring a song serially
+        only when one of those entries was in its candidate shortlist.
+        """
+        engine = self.engine
+        songs_by_id = {song['canonical_mele_id']: song for song in canonical_songs}
+        ordered_songs = [songs_by_id[canonical_mele_id] for canonical_mele_id in dict.fromkeys(canonical_ids)
+                         if canonical_mele_id in songs_by_id]
+        entries_by_id = {songbook_entry['id']: songbook_entry for songbook_entry in songbook_entries}
+        
+        scored = {canonical_mele_id: (scored_matches, shortlist_ids)
+                  for canonical_mele_id, scored_matches, shortlist_ids
+                  in self._score_in_pool(ordered_songs, songbook_entries)}
+        
+        helpers = None
+        linking_entry_ids = set()
+        song_matches = []
+        
+        for canonical_mele_id in canonical_ids:
+            matches = []
+            
+            if canonical_mele_id in scored:
+                scored_matches, shortlist_ids = scored[canonical_mele_id]
+                
+                if shortlist_ids is not None and linking_entry_ids.intersection(shortlist_ids):
+                    # Removing a shortlisted entry changes which entries make the top K
+                    if helpers is None:
+                        helpers = _build_scoring_helpers(engine, songbook_entries)
+                    remaining = [songbook_entry for songbook_entry in songbook_entries
+                                 if songbook_entry['id'] not in linking_entry_ids]
+                    matches = engine.score_song_against_entries(songs_by_id[canonical_mele_id], remaining, *helpers)
+                else:
+                    matches = [
+                        engine.match_from_similarities(canonical_mele_id, entries_by_id[entry_id], similarities)
+                        for entry_id, similarities in scored_matches
+                        if entry_id not in linking_entry_ids
+                    ]
+                
+                linking_entry_ids.update(
+                    match['songbook_entry_id'] for match in matches
+                    if engine._status_for_match(match, auto_link_high_confidence) == 'auto_linked'
+                )
+            
+            song_matches.append((canonical_mele_id, matches))
+        
+        return song_matches
+    
+    def match_loaded(self, canonical_ids: List[str], canonical_songs: List[Dict],
+                     songbook_entries: List[Dict], auto_link_high_confidence: bool = True,
+                     save: bool = True) -> List[Dict]:
+        """Score in parallel, then save every match in one transaction from the parent process (unless save=False)"""
+        song_matches = self.score_loaded(canonical_ids, canonical_songs, songbook_entries, auto_link_high_confidence)
+        if not save:
+            return self.engine.prepare_match_writes(song_matches, auto_link_high_confidence)[0]
+        return self.engine.save_matches(song_matches, auto_link_high_confidence)
+    
+    def load(self, canonical_ids: Optional[List[str]] = None) -> Tuple[List[Dict], List[Dict]]:
+        """Load canonical songs (all, or the given ids) and unlinked songbook entries, from the engine's snapshot if set"""
+        return self.engine.load_matching_data(canonical_ids)
+    
+    def match_many(self, canonical_ids: List[str], auto_link_high_confidence: bool = True,
+                   save: bool = True) -> List[Dict]:
+        """Parallel equivalent of MatchingEngine.match_many"""
+        canonical_songs, songbook_entries = self.load(canonical_ids)
+        return self.match_loaded(canonical_ids, canonical_songs, songbook_entries, auto_link_high_confidence, save)
+    
+    def match_all(self, auto_link_high_confidence: bool = True, save: bool = True) -> List[Dict]:
+        """Parallel equivalent of MatchingEngine.match_all"""
+        canonical_songs, songbook_entries = self.load()
+        canonical_ids = [song['canonical_mele_id'] for song in canonical_songs]
+        return self.match_loaded(canonical_ids, canonical_songs, songbook_entries, auto_link_high_confidence, save)
+
+
+def _comparable(song_matches: List[Tuple[str, List[Dict]]]) -> List[Tuple]:
+    """Order-sensitive summary of scoring output used to check parallel runs against serial"""
+    return [
+        (canonical_mele_id, [(match['songbook_entry_id'], match['confidence'], match['match_method'], match['tier'])
+                             for match in matches])
+        for canonical_mele_id, matches in song_matches
+    ]
+
+
+def speedup_report(engine: MatchingEngine, canonical_songs: List[Dict], songbook_entries: List[Dict],
+                   worker_counts: List[int], chunk_size: Optional[int] = None) -> List[Dict]:
+    """
+    Time scoring (no saving) serially and with each worker count, checking that every
+    parallel run returns exactly the serial matches
+    """
+    canonical_ids = [song['canonical_mele_id'] for song in canonical_songs]
+    
+    started = time.perf_counter()
+    serial = _comparable(engine.score_loaded(canonical_ids, canonical_songs, songbook_entries, False))
+    serial_seconds = time.perf_counter() - started
+    
+    report = [{'workers': 0, 'seconds': serial_seconds, 'speedup': 1.0, 'identical': True}]
+    for workers in worker_counts:
+        matcher = ParallelMatcher(engine, workers=workers, chunk_size=chunk_size)
+        started = time.perf_counter()
+        parallel = _comparable(matcher.score_loaded(canonical_ids, canonical_songs, songbook_entries, False))
+        seconds = time.perf_counter() - started
+        report.append({
+            'workers': workers,
+            'seconds': seconds,
+            'speedup': serial_seconds / seconds if seconds else 0.0,
+            'identical': parallel == serial
+        })
+    
+    return report
+
+
+def main():
+    """Run parallel matching, or print a serial vs 1..N worker speedup report"""
+    from database import require_credentials
+    
+    parser = argparse.ArgumentParser(description="Parallel songbook matching")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=None, help="canonical songs per task")
+    parser.add_argument('--algorithm-version', default="v1.0")
+    parser.add_argument('--report', action='store_true', help="time 1..N workers against serial scoring, saving nothing")
+    parser.add_argument('--auto-link', action='store_true', help="auto-link high confidence matches")
+    parser.add_argument('--snapshot', metavar='PATH', help="read songs and entries from a snapshot file (snapshot.py)")
+    parser.add_argument('--no-save', action='store_true', help="score and report without writing to the database")
+    args = parser.parse_args()
+    
+    print("🎵 Songbook Linkage System - Parallel Matching")
+    print("=" * 60)
+    
+    # A snapshot run that saves nothing needs no database at all
+    if not (args.snapshot and (args.report or args.no_save)):
+        require_credentials()
+    
+    engine = MatchingEngine(algorithm_version=args.algorithm_version,
+                            snapshot=Snapshot(args.snapshot) if args.snapshot else None)
+    matcher = ParallelMatcher(engine, workers=args.workers, chunk_size=args.chunk_size)
+    canonical_songs, songbook_entries = matcher.load()
+    
+    if args.report:
+        print(f"Scoring {len(canonical_songs)} songs against {len(songbook_entries)} entries "
+              f"({os.cpu_count()} CPUs available)...\n")
+        for row in speedup_report(engine, canonical_songs, songbook_entries,
+                                  list(range(1, args.workers + 1)), args.chunk_size):
+            label = "serial" if row['workers'] == 0 else f"{row['workers']} worker(s)"
+            check = "✓ identical" if row['identical'] else "❌ DIFFERS from serial"
+            print(f"{label:>12}: {row['seconds']:.2f}s, {row['speedup']:.2f}x  {check}")
+        return
+    
+    canonical_ids = [song['canonical_mele_id'] for song in canonical_songs]
+    results = matcher.match_loaded(canonical_ids, canonical_songs, songbook_entries, args.auto_link,
+                                   save=not args.no_save)
+    
+    print(f"Matched {len(results)} songs with {matcher.workers} worker(s){' (not saved)' if args.no_save else ''}")
+    print(f"   Potential matches: {sum(result['total_matches'] for result in results)}")
+    print(f"   Auto-linked: {sum(result['auto_linked'] for result in results)}")
+    print(f"   Queued for review: {sum(result['queued_for_review'] for result in results)}")
+    print("\n✅ Parallel matching completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,102 +3,173 @@ Populate normalized text columns for existing data
 This script fills the normalized columns we created in setup_database.py
 """
 
-import os
-import psycopg2
-from text_normalization import normalize_title, normalize_composer
+import time
+import argparse
+from typing import List, Tuple, Optional
 
+from psycopg2.extras import execute_values
 
-def get_database_connection():
-    """Get database connection using existing credentials"""
-    return psycopg2.connect(
-        host='ep-young-silence-ad9wue88-pooler.c-2.us-east-1.aws.neon.tech',
-        port=5432,
-        database='neondb',
-        user='neondb_owner',
-        password=os.getenv('PGPASSWORD', '')
-    )
+from database import get_connection, release_connection, require_credentials
+from text_normalization import (normalize_titles, normalize_composers, title_match_keys, title_variant_keys,
+                                NORMALIZER_VERSION)
 
 
-def populate_canonical_mele_normalized(cursor):
-    """Populate normalized columns for canonical_mele table"""
-    print("Populating canonical_mele normalized columns...")
+# Normalized column, raw source column and bulk normalizer for each table
+CANONICAL_FIELDS = [
+    ('normalized_title_hawaiian', 'canonical_title_hawaiian', normalize_titles),
+    ('normalized_title_english', 'canonical_title_english', normalize_titles),
+    ('normalized_composer', 'primary_composer', normalize_composers)
+]
+SONGBOOK_ENTRY_FIELDS = [
+    ('normalized_printed_title', 'printed_song_title', normalize_titles),
+    ('normalized_composer', 'composer', normalize_composers)
+]
+
+# Match-key columns (sorted tokens, consonant skeleton, leading word) and the raw title
+# they are derived from; the exact-key tier in MatchingEngine joins on them
+CANONICAL_KEY_FIELDS = [
+    (('match_tokens_hawaiian', 'match_skeleton_hawaiian', 'match_leading_hawaiian'), 'canonical_title_hawaiian'),
+    (('match_tokens_english', 'match_skeleton_english', 'match_leading_english'), 'canonical_title_english')
+]
+SONGBOOK_ENTRY_KEY_FIELDS = [
+    (('match_tokens', 'match_skeleton', 'match_leading'), 'printed_song_title')
+]
+
+
+def source_hash_sql(fields: List[Tuple]) -> str:
+    """
+    SQL expression hashing the normalizer version and a row's raw source columns,
+    compared against normalized_source_hash to find rows that need normalizing
+    """
+    parts = " || chr(31) || ".join(f"coalesce({raw_column}, '')" for _, raw_column, _ in fields)
+    return f"md5(%(version)s || chr(31) || {parts})"
+
+
+def bulk_update_normalized(cursor, table: str, key_column: str, columns: List[str], rows: List[Tuple],
+                           timestamp_column: Optional[str] = None):
+    """
+    Write one batch of normalized values with a single UPDATE ... FROM (VALUES ...) statement.
+    Each row is (key, value for each column...); timestamp_column, if given, is set to NOW().
+    """
+    assignments = ", ".join(f"{column} = v.{column}" for column in columns)
+    if timestamp_column:
+        assignments += f", {timestamp_column} = NOW()"
+    execute_values(cursor, f"""
+        UPDATE {table} AS t
+        SET {assignments}
+        FROM (VALUES %s) AS v({key_column}, {", ".join(columns)})
+        WHERE t.{key_column} = v.{key_column}
+    """, rows, page_size=max(len(rows), 1))
+
+
+def refresh_title_variants(cursor, variants_column: str, rows: List[Tuple]):
+    """
+    Replace the title_variants rows of a batch. Each row is (key, [raw titles]);
+    variants_column is the title_variants column holding the key.
+    """
+    cursor.execute(f"DELETE FROM title_variants WHERE {variants_column} = ANY(%s)", ([key for key, _ in rows],))
     
-    # Get all canonical songs
-    cursor.execute("""
-        SELECT canonical_mele_id, canonical_title_hawaiian, canonical_title_english, primary_composer
-        FROM canonical_mele
-    """)
+    variants = [
+        (variant_key, key)
+        for key, titles in rows
+        for variant_key in dict.fromkeys(variant_key for title in titles for variant_key in title_variant_keys(title))
+    ]
+    if variants:
+        execute_values(cursor, f"INSERT INTO title_variants (variant_key, {variants_column}) VALUES %s",
+                       variants, page_size=len(variants))
+
+
+def normalize_table(cursor, table: str, key_column: str, first_key, fields: List[Tuple],
+                    full: bool = False, batch_size: int = 1000, key_fields: List[Tuple] = (),
+                    variants_column: Optional[str] = None) -> int:
+    """
+    Normalize a table in keyset-paginated batches and return the number of rows written.
+    Incremental passes (the default) only read rows with a missing normalized column or whose
+    source text / normalizer version no longer matches normalized_source_hash; full=True
+    rewrites every row. key_fields adds the title match keys, from raw columns listed in fields;
+    variants_column also refreshes those titles' title_variants rows.
+    """
+    source_hash = source_hash_sql(fields)
+    raw_columns = ", ".join(raw_column for _, raw_column, _ in fields)
+    raw_positions = {raw_column: position for position, (_, raw_column, _) in enumerate(fields, start=1)}
+    key_columns = [column for columns, _ in key_fields for column in columns]
+    dirty_filter = ""
+    if not full:
+        missing = " OR ".join(f"{normalized_column} IS NULL" for normalized_column, _, _ in fields)
+        dirty_filter = f"AND (normalized_source_hash IS DISTINCT FROM {source_hash} OR {missing})"
     
-    songs = cursor.fetchall()
-    updated_count = 0
+    last_key = first_key
+    total_updated = 0
     
-    for song_id, title_hawaiian, title_english, composer in songs:
-        # Normalize the titles and composer
-        norm_hawaiian = normalize_title(title_hawaiian) if title_hawaiian else ""
-        norm_english = normalize_title(title_english) if title_english else ""
-        norm_composer = normalize_composer(composer) if composer else ""
-        
-        # Update the normalized columns
-        cursor.execute("""
-            UPDATE canonical_mele 
-            SET normalized_title_hawaiian = %s,
-                normalized_title_english = %s,
-                normalized_composer = %s
-            WHERE canonical_mele_id = %s
-        """, (norm_hawaiian, norm_english, norm_composer, song_id))
-        
-        updated_count += 1
+    while True:
+        cursor.execute(f"""
+            SELECT {key_column}, {raw_columns}, {source_hash}
+            FROM {table}
+            WHERE {key_column} > %(last_key)s
+            {dirty_filter}
+            ORDER BY {key_column}
+            LIMIT %(batch_size)s
+        """, {'version': NORMALIZER_VERSION, 'last_key': last_key, 'batch_size': batch_size})
+        
+        rows = cursor.fetchall()
+        
+        if not rows:
+            break  # No more rows
+        
+        # Normalize each source column in bulk
+        normalized_columns = [
+            normalize(row[position] for row in rows)
+            for position, (_, _, normalize) in enumerate(fields, start=1)
+        ]
+        
+        # Match keys of each title, flattened in key_fields order
+        match_keys = [
+            [key for _, raw_column in key_fields for key in title_match_keys(row[raw_positions[raw_column]])]
+            for row in rows
+        ]
+        
+        batch_updates = [
+            (row[0], *normalized, *keys, row[-1])
+            for row, keys, *normalized in zip(rows, match_keys, *normalized_columns)
+        ]
+        
+        # One UPDATE statement per batch
+        bulk_update_normalized(cursor, table, key_column,
+                               [normalized_column for normalized_column, _, _ in fields] + key_columns
+                               + ['normalized_source_hash'],
+                               batch_updates, timestamp_column='normalized_at')
+        
+        if variants_column:
+            refresh_title_variants(cursor, variants_column, [
+                (row[0], [row[raw_positions[raw_column]] for _, raw_column in key_fields]) for row in rows
+            ])
         
-        print(f"✓ {song_id}: '{title_hawaiian}' → '{norm_hawaiian}'")
+        total_updated += len(batch_updates)
+        last_key = rows[-1][0]
+    
+    return total_updated
+
+
+def populate_canonical_mele_normalized(cursor, full: bool = False, batch_size: int = 1000):
+    """Populate normalized columns for canonical_mele table"""
+    print("Populating canonical_mele normalized columns...")
+    
+    updated_count = normalize_table(cursor, 'canonical_mele', 'canonical_mele_id', '',
+                                    CANONICAL_FIELDS, full, batch_size, CANONICAL_KEY_FIELDS, 'canonical_mele_id')
     
     print(f"Updated {updated_count} canonical songs")
     return updated_count
 
 
-def populate_songbook_entries_normalized(cursor):
+def populate_songbook_entries_normalized(cursor, full: bool = False, batch_size: int = 1000):
     """Populate normalized columns for songbook_entries table"""
     print("\nPopulating songbook_entries normalized columns...")
     
-    # Process in batches to handle large dataset
-    batch_size = 500
-    offset = 0
-    total_updated = 0
-    
-    while True:
-        # Get batch of songbook entries
-        cursor.execute("""
-            SELECT id, printed_song_title, composer
-            FROM songbook_entries
-            ORDER BY id
-            LIMIT %s OFFSET %s
-        """, (batch_size, offset))
-        
-        entries = cursor.fetchall()
-        
-        if not entries:
-            break  # No more entries
-        
-        batch_updates = []
-        
-        for entry_id, printed_title, composer in entries:
-            # Normalize the title and composer
-            norm_title = normalize_title(printed_title) if printed_title else ""
-            norm_composer = normalize_composer(composer) if composer else ""
-            
-            batch_updates.append((norm_title, norm_composer, entry_id))
-        
-        # Batch update
-        cursor.executemany("""
-            UPDATE songbook_entries 
-            SET normalized_printed_title = %s,
-                normalized_composer = %s
-            WHERE id = %s
-        """, batch_updates)
-        
-        total_updated += len(batch_updates)
-        offset += batch_size
-        
-        print(f"  Processed batch: {total_updated} entries updated...")
+    # Keyset pagination on id keeps every batch an index range scan, so the pass stays
+    # linear in table size and only one batch is held in memory at a time
+    total_updated = normalize_table(cursor, 'songbook_entries', 'id', 0,
+                                    SONGBOOK_ENTRY_FIELDS, full, batch_size, SONGBOOK_ENTRY_KEY_FIELDS,
+                                    'songbook_entry_id')
     
     print(f"Updated {total_updated} songbook entries")
     return total_updated
@@ -141,28 +212,37 @@ def show_normalization_examples(cursor):
 
 def main():
     """Main function to populate all normalized data"""
-    print("Populating normalized text columns...")
+    parser = argparse.ArgumentParser(description="Populate normalized text columns")
+    parser.add_argument('--full', action='store_true',
+                        help="re-normalize every row instead of only new or changed ones")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    
+    mode = "full rebuild" if args.full else "incremental"
+    print(f"Populating normalized text columns ({mode})...")
     
     try:
-        conn = get_database_connection()
+        started = time.perf_counter()
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Populate normalized data
-        canonical_count = populate_canonical_mele_normalized(cursor)
-        songbook_count = populate_songbook_entries_normalized(cursor)
+        canonical_count = populate_canonical_mele_normalized(cursor, args.full, args.batch_size)
+        songbook_count = populate_songbook_entries_normalized(cursor, args.full, args.batch_size)
         
         # Commit the changes
         conn.commit()
+        elapsed = time.perf_counter() - started
         
         # Show examples
         show_normalization_examples(cursor)
         
-        print(f"\n✅ Successfully populated normalized data!")
+        print(f"\n✅ Successfully populated normalized data in {elapsed:.1f}s ({mode})!")
         print(f"   - {canonical_count} canonical songs updated")
         print(f"   - {songbook_count} songbook entries updated")
         
         cursor.close()
-        conn.close()
+        release_connection(conn)
         
     except Exception as e:
         print(f"❌ Error populating normalized data: {e}")
@@ -171,6 +251,5 @@ def main():
 
 if __name__ == "__main__":
     # Set password if not in environment
-    if not os.getenv('PGPASSWORD'):
-        raise ValueError("PGPASSWORD environment variable is required")
-    main()
\ No newline at end of file
+    require_credentials()
+    main()
@@ -0,0 +1,33 @@
+"""
+Songbook Linkage System - Scoring Details
+The per-match scoring_details record and its compact JSON form for matching_status;
+kept free of the matching engine's dependencies so setup scripts can import it
+"""
+
+import json
+from typing import Dict
+
+
+def build_scoring_details(hawaiian_similarity: float, english_similarity: float, composer_similarity: float,
+                          date_score: float, total_score: float, match_method: str) -> Dict:
+    """The scoring_details dict recorded for a match (see MatchingEngine.combine_similarities)"""
+    scoring_details = {
+        'title_hawaiian_similarity': hawaiian_similarity,
+        'title_english_similarity': english_similarity,
+        'title_score': max(hawaiian_similarity, english_similarity) * 0.5,
+        'composer_similarity': composer_similarity,
+        'composer_score': composer_similarity * 0.3
+    }
+    if date_score:
+        scoring_details['date_score'] = date_score
+    scoring_details['total_score'] = total_score
+    scoring_details['match_method'] = match_method
+    return scoring_details
+
+
+def serialize_scoring_details(scoring_details: Dict) -> str:
+    """Compact JSON for matching_status.scoring_details (floats rounded to 4 places)"""
+    return json.dumps(
+        {key: round(value, 4) if isinstance(value, float) else value for key, value in scoring_details.items()},
+        separators=(',', ':')
+    )
@@ -3,20 +3,17 @@ Songbook Linkage System - Database Setup
 Creates tables and columns needed for Phase 1 implementation
 """
 
-import os
+import ast
+import argparse
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import execute_values
+from database import get_connection, release_connection, require_credentials
+from scoring_details import serialize_scoring_details
 
 
-def get_database_connection():
-    """Get database connection using existing credentials"""
-    return psycopg2.connect(
-        host='ep-young-silence-ad9wue88-pooler.c-2.us-east-1.aws.neon.tech',
-        port=5432,
-        database='neondb',
-        user='neondb_owner',
-        password=os.getenv('PGPASSWORD', '')
-    )
+# Prefix of the stringified scoring details older versions wrote into matching_status.notes
+LEGACY_NOTES_PREFIX = "Scoring details: "
 
 
 def create_matching_status_table(cursor):
@@ -46,6 +43,47 @@ def create_matching_status_table(cursor):
     print("✓ Created matching_status table")
 
 
+def create_matching_progress_tables(cursor):
+    """Create the tables incremental matching uses to remember what it already scored"""
+    
+    create_tables_sql = """
+    CREATE TABLE IF NOT EXISTS matching_progress (
+        canonical_mele_id VARCHAR PRIMARY KEY REFERENCES canonical_mele(canonical_mele_id) ON DELETE CASCADE,
+        algorithm_version VARCHAR NOT NULL,
+        source_hash VARCHAR NOT NULL,
+        last_matched_at TIMESTAMP DEFAULT NOW()
+    );
+    
+    CREATE TABLE IF NOT EXISTS songbook_entry_matching_progress (
+        songbook_entry_id INTEGER PRIMARY KEY REFERENCES songbook_entries(id) ON DELETE CASCADE,
+        algorithm_version VARCHAR NOT NULL,
+        source_hash VARCHAR NOT NULL,
+        last_matched_at TIMESTAMP DEFAULT NOW()
+    );
+    """
+    
+    cursor.execute(create_tables_sql)
+    print("✓ Created matching_progress tables")
+
+
+def create_title_variants_table(cursor):
+    """Create the title_variants table mapping title lookup keys to songs and songbook entries"""
+    
+    create_table_sql = """
+    CREATE TABLE IF NOT EXISTS title_variants (
+        variant_key VARCHAR NOT NULL,
+        canonical_mele_id VARCHAR REFERENCES canonical_mele(canonical_mele_id) ON DELETE CASCADE,
+        songbook_entry_id INTEGER REFERENCES songbook_entries(id) ON DELETE CASCADE,
+        
+        -- Each variant belongs to exactly one song or one entry
+        CHECK ((canonical_mele_id IS NULL) <> (songbook_entry_id IS NULL))
+    );
+    """
+    
+    cursor.execute(create_table_sql)
+    print("✓ Created title_variants table")
+
+
 def add_normalized_columns(cursor):
     """Add normalized text columns for fast searching"""
     
@@ -66,6 +104,102 @@ def add_normalized_columns(cursor):
             print(f"- {table}.{column} already exists")
             
 
+def add_normalization_tracking_columns(cursor):
+    """Add change-tracking columns used by incremental normalization"""
+    
+    tracking_columns = [
+        ("canonical_mele", "normalized_source_hash", "VARCHAR"),   # md5 of normalizer version + source text
+        ("canonical_mele", "normalized_at", "TIMESTAMP"),
+        ("songbook_entries", "normalized_source_hash", "VARCHAR"),
+        ("songbook_entries", "normalized_at", "TIMESTAMP")
+    ]
+    
+    for table, column, datatype in tracking_columns:
+        try:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {datatype};")
+            print(f"✓ Added {table}.{column} ({datatype})")
+        except psycopg2.errors.DuplicateColumn:
+            print(f"- {table}.{column} already exists")
+
+
+def add_match_key_columns(cursor):
+    """Add the title match-key columns (sorted tokens, consonant skeleton, leading word) for the exact-key tier"""
+    
+    match_key_columns = [
+        ("canonical_mele", "match_tokens_hawaiian"),
+        ("canonical_mele", "match_skeleton_hawaiian"),
+        ("canonical_mele", "match_leading_hawaiian"),
+        ("canonical_mele", "match_tokens_english"),
+        ("canonical_mele", "match_skeleton_english"),
+        ("canonical_mele", "match_leading_english"),
+        ("songbook_entries", "match_tokens"),
+        ("songbook_entries", "match_skeleton"),
+        ("songbook_entries", "match_leading")
+    ]
+    
+    for table, column in match_key_columns:
+        try:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} VARCHAR;")
+            print(f"✓ Added {table}.{column}")
+        except psycopg2.errors.DuplicateColumn:
+            print(f"- {table}.{column} already exists")
+
+
+def add_scoring_details_column(cursor):
+    """Add the JSONB column holding each match's title/composer sub-scores"""
+    
+    try:
+        cursor.execute("ALTER TABLE matching_status ADD COLUMN scoring_details JSONB;")
+        print("✓ Added matching_status.scoring_details (JSONB)")
+    except psycopg2.errors.DuplicateColumn:
+        print("- matching_status.scoring_details already exists")
+
+
+def backfill_scoring_details(cursor, batch_size: int = 1000):
+    """
+    Parse the Python-repr details older versions stored in notes into scoring_details,
+    clearing notes that held nothing else. Rows that do not parse are left untouched.
+    """
+    last_id = 0
+    converted = 0
+    unreadable = 0
+    
+    while True:
+        cursor.execute("""
+            SELECT id, notes
+            FROM matching_status
+            WHERE id > %s AND scoring_details IS NULL AND notes LIKE %s
+            ORDER BY id
+            LIMIT %s
+        """, (last_id, LEGACY_NOTES_PREFIX + '%', batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        
+        updates = []
+        for match_id, notes in rows:
+            try:
+                scoring_details = ast.literal_eval(notes[len(LEGACY_NOTES_PREFIX):])
+            except (ValueError, SyntaxError, MemoryError, RecursionError):
+                scoring_details = None
+            if not isinstance(scoring_details, dict):
+                unreadable += 1
+                continue
+            updates.append((match_id, serialize_scoring_details(scoring_details)))
+        
+        execute_values(cursor, """
+            UPDATE matching_status AS m
+            SET scoring_details = v.scoring_details::jsonb, notes = NULL
+            FROM (VALUES %s) AS v(id, scoring_details)
+            WHERE m.id = v.id
+        """, updates, page_size=batch_size)
+        converted += len(updates)
+    
+    print(f"✓ Backfilled scoring_details for {converted} matches"
+          + (f" ({unreadable} notes could not be parsed)" if unreadable else ""))
+
+
 def add_dublin_core_columns(cursor):
     """Add Dublin Core metadata columns for future use"""
     
@@ -97,7 +231,26 @@ def create_indexes(cursor):
         ("idx_canonical_normalized_english", "canonical_mele", "normalized_title_english", ""),
         ("idx_canonical_normalized_composer", "canonical_mele", "normalized_composer", ""),
         ("idx_songbook_normalized_title", "songbook_entries", "normalized_printed_title", ""),
-        ("idx_songbook_normalized_composer", "songbook_entries", "normalized_composer", "")
+        ("idx_songbook_normalized_composer", "songbook_entries", "normalized_composer", ""),
+        # lookup_title: equality on the variant key; the id indexes serve refreshes and cascades
+        ("idx_title_variants_key", "title_variants USING HASH", "variant_key", ""),
+        ("idx_title_variants_canonical", "title_variants", "canonical_mele_id", ""),
+        ("idx_title_variants_entry", "title_variants", "songbook_entry_id", ""),
+        # Exact-key tier joins (unlinked entries only)
+        ("idx_canonical_match_tokens_hawaiian", "canonical_mele", "match_tokens_hawaiian", ""),
+        ("idx_canonical_match_tokens_english", "canonical_mele", "match_tokens_english", ""),
+        ("idx_canonical_match_skeleton_hawaiian", "canonical_mele", "match_skeleton_hawaiian, match_leading_hawaiian", ""),
+        ("idx_canonical_match_skeleton_english", "canonical_mele", "match_skeleton_english, match_leading_english", ""),
+        ("idx_songbook_match_tokens", "songbook_entries", "match_tokens", "WHERE canonical_mele_id IS NULL"),
+        ("idx_songbook_match_skeleton", "songbook_entries", "match_skeleton, match_leading",
+         "WHERE canonical_mele_id IS NULL"),
+        # Containment queries on scoring_details (e.g. @> '{"match_method": "exact"}')
+        ("idx_matching_status_scoring_details", "matching_status USING GIN", "scoring_details jsonb_path_ops", ""),
+        # Review filters on title / composer sub-scores
+        ("idx_matching_status_title_score", "matching_status",
+         "((scoring_details->>'title_score')::float8)", ""),
+        ("idx_matching_status_composer_score", "matching_status",
+         "((scoring_details->>'composer_score')::float8)", "")
     ]
     
     for index_name, table, columns, where_clause in indexes:
@@ -109,20 +262,57 @@ def create_indexes(cursor):
             print(f"- Index {index_name} already exists")
 
 
-def setup_database():
+def create_trigram_indexes(cursor) -> bool:
+    """
+    Enable pg_trgm and add GIN trigram indexes on the unlinked entries' normalized title and composer,
+    used by MatchingEngine(trigram_candidates=N). Optional: skipped when the extension is unavailable.
+    """
+    try:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    except psycopg2.Error as e:
+        print(f"⚠️  pg_trgm is not available, skipping trigram indexes: {str(e).splitlines()[0]}")
+        return False
+    
+    indexes = [
+        ("idx_songbook_trgm_title", "normalized_printed_title"),
+        ("idx_songbook_trgm_composer", "normalized_composer")
+    ]
+    
+    for index_name, column in indexes:
+        try:
+            cursor.execute(f"""
+                CREATE INDEX {index_name} ON songbook_entries
+                USING GIN ({column} gin_trgm_ops) WHERE canonical_mele_id IS NULL;
+            """)
+            print(f"✓ Created index {index_name}")
+        except psycopg2.errors.DuplicateTable:
+            print(f"- Index {index_name} already exists")
+    
+    return True
+
+
+def setup_database(trigram: bool = False):
     """Main setup function"""
     print("Setting up Songbook Linkage System database...")
     
     try:
-        conn = get_database_connection()
+        conn = get_connection()
         conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
         cursor = conn.cursor()
         
         # Create tables and columns
         create_matching_status_table(cursor)
+        create_matching_progress_tables(cursor)
+        create_title_variants_table(cursor)
         add_normalized_columns(cursor)
+        add_normalization_tracking_columns(cursor)
+        add_match_key_columns(cursor)
+        add_scoring_details_column(cursor)
         add_dublin_core_columns(cursor)
         create_indexes(cursor)
+        if trigram:
+            create_trigram_indexes(cursor)
+        backfill_scoring_details(cursor)
         
         print("\n✅ Database setup completed successfully!")
         
@@ -136,15 +326,19 @@ def setup_database():
         print(f"📊 Current data: {song_count} songs, {entry_count} songbook entries")
         
         cursor.close()
-        conn.close()
-        
+        release_connection(conn)
+    
     except Exception as e:
         print(f"❌ Error setting up database: {e}")
         raise
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set up the Songbook Linkage System database")
+    parser.add_argument('--trigram', action='store_true',
+                        help="also enable pg_trgm and create GIN trigram indexes for trigram candidate mode")
+    args = parser.parse_args()
+    
     # Set password if not in environment
-    if not os.getenv('PGPASSWORD'):
-        raise ValueError("PGPASSWORD environment variable is required")
-    setup_database()
\ No newline at end of file
+    require_credentials()
+    setup_database(args.trigram)
\ No newline at end of file
@@ -0,0 +1,306 @@
+"""
+Songbook Linkage System - Offline Snapshot
+Exports canonical_mele and songbook_entries (with normalized columns) into one compact
+local file that is memory-mapped for matching and benchmarking without a database
+
+File layout (native byte order, recorded in the header):
+    8 bytes   magic b"HUAPSNAP"
+    4 bytes   header length (unsigned)
+    header    UTF-8 JSON: tables, columns, section positions, row counts, checksum
+    data      per column an array of uint64 string starts and an array of uint32
+              byte lengths (0xFFFFFFFF = NULL), then one shared UTF-8 string buffer
+"""
+
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+import hashlib
+from datetime import datetime
+from typing import List, Dict, Iterator, Tuple
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+MAGIC = b"HUAPSNAP"
+FORMAT_VERSION = 1
+NULL_LENGTH = 0xFFFFFFFF
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "linkage_snapshot.bin")
+
+# Exported tables: (table, key column, columns)
+SNAPSHOT_TABLES = [
+    ('canonical_mele', 'canonical_mele_id', [
+        'canonical_mele_id', 'canonical_title_hawaiian', 'canonical_title_english', 'primary_composer',
+        'normalized_title_hawaiian', 'normalized_title_english', 'normalized_composer'
+    ]),
+    ('songbook_entries', 'id', [
+        'id', 'printed_song_title', 'composer', 'pub_year', 'songbook_name', 'canonical_mele_id',
+        'normalized_printed_title', 'normalized_composer'
+    ])
+]
+
+
+def _align(position: int, alignment: int = 8) -> int:
+    """Round a byte position up to the next multiple of alignment"""
+    return (position + alignment - 1) // alignment * alignment
+
+
+def table_fingerprint(cursor, table: str, key_column: str, columns: List[str]) -> Tuple[int, str]:
+    """Row count and an md5 over every exported value, computed by the database"""
+    cursor.execute(f"""
+        SELECT COUNT(*), md5(coalesce(string_agg(md5(ROW({', '.join(columns)})::text), '' ORDER BY {key_column}), ''))
+        FROM {table}
+    """)
+    row_count, fingerprint = cursor.fetchone()
+    return row_count, fingerprint
+
+
+def write_snapshot(path: str, tables: Dict[str, Dict]):
+    """
+    Write a snapshot file. tables maps a table name to
+    {'columns': [...], 'rows': [tuple, ...], 'fingerprint': str}
+    """
+    buffer = bytearray()
+    string_offsets = {}
+    sections = bytearray()
+    header_tables = {}
+    
+    for name, table in tables.items():
+        rows = table['rows']
+        columns = []
+        
+        for position, column in enumerate(table['columns']):
+            values = [row[position] for row in rows]
+            column_type = 'int' if all(isinstance(value, int) for value in values if value is not None) else 'text'
+            starts = array.array('Q')
+            lengths = array.array('I')
+            
+            for value in values:
+                if value is None:
+                    starts.append(0)
+                    lengths.append(NULL_LENGTH)
+                    continue
+                
+                encoded = str(value).encode('utf-8')
+                # Repeated strings (composers, songbook names) share one copy in the buffer
+                start = string_offsets.get(encoded)
+                if start is None:
+                    start = len(buffer)
+                    string_offsets[encoded] = start
+                    buffer.extend(encoded)
+                starts.append(start)
+                lengths.append(len(encoded))
+            
+            starts_at = _align(len(sections))
+            sections.extend(b"\0" * (starts_at - len(sections)))
+            sections.extend(starts.tobytes())
+            lengths_at = _align(len(sections))
+            sections.extend(b"\0" * (lengths_at - len(sections)))
+            sections.extend(lengths.tobytes())
+            
+            columns.append({'name': column, 'type': column_type, 'starts': starts_at, 'lengths': lengths_at})
+        
+        header_tables[name] = {'rows': len(rows), 'columns': columns, 'fingerprint': table.get('fingerprint')}
+    
+    buffer_at = _align(len(sections))
+    sections.extend(b"\0" * (buffer_at - len(sections)))
+    sections.extend(buffer)
+    
+    header = {
+        'format_version': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'tables': header_tables,
+        'buffer': {'offset': buffer_at, 'length': len(buffer)},
+        'checksum': hashlib.sha256(sections).hexdigest()
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    prefix = MAGIC + struct.pack('I', len(header_bytes)) + header_bytes
+    prefix += b"\0" * (_align(len(prefix)) - len(prefix))
+    
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'wb') as handle:
+        handle.write(prefix)
+        handle.write(sections)
+    os.replace(temporary_path, path)
+
+
+class SnapshotTable:
+    """Read-only view of one table; values are decoded from the mapped file on access"""
+    
+    def __init__(self, snapshot: "Snapshot", name: str, meta: Dict):
+        self.name = name
+        self.row_count = meta['rows']
+        self.fingerprint = meta.get('fingerprint')
+        self.column_names = [column['name'] for column in meta['columns']]
+        self._columns = {}
+        self._buffer = snapshot._buffer
+        
+        data = snapshot._data
+        for column in meta['columns']:
+            starts = data[column['starts']:column['starts'] + 8 * self.row_count].cast('Q')
+            lengths = data[column['lengths']:column['lengths'] + 4 * self.row_count].cast('I')
+            self._columns[column['name']] = (column['type'], starts, lengths)
+    
+    def __len__(self) -> int:
+        return self.row_count
+    
+    def value(self, column: str, row: int):
+        """Decode a single cell"""
+        column_type, starts, lengths = self._columns[column]
+        length = lengths[row]
+        if length == NULL_LENGTH:
+            return None
+        start = starts[row]
+        text = str(self._buffer[start:start + length], 'utf-8')
+        return int(text) if column_type == 'int' else text
+    
+    def column(self, column: str) -> List:
+        """Decode a whole column"""
+        return [self.value(column, row) for row in range(self.row_count)]
+    
+    def iter_rows(self, columns: List[str]) -> Iterator[Tuple]:
+        """Yield tuples of the requested columns, in export (key) order"""
+        for row in range(self.row_count):
+            yield tuple(self.value(column, row) for column in columns)
+
+
+class Snapshot:
+    """Memory-mapped snapshot file; opening only reads the header"""
+    
+    def __init__(self, path: str = DEFAULT_SNAPSHOT_PATH):
+        self.path = path
+        self._open()
+    
+    def _open(self):
+        with open(self.path, 'rb') as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        view = memoryview(self._mmap)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{self.path} is not a linkage snapshot")
+        
+        header_length = struct.unpack('I', view[len(MAGIC):len(MAGIC) + 4])[0]
+        header_end = len(MAGIC) + 4 + header_length
+        self.header = json.loads(bytes(view[len(MAGIC) + 4:header_end]).decode('utf-8'))
+        
+        if self.header['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {self.header['format_version']}")
+        if self.header['byteorder'] != sys.byteorder:
+            raise ValueError(f"Snapshot was written on a {self.header['byteorder']}-endian machine")
+        
+        self._data = view[_align(header_end):]
+        buffer = self.header['buffer']
+        self._buffer = self._data[buffer['offset']:buffer['offset'] + buffer['length']]
+        self.tables = {name: SnapshotTable(self, name, meta) for name, meta in self.header['tables'].items()}
+    
+    def __getstate__(self):
+        # Worker processes reopen the file instead of pickling the mapping
+        return {'path': self.path}
+    
+    def __setstate__(self, state):
+        self.path = state['path']
+        self._open()
+    
+    def table(self, name: str) -> SnapshotTable:
+        return self.tables[name]
+    
+    def verify(self) -> bool:
+        """Check the data sections against the checksum written at export (detects corruption)"""
+        return hashlib.sha256(self._data).hexdigest() == self.header['checksum']
+    
+    def stale_tables(self, cursor, compare_contents: bool = True) -> List[str]:
+        """
+        Tables whose row count (and, with compare_contents, exported values) no longer
+        match the database
+        """
+        stale = []
+        for name, key_column, columns in SNAPSHOT_TABLES:
+            table = self.tables.get(name)
+            if table is None:
+                stale.append(name)
+                continue
+            
+            if compare_contents:
+                row_count, fingerprint = table_fingerprint(cursor, name, key_column, table.column_names)
+            else:
+                cursor.execute(f"SELECT COUNT(*) FROM {name}")
+                row_count, fingerprint = cursor.fetchone()[0], table.fingerprint
+            
+            if row_count != table.row_count or fingerprint != table.fingerprint:
+                stale.append(name)
+        return stale
+
+
+def export_snapshot(path: str = DEFAULT_SNAPSHOT_PATH) -> Dict[str, int]:
+    """Export both tables from one consistent database snapshot; returns row counts"""
+    from database import get_connection, release_connection
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    tables = {}
+    
+    try:
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        
+        for name, key_column, columns in SNAPSHOT_TABLES:
+            cursor.execute(f"SELECT {', '.join(columns)} FROM {name} ORDER BY {key_column}")
+            rows = cursor.fetchall()
+            _, fingerprint = table_fingerprint(cursor, name, key_column, columns)
+            tables[name] = {'columns': columns, 'rows': rows, 'fingerprint': fingerprint}
+    finally:
+        cursor.close()
+        release_connection(conn)
+    
+    write_snapshot(path, tables)
+    return {name: len(table['rows']) for name, table in tables.items()}
+
+
+def main():
+    """Export, inspect or check a snapshot: snapshot.py [export|info|check] [path]"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Offline linkage data snapshot")
+    parser.add_argument('command', choices=['export', 'info', 'check'], nargs='?', default='export')
+    parser.add_argument('path', nargs='?', default=DEFAULT_SNAPSHOT_PATH)
+    args = parser.parse_args()
+    
+    print("🎵 Songbook Linkage System - Offline Snapshot")
+    print("=" * 60)
+    
+    if args.command == 'export':
+        from database import require_credentials
+        require_credentials()
+        
+        counts = export_snapshot(args.path)
+        print(f"✓ Exported {counts['canonical_mele']} canonical songs and "
+              f"{counts['songbook_entries']} songbook entries")
+        print(f"\n✅ Snapshot written to {args.path} ({os.path.getsize(args.path) / 1024:.0f} KiB)")
+        return
+    
+    snapshot = Snapshot(args.path)
+    print(f"Snapshot {args.path} (created {snapshot.header['created_at']})")
+    for name, table in snapshot.tables.items():
+        print(f"   {name}: {table.row_count} rows")
+    print(f"   Checksum: {'✓ valid' if snapshot.verify() else '❌ CORRUPT'}")
+    
+    if args.command == 'check':
+        from database import connection, require_credentials
+        require_credentials()
+        
+        with connection() as conn:
+            cursor = conn.cursor()
+            stale = snapshot.stale_tables(cursor)
+            cursor.close()
+        
+        if stale:
+            print(f"\n❌ Snapshot is stale for: {', '.join(stale)} (re-run snapshot.py export)")
+        else:
+            print("\n✅ Snapshot matches the database")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Seeded synthetic Hawaiian song data for tests and benchmarks
+Generates title- and composer-like strings with the spelling variation found in old
+songbooks (ʻokina and macron forms, punctuation noise, abbreviations such as "Chas."),
+plus canonical songs / songbook entries shaped like the database rows
+"""
+
+import random
+import unicodedata
+from typing import List, Dict, Tuple, Optional
+
+
+HAWAIIAN_WORDS = [
+    "Aloha", "ʻOe", "Nā", "Lei", "Hawaiʻi", "Ka", "Ke", "Makani", "Kaʻili", "Pua", "ʻAhihi",
+    "Kuʻu", "Home", "ʻĀina", "Mauna", "Kea", "Moana", "Wai", "Hula", "Mele", "Lani", "Ipo",
+    "Pāʻū", "Liliʻuokalani", "Kōkua", "Manuʻu", "Hōkū", "ʻŌpae", "Waikīkī", "Kāneʻohe"
+]
+
+COMPOSER_NAMES = [
+    "Charles E. King", "Chas E. King", "Chas. E. King", "King", "Queen Liliʻuokalani",
+    "Prince William Pitt Leleiohoku", "W. Leleiohoku", "J. Kahinu", "John Kameaaloha Almeida",
+    "Lena Machado", "Edward Kalama", "E. Kalama", "Charlie Hopkins", "Mary Kawena Pukui"
+]
+
+# Abbreviations printed in older songbooks for the first names in COMPOSER_NAMES
+NAME_ABBREVIATIONS = {
+    "Charles": ["Chas", "Chas.", "C."],
+    "William": ["Wm.", "W.", "Will"],
+    "John": ["Jno.", "J."],
+    "Edward": ["Ed.", "E."],
+    "Queen": ["Q."],
+    "Prince": ["Pr."]
+}
+
+OKINA_FORMS = ["ʻ", "’", "‘", "`", "'", "", "ʼ"]
+# Precomposed, decomposed (base letter + combining macron) and plain spellings
+MACRON_FORMS = {
+    char: [char, unicodedata.normalize("NFD", char), unicodedata.normalize("NFD", char)[0]]
+    for char in "āēīōūĀĒĪŌŪ"
+}
+NOISE = [",", ".", ":", ";", "!", "?", "-", "(", ")", "[", "]", '"', "“", "”", "&", "/",
+         " ", "  ", "\t", "\n", "\xa0", " ", "\x1c", "#", "́", "é", "ß", "İ", "ﬁ", "`"]
+
+SONGBOOK_NAMES = [
+    "Na Mele O Hawaii", "King's Book of Hawaiian Melodies", "Hawaiian Song Folio",
+    "Songs of Old Hawaii", "Ke Kani O Ka Pila", "Hula Songs Collection"
+]
+
+
+def vary_spelling(text, rng):
+    """Swap ʻokina and macron spellings the way older songbooks do"""
+    result = []
+    for char in text:
+        if char == "ʻ":
+            result.append(rng.choice(OKINA_FORMS))
+        elif char in MACRON_FORMS:
+            result.append(rng.choice(MACRON_FORMS[char]))
+        else:
+            result.append(char)
+    return "".join(result)
+
+
+def add_noise(text, rng):
+    """Sprinkle punctuation, odd whitespace and stray Unicode into a string"""
+    chars = list(text)
+    for _ in range(rng.randint(0, 4)):
+        chars.insert(rng.randint(0, len(chars)), rng.choice(NOISE))
+    text = "".join(chars)
+    return rng.choice([text, text.upper(), text.lower(), f" {text} ", f"({text})"])
+
+
+def abbreviate_name(name, rng):
+    """Abbreviate first names the way songbook credits often do ("Charles" → "Chas.")"""
+    words = name.split()
+    return " ".join(
+        rng.choice(NAME_ABBREVIATIONS[word]) if word in NAME_ABBREVIATIONS and rng.random() < 0.5 else word
+        for word in words
+    )
+
+
+def generate_corpus(size=50000, seed=1893):
+    """Seeded corpus of title-like and composer-like strings"""
+    rng = random.Random(seed)
+    corpus = [
+        "", " ", "ʻ", "a - b", "Aloha ʻOe", "Pua ʻAhihi", "Nā Lei O Hawaiʻi",
+        "Ka Makani Kaʻili Aloha", "Chas E. King", "Charles E. King", "Queen Liliʻuokalani",
+        "x,    # Right single quotation mark (U+2019)\n            y",
+        "x,ʻ    # Right single quotation mark (U+2019)\n            y",
+        "x,`    # Right single quotation mark (U+2019)\n            y",
+        "Gr`ave ` accent"
+    ]
+    
+    while len(corpus) < size:
+        if rng.random() < 0.7:
+            words = [rng.choice(HAWAIIAN_WORDS) for _ in range(rng.randint(1, 5))]
+            text = " ".join(words)
+        else:
+            text = rng.choice(COMPOSER_NAMES)
+        corpus.append(add_noise(vary_spelling(text, rng), rng))
+    
+    # Random Unicode fuzz beyond the Latin range
+    for _ in range(size // 10):
+        corpus.append("".join(chr(rng.randint(0x20, 0x2FFF)) for _ in range(rng.randint(1, 12))))
+    
+    return corpus
+
+
+def generate_linkage_data(entry_count: int, song_count: Optional[int] = None,
+                          seed: int = 1893) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Canonical songs and songbook entries in the shape MatchingEngine loads.
+    About a third of the entries are printings of a canonical song with varied spelling,
+    light noise and abbreviated composers; the rest are unrelated titles.
+    The default song count keeps the production ratio (14 songs to ~2,100 entries).
+    """
+    rng = random.Random(seed)
+    if song_count is None:
+        song_count = max(1, round(entry_count * 14 / 2100))
+    
+    def title():
+        return " ".join(rng.choice(HAWAIIAN_WORDS) for _ in range(rng.randint(1, 4)))
+    
+    canonical_songs = []
+    for number in range(song_count):
+        canonical_songs.append({
+            'canonical_mele_id': f"mele_{number:05d}",
+            'canonical_title_hawaiian': title(),
+            'canonical_title_english': title() if rng.random() < 0.4 else None,
+            'primary_composer': rng.choice(COMPOSER_NAMES) if rng.random() < 0.85 else None
+        })
+    
+    songbook_entries = []
+    for entry_id in range(1, entry_count + 1):
+        if rng.random() < 0.35:
+            song = rng.choice(canonical_songs)
+            printed_title = song['canonical_title_hawaiian']
+            composer = song['primary_composer']
+            if composer and rng.random() < 0.5:
+                composer = abbreviate_name(composer, rng)
+        else:
+            printed_title = title()
+            composer = rng.choice(COMPOSER_NAMES) if rng.random() < 0.7 else None
+        
+        printed_title = vary_spelling(printed_title, rng)
+        if rng.random() < 0.3:
+            printed_title = add_noise(printed_title, rng)
+        if composer:
+            composer = vary_spelling(composer, rng)
+        
+        songbook_entries.append({
+            'id': entry_id,
+            'printed_song_title': printed_title,
+            'composer': composer,
+            'pub_year': rng.choice([None, rng.randint(1880, 1990)]),
+            'songbook_name': rng.choice(SONGBOOK_NAMES)
+        })
+    
+    return canonical_songs, songbook_entries
@@ -0,0 +1,127 @@
+"""
+Test the asyncio matching pipeline against a local Postgres instance
+Point HUAPALA_DATABASE_URL at a scratch database prepared with setup_database.py;
+the test is skipped without it. Matches are written to a throwaway schema that is
+dropped afterwards, so the database itself is left unchanged
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+from contextlib import contextmanager
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from database import connection, close_pool
+from matching_engine import MatchingEngine
+from async_engine import AsyncMatchingEngine
+
+
+def comparable(results):
+    """Per-song (id, counts, [(entry id, confidence, method)]) for comparing runs"""
+    return [
+        (result['canonical_mele_id'], result['total_matches'], result['queued_for_review'],
+         [(match['songbook_entry_id'], match['confidence'], match['match_method']) for match in result['matches']])
+        for result in results
+    ]
+
+
+def require_scratch_database():
+    """Skip unless HUAPALA_DATABASE_URL explicitly names a scratch database"""
+    if not os.environ.get('HUAPALA_DATABASE_URL'):
+        raise unittest.SkipTest("HUAPALA_DATABASE_URL is not set; skipping database tests")
+
+
+@contextmanager
+def scratch_schema():
+    """
+    Copy the matching inputs into a throwaway schema with an empty matching_status and
+    point every new connection at it; the schema is dropped on exit
+    """
+    schema = f"linkage_test_{os.getpid()}"
+    previous_options = os.environ.get('PGOPTIONS')
+    
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE SCHEMA {schema}")
+        for table in ('canonical_mele', 'songbook_entries'):
+            cursor.execute(f"CREATE TABLE {schema}.{table} (LIKE public.{table} INCLUDING ALL)")
+            cursor.execute(f"INSERT INTO {schema}.{table} SELECT * FROM public.{table}")
+        cursor.execute(f"CREATE TABLE {schema}.matching_status (LIKE public.matching_status INCLUDING ALL)")
+        cursor.execute(f"CREATE SEQUENCE {schema}.matching_status_id_seq OWNED BY {schema}.matching_status.id")
+        cursor.execute(f"ALTER TABLE {schema}.matching_status ALTER COLUMN id SET DEFAULT nextval('{schema}.matching_status_id_seq')")
+        cursor.close()
+        conn.commit()
+    
+    try:
+        os.environ['PGOPTIONS'] = f"-c search_path={schema}"
+        close_pool()
+        yield schema
+    finally:
+        if previous_options is None:
+            os.environ.pop('PGOPTIONS', None)
+        else:
+            os.environ['PGOPTIONS'] = previous_options
+        close_pool()
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"DROP SCHEMA {schema} CASCADE")
+            cursor.close()
+            conn.commit()
+        close_pool()
+
+
+async def run_pipeline(canonical_ids, schema):
+    async with AsyncMatchingEngine(MatchingEngine(), max_pending_writes=2,
+                                   server_settings={'search_path': schema}) as matcher:
+        return await matcher.match_many(canonical_ids, auto_link_high_confidence=False)
+
+
+def test_pipeline_matches_engine():
+    """Pipelined results and saved rows must equal the synchronous bulk path"""
+    require_scratch_database()
+    with scratch_schema() as schema:
+        check_pipeline_matches_engine(schema)
+
+
+def check_pipeline_matches_engine(schema):
+    engine = MatchingEngine()
+    canonical_songs, songbook_entries = engine.load_matching_data()
+    canonical_ids = [song['canonical_mele_id'] for song in canonical_songs] + ['missing_song']
+    
+    expected = engine.score_loaded(canonical_ids, canonical_songs, songbook_entries, False)
+    results = asyncio.run(run_pipeline(canonical_ids, schema))
+    
+    expected_results, _, _ = engine.prepare_match_writes(expected, False)
+    engine.count_saved_matches(expected_results, False)
+    assert comparable(results) == comparable(expected_results), "pipeline results differ from match_many"
+    
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM matching_status
+            WHERE canonical_mele_id = ANY(%s) AND algorithm_version = %s AND match_status = 'needs_review'
+        """, (canonical_ids, engine.algorithm_version))
+        saved = cursor.fetchone()[0]
+        cursor.close()
+    assert saved == sum(result['total_matches'] for result in results), "matches missing from matching_status"
+    
+    print(f"✓ {len(results)} songs, {sum(result['total_matches'] for result in results)} matches identical to match_many")
+
+
+def main():
+    print("🎵 Songbook Linkage System - Asyncio Pipeline Test")
+    print("=" * 60)
+    
+    try:
+        test_pipeline_matches_engine()
+    except unittest.SkipTest as e:
+        print(f"⏭️  Skipped: {e}")
+        return
+    
+    print("\n✅ Asyncio pipeline tests completed!")
+
+
+if __name__ == "__main__":
+    main()
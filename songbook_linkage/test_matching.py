@@ -4,25 +4,14 @@ Simple test script to validate the songbook linkage matching approach
 
 import os
 import sys
-import psycopg2
 from difflib import SequenceMatcher
 
 # Add current directory to path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from database import get_connection, release_connection, require_credentials
 from text_normalization import normalize_title, normalize_composer
 
 
-def get_database_connection():
-    """Get database connection using existing credentials"""
-    return psycopg2.connect(
-        host='ep-young-silence-ad9wue88-pooler.c-2.us-east-1.aws.neon.tech',
-        port=5432,
-        database='neondb',
-        user='neondb_owner',
-        password=os.getenv('PGPASSWORD', '')
-    )
-
-
 def calculate_title_similarity(title1: str, title2: str) -> float:
     """Calculate similarity between two normalized titles"""
     if not title1 or not title2:
@@ -45,7 +34,7 @@ def test_matching():
     print("🎵 Songbook Linkage System - Matching Test")
     print("=" * 60)
     
-    conn = get_database_connection()
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
@@ -150,11 +139,10 @@ def test_matching():
         
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
 
 
 if __name__ == "__main__":
     # Set password if not in environment
-    if not os.getenv('PGPASSWORD'):
-        raise ValueError("PGPASSWORD environment variable is required")
+    require_credentials()
     test_matching()
\ No newline at end of file
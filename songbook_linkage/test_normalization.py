@@ -0,0 +1,52 @@
+"""
+Differential test for the fast normalization path
+Checks that the single-pass normalizer produces byte-identical output to the
+original step-by-step pipeline over a large generated corpus of Hawaiian
+titles and composer names (no database needed)
+"""
+
+import os
+import sys
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from text_normalization import HawaiianTextNormalizer
+from synthetic_corpus import generate_corpus
+
+
+def test_fast_path_matches_reference():
+    """Fast titles and composer normalization must equal the reference pipeline byte for byte"""
+    normalizer = HawaiianTextNormalizer(cache_size=0)
+    mismatches = []
+    
+    for text in generate_corpus():
+        if normalizer.normalize_text(text).encode("utf-8") != normalizer.normalize_text_reference(text).encode("utf-8"):
+            mismatches.append(("title", text))
+        if normalizer.normalize_composer_name(text).encode("utf-8") != \
+                normalizer.normalize_composer_name_reference(text).encode("utf-8"):
+            mismatches.append(("composer", text))
+    
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[:5]!r}"
+
+
+def test_normalize_many_preserves_order():
+    """Bulk normalization returns one result per input, in order"""
+    normalizer = HawaiianTextNormalizer()
+    corpus = generate_corpus(size=2000, seed=7)
+    
+    assert normalizer.normalize_many(corpus) == [normalizer.normalize_text_reference(text) for text in corpus]
+    assert normalizer.normalize_composer_many(corpus) == \
+        [normalizer.normalize_composer_name_reference(text) for text in corpus]
+
+
+if __name__ == "__main__":
+    print("🎵 Songbook Linkage System - Normalization Differential Test")
+    print("=" * 60)
+    
+    test_fast_path_matches_reference()
+    print("✓ Fast path matches the reference pipeline")
+    
+    test_normalize_many_preserves_order()
+    print("✓ normalize_many preserves order")
+    
+    print("\n✅ Normalization tests completed!")
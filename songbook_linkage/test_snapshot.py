@@ -0,0 +1,72 @@
+"""
+Test matching from an offline snapshot (no database needed)
+A synthetic corpus is written to a temporary snapshot file; parallel scoring
+read from it must equal a serial run
+"""
+
+import os
+import sys
+import tempfile
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from matching_engine import MatchingEngine
+from parallel import ParallelMatcher, _comparable
+from snapshot import Snapshot, SNAPSHOT_TABLES, write_snapshot
+from synthetic_corpus import generate_linkage_data
+
+
+def _no_database():
+    raise AssertionError("snapshot runs must not connect to the database")
+
+
+def write_synthetic_snapshot(path: str, entry_count: int = 1500, seed: int = 1893):
+    """Snapshot file holding a synthetic corpus (normalized columns left NULL)"""
+    canonical_songs, songbook_entries = generate_linkage_data(entry_count, seed=seed)
+    rows = {'canonical_mele': canonical_songs, 'songbook_entries': songbook_entries}
+    write_snapshot(path, {
+        name: {'columns': columns, 'rows': [tuple(row.get(column) for column in columns) for row in rows[name]],
+               'fingerprint': None}
+        for name, _, columns in SNAPSHOT_TABLES
+    })
+
+
+def test_parallel_snapshot_matches_serial():
+    """ParallelMatcher must load from the engine's snapshot and score exactly like a serial run"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'linkage_snapshot.bin')
+        write_synthetic_snapshot(path)
+        
+        engine = MatchingEngine(snapshot=Snapshot(path))
+        engine.get_database_connection = _no_database
+        
+        canonical_songs, songbook_entries = engine.load_matching_data()
+        canonical_ids = [song['canonical_mele_id'] for song in canonical_songs]
+        serial = _comparable(engine.score_loaded(canonical_ids, canonical_songs, songbook_entries, True))
+        
+        matcher = ParallelMatcher(engine, workers=2)
+        parallel_songs, parallel_entries = matcher.load()
+        assert parallel_songs == canonical_songs and parallel_entries == songbook_entries, \
+            "ParallelMatcher.load differs from the snapshot"
+        parallel = _comparable(matcher.score_loaded(canonical_ids, parallel_songs, parallel_entries, True))
+        assert parallel == serial, "parallel snapshot results differ from serial"
+        
+        unsaved = engine.match_all(True, save=False)
+        assert [result['total_matches'] for result in unsaved] == [len(matches) for _, matches in serial], \
+            "unsaved match_all differs from scoring"
+    
+    print(f"✓ {len(serial)} songs, {sum(len(matches) for _, matches in serial)} matches identical "
+          f"from the snapshot with 2 workers")
+
+
+def main():
+    print("🎵 Songbook Linkage System - Snapshot Test")
+    print("=" * 60)
+    
+    test_parallel_snapshot_matches_serial()
+    
+    print("\n✅ Snapshot tests completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,105 @@ Handles ʻokina, macrons, and common variations for accurate matching
 """
 
 import re
+import itertools
+import threading
 import unicodedata
+from collections import OrderedDict
+
+
+# Bump whenever normalization output changes so incremental refreshes redo every row
+NORMALIZER_VERSION = "3"
+
+# Match keys: vowels and spaces dropped from the consonant skeleton, the shortest skeleton
+# specific enough to be a key, and articles skipped when taking a title's leading word
+SKELETON_DELETIONS = str.maketrans('', '', 'aeiou \t')
+MIN_SKELETON_LENGTH = 3
+LEADING_ARTICLES = frozenset({'ka', 'ke', 'na', 'o', 'the', 'a'})
+
+# Most word-swap spellings persisted per title in title_variants
+MAX_TITLE_VARIANTS = 32
+
+
+class CombiningMarkTable(dict):
+    """str.translate table that deletes combining marks (category Mn), filled in lazily per code point"""
+    
+    def __missing__(self, codepoint):
+        value = None if unicodedata.category(chr(codepoint)) == 'Mn' else codepoint
+        self[codepoint] = value
+        return value
+
+
+class LRUCache:
+    """Size-bounded least-recently-used cache with hit/miss/eviction counters"""
+    
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        """Return a cached value (marking it recently used) or default"""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries beyond maxsize"""
+        if self.maxsize <= 0:
+            return
+        
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._evict()
+    
+    def resize(self, maxsize):
+        """Change the size bound, evicting immediately if the cache shrinks"""
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+    
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+    
+    def _evict(self):
+        while len(self._data) > max(self.maxsize, 0):
+            self._data.popitem(last=False)
+            self.evictions += 1
+    
+    def info(self):
+        """Counters and current size"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+            'maxsize': self.maxsize
+        }
 
 
 class HawaiianTextNormalizer:
     """Normalize Hawaiian text for consistent matching"""
     
-    def __init__(self):
+    # Normalization kinds that are memoized, one bounded cache each
+    CACHE_KINDS = ('text', 'composer', 'variants')
+    
+    def __init__(self, cache_size=4096):
+        # Real songbook data repeats the same titles and composers across many books
+        self.caches = {kind: LRUCache(cache_size) for kind in self.CACHE_KINDS}
+        
         # Diacritic mappings
         self.diacritic_map = {
             'ā': 'a', 'ē': 'e', 'ī': 'i', 'ō': 'o', 'ū': 'u',
@@ -51,6 +143,33 @@ class HawaiianTextNormalizer:
             'john': ['j.'],
             'king': ['chas e. king', 'charles e. king', 'c. e. king']
         }
+        
+        self._compile_fast_path()
+    
+    def _compile_fast_path(self):
+        """
+        Precompute tables and patterns for the single-pass normalizer.
+        The fast path must stay byte-identical to normalize_text_reference.
+        """
+        self._combining_mark_table = CombiningMarkTable()
+        self._okina_removals = [variant for variant in self.okina_variants if variant]
+        
+        # Deleting single characters commutes, so the leading one-character ʻokina
+        # variants can go together with the combining marks of the mapped diacritics
+        self._leading_deletions = []
+        for variant in self._okina_removals:
+            if len(variant) != 1:
+                break
+            self._leading_deletions.append(variant)
+        self._okina_removals_after_marks = self._okina_removals[len(self._leading_deletions):]
+        
+        for accented in self.diacritic_map:
+            for mark in unicodedata.normalize('NFD', accented)[1:]:
+                if mark not in self._leading_deletions:
+                    self._leading_deletions.append(mark)
+        
+        self._punctuation_pattern = re.compile(r'[,.:;!?\-\(\)\[\]\""]')
+        self._composer_expansions = {word: variations[0] for word, variations in self.composer_variations.items()}
     
     def normalize_diacritics(self, text):
         """Remove Hawaiian diacritics for matching"""
@@ -98,11 +217,55 @@ class HawaiianTextNormalizer:
         """Convert to lowercase for matching"""
         return text.lower() if text else ""
     
+    def _memoized(self, kind, key, compute):
+        """Look a value up in the cache for this normalization kind, computing it on a miss"""
+        cache = self.caches[kind]
+        if cache.maxsize <= 0:
+            return compute(key)
+        
+        value = cache.get(key)
+        if value is None:
+            value = compute(key)
+            cache.put(key, value)
+        return value
+    
     def normalize_text(self, text):
         """Apply full normalization pipeline"""
         if not text:
             return ""
         
+        return self._memoized('text', text, self._normalize_text_fast)
+    
+    def _normalize_text_fast(self, text):
+        """Few-pass equivalent of normalize_text_reference using precomputed tables"""
+        okina_removals = self._okina_removals
+        
+        # Mapped diacritics decompose to a base letter plus a combining mark, so NFD
+        # and mark removal cover them; pure ASCII text has nothing to decompose
+        if not text.isascii():
+            text = unicodedata.normalize('NFD', text)
+            for char in self._leading_deletions:
+                if char in text:
+                    text = text.replace(char, '')
+            if not text.isascii():
+                text = text.translate(self._combining_mark_table)
+            okina_removals = self._okina_removals_after_marks
+        
+        # Remaining ʻokina variants, in their original order
+        for variant in okina_removals:
+            if variant in text:
+                text = text.replace(variant, '')
+        
+        # Collapse whitespace, then drop punctuation (which may leave double spaces, as before)
+        text = self._punctuation_pattern.sub('', ' '.join(text.split()))
+        
+        return text.strip().lower()
+    
+    def normalize_text_reference(self, text):
+        """Original step-by-step normalization pipeline, kept as the reference for the fast path"""
+        if not text:
+            return ""
+        
         # Apply all normalizations
         text = self.normalize_diacritics(text)
         text = self.normalize_okina(text)
@@ -116,8 +279,21 @@ class HawaiianTextNormalizer:
         if not name:
             return ""
         
+        return self._memoized('composer', name, self._normalize_composer_name_uncached)
+    
+    def _normalize_composer_name_uncached(self, name):
+        """Composer normalization without the cache"""
+        # Handle common abbreviations and variations, using the first (most common) variation
+        expansions = self._composer_expansions
+        return ' '.join(expansions.get(word, word) for word in self.normalize_text(name).split())
+    
+    def normalize_composer_name_reference(self, name):
+        """Original composer normalization, kept as the reference for the fast path"""
+        if not name:
+            return ""
+        
         # Basic normalization
-        normalized = self.normalize_text(name)
+        normalized = self.normalize_text_reference(name)
         
         # Handle common abbreviations and variations
         words = normalized.split()
@@ -137,6 +313,10 @@ class HawaiianTextNormalizer:
         if not text:
             return []
         
+        return list(self._memoized('variants', text, self._get_search_variants_uncached))
+    
+    def _get_search_variants_uncached(self, text):
+        """Search variant generation without the cache (a tuple, so cached values stay immutable)"""
         variants = set()
         
         # Original text
@@ -156,7 +336,56 @@ class HawaiianTextNormalizer:
         variants.add(self.normalize_text(no_diacritics))
         
         # Remove empty strings and duplicates
-        return [v for v in variants if v]
+        return tuple(v for v in variants if v)
+    
+    def get_variant_keys(self, text):
+        """
+        Persisted counterpart of get_search_variants (see title_variants): the normalized text,
+        its common word swaps (ke/ka, o/of, me/and/with) and each of those without spaces.
+        A query matches when its normalized or compacted form equals one of these keys.
+        """
+        words = self.normalize_text(text).split()
+        if not words:
+            return []
+        
+        options = [[word] + self.word_variations.get(word, []) for word in words]
+        spellings = [' '.join(swapped) for swapped in itertools.islice(itertools.product(*options), MAX_TITLE_VARIANTS)]
+        keys = dict.fromkeys(spellings)
+        keys.update(dict.fromkeys(spelling.replace(' ', '') for spelling in spellings))
+        return list(keys)
+    
+    def get_lookup_keys(self, query):
+        """Keys a user query is looked up by: its normalized words, space-separated and run together"""
+        words = self.normalize_text(query).split()
+        if not words:
+            return []
+        return list(dict.fromkeys([' '.join(words), ''.join(words)]))
+    
+    def normalize_many(self, texts):
+        """Normalize an iterable of texts, returning a list in the same order"""
+        normalize = self.normalize_text
+        return [normalize(text) for text in texts]
+    
+    def normalize_composer_many(self, names):
+        """Normalize an iterable of composer names, returning a list in the same order"""
+        normalize = self.normalize_composer_name
+        return [normalize(name) for name in names]
+    
+    def cache_info(self):
+        """Hit/miss/eviction counters and sizes for each normalization kind"""
+        return {kind: cache.info() for kind, cache in self.caches.items()}
+    
+    def clear_cache(self, kind=None):
+        """Clear one normalization cache, or all of them"""
+        for cache_kind, cache in self.caches.items():
+            if kind is None or cache_kind == kind:
+                cache.clear()
+    
+    def resize_cache(self, maxsize, kind=None):
+        """Change the size bound of one normalization cache, or all of them (0 disables caching)"""
+        for cache_kind, cache in self.caches.items():
+            if kind is None or cache_kind == kind:
+                cache.resize(maxsize)
 
 
 # Global normalizer instance
@@ -173,11 +402,60 @@ def normalize_composer(composer):
     return normalizer.normalize_composer_name(composer)
 
 
+def stored_or_normalized(record, normalized_key, raw_key, normalize):
+    """Use a record's stored normalized column when present, otherwise normalize its raw text"""
+    normalized = record.get(normalized_key)
+    if normalized is None:
+        normalized = normalize(record.get(raw_key) or '')
+    return normalized
+
+
+def normalize_titles(titles):
+    """Convenience function for bulk title normalization"""
+    return normalizer.normalize_many(titles)
+
+
+def normalize_composers(composers):
+    """Convenience function for bulk composer normalization"""
+    return normalizer.normalize_composer_many(composers)
+
+
+def title_match_keys(title):
+    """
+    Deterministic exact-match keys for a title: (sorted distinct tokens, consonant skeleton,
+    leading word), each None when the title is empty or the skeleton is too short to be specific
+    """
+    words = normalize_title(title).split()
+    if not words:
+        return None, None, None
+    
+    skeleton = ''.join(words).translate(SKELETON_DELETIONS)
+    leading = next((word for word in words if word not in LEADING_ARTICLES), words[0])
+    return (' '.join(sorted(set(words))),
+            skeleton if len(skeleton) >= MIN_SKELETON_LENGTH else None,
+            leading)
+
+
+def title_variant_keys(title):
+    """Convenience function for the title_variants keys of a title"""
+    return normalizer.get_variant_keys(title)
+
+
+def title_lookup_keys(query):
+    """Convenience function for the title_variants keys a query is looked up by"""
+    return normalizer.get_lookup_keys(query)
+
+
 def get_title_variants(title):
     """Convenience function to get title search variants"""
     return normalizer.get_search_variants(title)
 
 
+def normalization_cache_info():
+    """Cache counters of the shared normalizer used by the convenience functions"""
+    return normalizer.cache_info()
+
+
 if __name__ == "__main__":
     # Test the normalization
     test_cases = [
@@ -0,0 +1,82 @@
+"""
+Songbook Linkage System - Title Lookup
+Resolves a raw title query against the title_variants table filled by
+populate_normalized_data.py: one normalization of the query, one indexed lookup
+"""
+
+import os
+import sys
+import argparse
+from typing import List, Dict
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import connection, require_credentials
+from text_normalization import title_lookup_keys
+
+
+LOOKUP_SQL = """
+    SELECT DISTINCT canonical_mele_id, songbook_entry_id
+    FROM title_variants
+    WHERE variant_key = ANY(%s)
+"""
+
+
+def lookup_title(query: str, cursor=None) -> Dict[str, List]:
+    """
+    Canonical songs and songbook entries whose title has a variant equal to the query
+    (ʻokina, diacritics, case, punctuation, spacing and ke/ka-style word swaps ignored).
+    Returns {'canonical_mele_ids': [...], 'songbook_entry_ids': [...]}, each sorted.
+    """
+    matches = {'canonical_mele_ids': [], 'songbook_entry_ids': []}
+    keys = title_lookup_keys(query)
+    if not keys:
+        return matches
+    
+    if cursor is None:
+        with connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(LOOKUP_SQL, (keys,))
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+    else:
+        cursor.execute(LOOKUP_SQL, (keys,))
+        rows = cursor.fetchall()
+    
+    for canonical_mele_id, songbook_entry_id in rows:
+        if canonical_mele_id is not None:
+            matches['canonical_mele_ids'].append(canonical_mele_id)
+        else:
+            matches['songbook_entry_ids'].append(songbook_entry_id)
+    
+    matches['canonical_mele_ids'].sort()
+    matches['songbook_entry_ids'].sort()
+    return matches
+
+
+def main():
+    """Look up one or more titles from the command line"""
+    parser = argparse.ArgumentParser(description="Find songs and songbook entries by title")
+    parser.add_argument('queries', nargs='+', help="titles to look up")
+    args = parser.parse_args()
+    
+    print("🎵 Songbook Linkage System - Title Lookup")
+    print("=" * 60)
+    
+    require_credentials()
+    
+    for query in args.queries:
+        matches = lookup_title(query)
+        entry_ids = matches['songbook_entry_ids']
+        print(f"🔍 {query}")
+        print(f"   Canonical songs: {', '.join(matches['canonical_mele_ids']) or '-'}")
+        print(f"   Songbook entries: {len(entry_ids)} {entry_ids[:10]}{' ...' if len(entry_ids) > 10 else ''}")
+    
+    print("\n✅ Lookup completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+Songbook Linkage System - Vectorized Batch Similarity Scoring
+Scores one canonical song against many songbook entries at once using
+character n-gram count vectors and cosine similarity (NumPy)
+"""
+
+import os
+import sys
+import json
+from collections import Counter
+from typing import List, Dict, Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, only needed for the cosine algorithm
+    np = None
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from text_normalization import normalize_title, normalize_composer, stored_or_normalized
+
+
+DEFAULT_CALIBRATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cosine_calibration.json')
+
+
+def require_numpy():
+    """Raise a helpful error when NumPy is not installed"""
+    if np is None:
+        raise ImportError("The n-gram cosine scorer requires NumPy: pip install numpy")
+
+
+def ngram_counts(text: str, n: int = 3) -> Counter:
+    """Character n-gram counts of a normalized string, padded so short words still produce grams"""
+    if not text:
+        return Counter()
+    
+    padded = f" {text} "
+    if len(padded) <= n:
+        return Counter([padded])
+    
+    return Counter(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+class SparseNGramMatrix:
+    """
+    Row-normalized sparse n-gram count matrix in coordinate form.
+    Grams inside a row are stored in sorted order so a row's cosine sum is
+    accumulated in the same order whatever else is in the matrix.
+    """
+    
+    def __init__(self, texts: List[str], n: int = 3):
+        require_numpy()
+        self.n = n
+        self.row_count = len(texts)
+        self.vocabulary = {}
+        
+        rows, columns, counts = [], [], []
+        for row, text in enumerate(texts):
+            grams = ngram_counts(text, n)
+            for gram in sorted(grams):
+                columns.append(self.vocabulary.setdefault(gram, len(self.vocabulary)))
+                rows.append(row)
+                counts.append(grams[gram])
+        
+        self.rows = np.array(rows, dtype=np.int64)
+        self.columns = np.array(columns, dtype=np.int64)
+        counts = np.array(counts, dtype=np.float64)
+        
+        norms = np.sqrt(np.bincount(self.rows, weights=counts * counts, minlength=self.row_count))
+        self.values = counts / norms[self.rows] if len(counts) else counts
+    
+    def cosine(self, text: str) -> "np.ndarray":
+        """Cosine similarity (0-1) between one normalized string and every row"""
+        grams = ngram_counts(text, self.n)
+        if not grams or not len(self.rows):
+            return np.zeros(self.row_count)
+        
+        norm = sum(grams[gram] * grams[gram] for gram in sorted(grams)) ** 0.5
+        query = np.zeros(len(self.vocabulary))
+        for gram, count in grams.items():
+            column = self.vocabulary.get(gram)
+            if column is not None:
+                query[column] = count / norm
+        
+        similarity = np.bincount(self.rows, weights=query[self.columns] * self.values, minlength=self.row_count)
+        return np.minimum(similarity, 1.0)
+
+
+class CosineCalibration:
+    """
+    Piecewise-linear mapping from raw cosine similarity (0-1) onto the
+    SequenceMatcher 0-100 scale, with separate curves for titles and composers
+    """
+    
+    def __init__(self, curves: Optional[Dict] = None):
+        self.curves = {
+            'title': ([0.0, 1.0], [0.0, 100.0]),
+            'composer': ([0.0, 1.0], [0.0, 100.0])
+        }
+        if curves:
+            self.curves.update({field: (list(x), list(y)) for field, (x, y) in curves.items()})
+    
+    def apply(self, field: str, cosine):
+        """Map raw cosine similarities for a field onto the 0-100 scale"""
+        require_numpy()
+        cosine_knots, score_knots = self.curves[field]
+        return np.interp(cosine, cosine_knots, score_knots)
+    
+    @staticmethod
+    def fit_curve(cosine_scores, sequence_scores, points: int = 21):
+        """Quantile-match raw cosine scores to SequenceMatcher scores (0-100)"""
+        require_numpy()
+        quantiles = np.linspace(0.0, 1.0, points)
+        cosine_knots = np.concatenate(([0.0], np.quantile(cosine_scores, quantiles), [1.0]))
+        score_knots = np.concatenate(([0.0], np.quantile(sequence_scores, quantiles), [100.0]))
+        score_knots = np.maximum.accumulate(score_knots)
+        
+        # np.interp needs increasing x values; keep the highest score for repeated knots
+        x, y = [], []
+        for cosine, score in zip(cosine_knots, score_knots):
+            if x and cosine <= x[-1]:
+                if x[-1] > 0.0:  # cosine 0 (no shared grams) always maps to 0
+                    y[-1] = max(y[-1], float(score))
+            else:
+                x.append(float(cosine))
+                y.append(float(score))
+        
+        return x, y
+    
+    def save(self, path: str = DEFAULT_CALIBRATION_PATH):
+        """Write the calibration curves to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump({field: {'cosine': x, 'score': y} for field, (x, y) in self.curves.items()}, f, indent=2)
+    
+    @classmethod
+    def load(cls, path: str = DEFAULT_CALIBRATION_PATH) -> "CosineCalibration":
+        """Load calibration curves, falling back to the identity mapping if the file is missing"""
+        if not os.path.exists(path):
+            return cls()
+        
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return cls({field: (curve['cosine'], curve['score']) for field, curve in data.items()})
+
+
+class BatchSimilarityScorer:
+    """Scores a canonical song against an array of songbook entries in one call"""
+    
+    def __init__(self, songbook_entries: List[Dict], calibration: Optional[CosineCalibration] = None, n: int = 3):
+        require_numpy()
+        self.calibration = calibration or CosineCalibration()
+        self.entries = list(songbook_entries)
+        self.positions_by_id = {entry['id']: position for position, entry in enumerate(self.entries)}
+        
+        titles = [entry.get('printed_song_title') or '' for entry in self.entries]
+        composers = [entry.get('composer') or '' for entry in self.entries]
+        
+        self.normalized_titles = np.array([
+            stored_or_normalized(entry, 'normalized_printed_title', 'printed_song_title', normalize_title)
+            for entry in self.entries
+        ], dtype=object)
+        self.normalized_composers = np.array([
+            stored_or_normalized(entry, 'normalized_composer', 'composer', normalize_composer)
+            for entry in self.entries
+        ], dtype=object)
+        self.has_title = np.array([bool(title) for title in titles])
+        self.has_composer = np.array([bool(composer) for composer in composers])
+        
+        self.title_matrix = SparseNGramMatrix(list(self.normalized_titles), n)
+        self.composer_matrix = SparseNGramMatrix(list(self.normalized_composers), n)
+    
+    def _field_similarity(self, field: str, canonical_song: Dict, normalized_key: str, raw_key: str,
+                          normalize, matrix, normalized, present, raw: bool):
+        """Similarity of one canonical field against every entry, mirroring the SequenceMatcher rules"""
+        if not canonical_song.get(raw_key, ''):
+            return np.zeros(len(self.entries))
+        
+        query = stored_or_normalized(canonical_song, normalized_key, raw_key, normalize)
+        cosine = matrix.cosine(query)
+        similarity = cosine * 100 if raw else self.calibration.apply(field, cosine)
+        similarity = np.where(normalized == query, 100.0, similarity)  # Exact match
+        return np.where(present, similarity, 0.0)
+    
+    def similarities(self, canonical_song: Dict, songbook_entries: Optional[List[Dict]] = None,
+                     raw: bool = False) -> Dict[str, "np.ndarray"]:
+        """
+        Hawaiian title, English title and composer similarity (0-100) for every entry,
+        or only for the given entries (in their order). raw=True skips calibration.
+        """
+        hawaiian = self._field_similarity('title', canonical_song,
+                                          'normalized_title_hawaiian', 'canonical_title_hawaiian',
+                                          normalize_title, self.title_matrix,
+                                          self.normalized_titles, self.has_title, raw)
+        english = self._field_similarity('title', canonical_song,
+                                         'normalized_title_english', 'canonical_title_english',
+                                         normalize_title, self.title_matrix,
+                                         self.normalized_titles, self.has_title, raw)
+        composer = self._field_similarity('composer', canonical_song,
+                                          'normalized_composer', 'primary_composer',
+                                          normalize_composer, self.composer_matrix,
+                                          self.normalized_composers, self.has_composer, raw)
+        
+        if songbook_entries is not None:
+            positions = np.array([self.positions_by_id[entry['id']] for entry in songbook_entries], dtype=np.int64)
+            hawaiian, english, composer = hawaiian[positions], english[positions], composer[positions]
+        
+        return {
+            'title_hawaiian_similarity': hawaiian,
+            'title_english_similarity': english,
+            'composer_similarity': composer
+        }
+
+
+def calibration_report(canonical_songs: List[Dict], songbook_entries: List[Dict],
+                       points: int = 21) -> Dict:
+    """
+    Fit cosine-to-SequenceMatcher calibration curves from every canonical/entry pair
+    and report how well the calibrated scores reproduce v1.0 tiers
+    """
+    from matching_engine import MatchingEngine
+    
+    sequence_engine = MatchingEngine(algorithm_version='v1.0')
+    scorer = BatchSimilarityScorer(songbook_entries)
+    
+    title_cosine, title_sequence = [], []
+    composer_cosine, composer_sequence = [], []
+    sequence_totals, raw_components = [], []
+    
+    for canonical_song in canonical_songs:
+        raw_scores = scorer.similarities(canonical_song, raw=True)
+        
+        for position, songbook_entry in enumerate(scorer.entries):
+            total, _, details = sequence_engine.calculate_confidence_score(canonical_song, songbook_entry)
+            sequence_totals.append(total)
+            raw_components.append((
+                raw_scores['title_hawaiian_similarity'][position],
+                raw_scores['title_english_similarity'][position],
+                raw_scores['composer_similarity'][position],
+                songbook_entry
+            ))
+            
+            for field in ('title_hawaiian_similarity', 'title_english_similarity'):
+                if 0 < details[field] < 100:
+                    title_cosine.append(raw_scores[field][position] / 100)
+                    title_sequence.append(details[field])
+            if 0 < details['composer_similarity'] < 100:
+                composer_cosine.append(raw_scores['composer_similarity'][position] / 100)
+                composer_sequence.append(details['composer_similarity'])
+    
+    curves = {}
+    if title_cosine:
+        curves['title'] = CosineCalibration.fit_curve(title_cosine, title_sequence, points)
+    if composer_cosine:
+        curves['composer'] = CosineCalibration.fit_curve(composer_cosine, composer_sequence, points)
+    calibration = CosineCalibration(curves)
+    
+    def calibrated(field, raw_score):
+        return 100.0 if raw_score == 100.0 else float(calibration.apply(field, raw_score / 100))
+    
+    tiers = ('high', 'medium', 'low')
+    confusion = {expected: {actual: 0 for actual in tiers} for expected in tiers}
+    minimum_kept = minimum_expected = 0
+    absolute_error = 0.0
+    
+    for sequence_total, (hawaiian, english, composer, songbook_entry) in zip(sequence_totals, raw_components):
+        cosine_total, _, _ = sequence_engine.combine_similarities(
+            calibrated('title', hawaiian), calibrated('title', english),
+            calibrated('composer', composer), songbook_entry
+        )
+        expected_tier = sequence_engine.get_confidence_tier(sequence_total)
+        actual_tier = sequence_engine.get_confidence_tier(cosine_total)
+        confusion[expected_tier][actual_tier] += 1
+        absolute_error += abs(cosine_total - sequence_total)
+        
+        if sequence_total >= 20:
+            minimum_expected += 1
+            if cosine_total >= 20:
+                minimum_kept += 1
+    
+    pairs = len(sequence_totals)
+    agreement = sum(confusion[tier][tier] for tier in tiers)
+    
+    return {
+        'calibration': calibration,
+        'pairs': pairs,
+        'title_pairs_fitted': len(title_cosine),
+        'composer_pairs_fitted': len(composer_cosine),
+        'mean_absolute_error': absolute_error / pairs if pairs else 0.0,
+        'tier_agreement': agreement / pairs if pairs else 1.0,
+        'tier_confusion': confusion,
+        'minimum_threshold_recall': minimum_kept / minimum_expected if minimum_expected else 1.0
+    }
+
+
+def main():
+    """Fit calibration curves against the live database and save them next to this module"""
+    from database import require_credentials
+    from matching_engine import MatchingEngine
+    
+    print("🎵 Songbook Linkage System - Cosine Scorer Calibration")
+    print("=" * 60)
+    
+    require_credentials()
+    
+    engine = MatchingEngine()
+    conn = engine.get_database_connection()
+    cursor = conn.cursor()
+    
+    try:
+        canonical_songs = engine.fetch_canonical_songs(cursor)
+        songbook_entries = engine.fetch_unlinked_entries(cursor)
+    finally:
+        cursor.close()
+        engine.release_database_connection(conn)
+    
+    report = calibration_report(canonical_songs, songbook_entries)
+    report['calibration'].save()
+    
+    print(f"Pairs compared: {report['pairs']}")
+    print(f"   Title pairs fitted: {report['title_pairs_fitted']}")
+    print(f"   Composer pairs fitted: {report['composer_pairs_fitted']}")
+    print(f"   Mean absolute error vs v1.0: {report['mean_absolute_error']:.2f} points")
+    print(f"   Tier agreement vs v1.0: {report['tier_agreement']:.1%}")
+    print(f"   Matches >= 20 kept: {report['minimum_threshold_recall']:.1%}")
+    print("   Tier confusion (v1.0 → cosine):")
+    for expected, row in report['tier_confusion'].items():
+        print(f"      {expected:>6}: " + ", ".join(f"{actual} {count}" for actual, count in row.items()))
+    print(f"\n✅ Calibration saved to {DEFAULT_CALIBRATION_PATH}")
+
+
+if __name__ == "__main__":
+    main()
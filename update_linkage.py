@@ -5,19 +5,32 @@ Simple script to update songbook entry linkages
 
 import sys
 import json
-import psycopg2
 import os
+import argparse
+
+from psycopg2.extras import execute_values
+
+try:
+    import ijson
+except ImportError:  # optional, faster incremental parsing of large linkage files
+    ijson = None
+
+# Shared connection pool lives with the linkage scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'songbook_linkage'))
+from database import get_connection, release_connection, set_default_connection
+
+# Approved linkages applied per UPDATE statement in batch mode
+BATCH_CHUNK_SIZE = 1000
+
+# Writes go to the local huapala database unless a DSN or PG* variables say otherwise
+LOCAL_CONNECTION = {'host': 'localhost', 'dbname': 'huapala', 'user': 'keola'}
 
 def update_songbook_linkage(songbook_entry_id, canonical_mele_id):
     """Update the songbook entry with the canonical mele ID"""
+    conn = None
     try:
         # Connect to database
-        conn = psycopg2.connect(
-            host='localhost',
-            user='keola',
-            database='huapala',
-            password=os.getenv('PGPASSWORD', '')
-        )
+        conn = get_connection()
         
         cur = conn.cursor()
         
@@ -40,40 +53,214 @@ def update_songbook_linkage(songbook_entry_id, canonical_mele_id):
         print(f"❌ Database error: {e}")
         return False
     finally:
-        if 'conn' in locals():
-            conn.close()
+        if conn is not None:
+            release_connection(conn)
+
+def iter_json_array(handle, read_size=65536):
+    """Yield the items of a top-level JSON array without loading the whole file"""
+    if ijson is not None:
+        yield from ijson.items(handle, 'item', use_float=True)
+        return
+    
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    read_more = False
+    # 'open' before the [, then 'first' / 'item' where a value is due, 'separator' after one,
+    # 'closed' after the ] (only whitespace may follow)
+    state = 'open'
+    
+    while True:
+        if read_more:
+            chunk = handle.read(read_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            read_more = False
+        
+        while position < len(buffer) and buffer[position] in ' \t\r\n':
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                if state == 'closed':
+                    return
+                raise ValueError("Linkages file ended before the closing ]")
+            read_more = True
+            continue
+        
+        char = buffer[position]
+        if state == 'closed':
+            raise ValueError(f"Unexpected {char!r} after the closing ] of the linkages array")
+        if state == 'open':
+            if char != '[':
+                raise ValueError("Linkages file must contain a JSON array")
+            state = 'first'
+            position += 1
+            continue
+        if char == ']' and state in ('first', 'separator'):
+            state = 'closed'
+            position += 1
+            continue
+        if state == 'separator':
+            if char != ',':
+                raise ValueError(f"Expected , or ] after a linkage, found {char!r}")
+            state = 'item'
+            position += 1
+            continue
+        
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The item is cut off at the end of the buffer: read more and retry
+            read_more = True
+            continue
+        following = end
+        while following < len(buffer) and buffer[following] in ' \t\r\n':
+            following += 1
+        if not eof and (following == len(buffer) or buffer[following] not in ',]'):
+            # Only trust the value once its , or ] is in view: a number cut off by the read may continue
+            read_more = True
+            continue
+        
+        yield item
+        position = end
+        state = 'separator'
+
+def read_approved_linkages(linkages_file):
+    """
+    The approved canonical_mele_id for each songbook entry, and the number of approved rows.
+    As with one UPDATE per row, the last approval in the file decides an entry's link.
+    """
+    latest = {}
+    approved = 0
+    with open(linkages_file, 'r') as f:
+        for linkage in iter_json_array(f):
+            if linkage.get('match_status') != 'approved':
+                continue
+            approved += 1
+            latest[int(linkage['songbook_entry_id'])] = linkage['canonical_mele_id']
+    return latest, approved
+
+def apply_linkage_chunk(cur, pairs):
+    """
+    Link one chunk of (songbook_entry_id, canonical_mele_id) pairs, one per entry (see
+    read_approved_linkages), and confirm their matching_status rows; returns the entry ids updated
+    """
+    latest = list(dict(pairs).items())
+    linked = execute_values(cur, """
+        UPDATE songbook_entries AS s
+        SET canonical_mele_id = v.canonical_mele_id
+        FROM (VALUES %s) AS v(songbook_entry_id, canonical_mele_id)
+        WHERE s.id = v.songbook_entry_id
+        RETURNING s.id
+    """, latest, page_size=len(latest), fetch=True)
+    
+    execute_values(cur, """
+        UPDATE matching_status AS m
+        SET match_status = 'confirmed', reviewed_at = NOW()
+        FROM (VALUES %s) AS v(songbook_entry_id, canonical_mele_id)
+        WHERE m.songbook_entry_id = v.songbook_entry_id AND m.canonical_mele_id = v.canonical_mele_id
+    """, latest, page_size=len(latest))
+    
+    return {row[0] for row in linked}
+
+def find_missing(cur, pairs):
+    """Entry ids and canonical ids in a chunk that do not exist in the database"""
+    entry_ids = list(dict.fromkeys(songbook_entry_id for songbook_entry_id, _ in pairs))
+    canonical_ids = list({canonical_mele_id for _, canonical_mele_id in pairs})
+    
+    cur.execute("SELECT id FROM songbook_entries WHERE id = ANY(%s)", (entry_ids,))
+    found_entries = {row[0] for row in cur.fetchall()}
+    cur.execute("SELECT canonical_mele_id FROM canonical_mele WHERE canonical_mele_id = ANY(%s)", (canonical_ids,))
+    found_songs = {row[0] for row in cur.fetchall()}
+    
+    return ([entry_id for entry_id in entry_ids if entry_id not in found_entries],
+            sorted(set(canonical_ids) - found_songs))
 
-def process_approved_linkages(linkages_file):
-    """Process a JSON file of approved linkages"""
+def process_approved_linkages_batch(linkages_file, dry_run=False, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Apply every approved linkage in a JSON file in one transaction, chunk by chunk,
+    confirming the matching matching_status rows (only the last approval per entry counts). With dry_run nothing is written and
+    missing entry / song ids are reported instead.
+    """
+    conn = None
+    linked = 0
+    missing_entries = []
+    missing_songs = set()
+    
     try:
-        with open(linkages_file, 'r') as f:
-            linkages = json.load(f)
+        # Deduplicated over the whole file first, so a later approval for an entry in another
+        # chunk cannot leave the superseded pair confirmed
+        latest, approved = read_approved_linkages(linkages_file)
+        all_pairs = list(latest.items())
         
-        approved_count = 0
-        for linkage in linkages:
-            if linkage.get('match_status') == 'approved':
-                success = update_songbook_linkage(
-                    linkage['songbook_entry_id'],
-                    linkage['canonical_mele_id']
-                )
-                if success:
-                    approved_count += 1
+        conn = get_connection()
+        cur = conn.cursor()
         
-        print(f"\n📊 Processed {approved_count} approved linkages")
+        for start in range(0, len(all_pairs), chunk_size):
+            pairs = all_pairs[start:start + chunk_size]
+            if dry_run:
+                entries, songs = find_missing(cur, pairs)
+                linked += len(pairs) - len(entries)
+                missing_entries.extend(entries)
+                missing_songs.update(songs)
+            else:
+                updated = apply_linkage_chunk(cur, pairs)
+                linked += len(updated)
+                missing_entries.extend(entry_id for entry_id, _ in pairs if entry_id not in updated)
+        
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
         
     except Exception as e:
-        print(f"❌ Error processing linkages file: {e}")
+        if conn is not None:
+            conn.rollback()
+        print(f"❌ Error processing linkages file (nothing was changed): {e}")
+        return None
+    finally:
+        if conn is not None:
+            release_connection(conn)
+    
+    if missing_entries:
+        shown = ', '.join(str(entry_id) for entry_id in missing_entries[:20])
+        more = f" and {len(missing_entries) - 20} more" if len(missing_entries) > 20 else ""
+        print(f"❌ No songbook entry found with ID {shown}{more}")
+    if missing_songs:
+        print(f"❌ Unknown canonical_mele_id {', '.join(sorted(missing_songs))}")
+    
+    if dry_run:
+        print(f"\n📊 Dry run: {approved} approved linkages, {linked} songbook entries would be linked")
+    else:
+        print(f"\n📊 Linked {linked} songbook entries from {approved} approved linkages in one transaction")
+    
+    return {'approved': approved, 'linked': linked, 'missing_entries': missing_entries,
+            'missing_songs': sorted(missing_songs)}
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage:")
-        print("  python3 update_linkage.py <songbook_entry_id> <canonical_mele_id>")
-        print("  python3 update_linkage.py --file <linkages.json>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Update songbook entry linkages",
+        usage="python3 update_linkage.py <songbook_entry_id> <canonical_mele_id>\n"
+              "       python3 update_linkage.py --file <linkages.json> [--dry-run] [--chunk-size N]"
+    )
+    parser.add_argument('ids', nargs='*')
+    parser.add_argument('--file', help="JSON array of linkages; rows with match_status 'approved' are applied")
+    parser.add_argument('--dry-run', action='store_true', help="report missing ids without writing")
+    parser.add_argument('--chunk-size', type=int, default=BATCH_CHUNK_SIZE)
+    args = parser.parse_args()
+    
+    set_default_connection(**LOCAL_CONNECTION)
     
-    if sys.argv[1] == "--file":
-        process_approved_linkages(sys.argv[2])
+    if args.file and not args.ids:
+        process_approved_linkages_batch(args.file, args.dry_run, args.chunk_size)
+    elif len(args.ids) == 2 and not args.file:
+        songbook_entry_id = int(args.ids[0])
+        canonical_mele_id = args.ids[1]
+        update_songbook_linkage(songbook_entry_id, canonical_mele_id)
     else:
-        songbook_entry_id = int(sys.argv[1])
-        canonical_mele_id = sys.argv[2]
-        update_songbook_linkage(songbook_entry_id, canonical_mele_id)
\ No newline at end of file
+        parser.print_usage()
+        sys.exit(1)
\ No newline at end of file